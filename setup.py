@@ -3,12 +3,16 @@ from setuptools import setup, find_packages
 
 entry_points = {
     'console_scripts': [
+        'nti_links_benchmark = nti.links.benchmarks.suite:main',
     ],
 }
 
 TESTS_REQUIRE = [
     'fudge',
+    'gevent',
     'nti.testing',
+    'persistent',
+    'simplejson',
     'zope.dottedname',
     'zope.testrunner',
 ]
@@ -51,13 +55,13 @@ setup(
         'setuptools',
         'nti.base',
         'nti.externalization',
-        'nti.mimetype',
         'nti.ntiids',
         'nti.schema',
         'nti.traversal',
         'six',
         'zope.component',
         'zope.interface',
+        'zope.lifecycleevent',
         'zope.location',
         'zope.mimetype',
         'zope.security',
@@ -73,7 +77,10 @@ setup(
         ],
         'legacy' : [
             'nti.coremetadata'
-        ]
+        ],
+        'gevent': [
+            'gevent',
+        ],
     },
     entry_points=entry_points,
 )
@@ -8,6 +8,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
-from nti.links.externalization import render_link
-
 from nti.links.links import Link
+
+
+def render_link(link, nearest_site=None):
+    """
+    Render *link*; see :func:`nti.links.externalization.render_link`.
+
+    Making links doesn't need the machinery that renders them, so
+    (unlike :class:`~nti.links.links.Link`) that isn't imported until
+    this is first called.
+    """
+    # pylint: disable=import-outside-toplevel
+    from nti.links.externalization import render_link as _render_link
+    return _render_link(link, nearest_site)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for link rendering.
+
+These run entirely offline against a component registry configured
+the same way as the tests.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import timeit
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def configure_components():
+    """
+    Load the ZCML of the packages needed to render links into the
+    global component registry.
+    """
+    # pylint: disable=import-outside-toplevel
+    from zope.configuration import xmlconfig
+
+    import zope.location
+    import nti.externalization
+    import nti.ntiids
+    import nti.links
+
+    context = None
+    for package in (zope.location, nti.externalization, nti.ntiids, nti.links):
+        context = xmlconfig.file('configure.zcml', package=package,
+                                 context=context)
+    return context
+
+
+def best_time(func, number, repeat=5):
+    """
+    Return the best time, in seconds, of calling *func* *number* times
+    over *repeat* trials.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares rendering links one at a time with :func:`render_link`
+against rendering them as a batch with :func:`render_links`.
+
+Run with ``python -m nti.links.benchmarks.bench_batch``.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from nti.links.benchmarks import best_time
+from nti.links.benchmarks import configure_components
+
+from nti.links.externalization import render_link
+from nti.links.externalization import render_links
+
+from nti.links.links import Link
+
+logger = __import__('logging').getLogger(__name__)
+
+BATCH_SIZES = (1, 10, 100, 1000)
+
+#: Roughly how many links to render per timing, whatever the batch size.
+LINKS_PER_TRIAL = 10000
+
+
+def make_links(count):
+    return [Link('/dataserver2/users/user%d' % i, rel='edit',
+                 elements=('@@edit',), method='PUT')
+            for i in range(count)]
+
+
+def run(batch_sizes=BATCH_SIZES):
+    """
+    :return: A list of ``(batch_size, single_usec, batch_usec)`` tuples
+        giving the cost per link of each approach.
+    """
+    results = []
+    for size in batch_sizes:
+        links = make_links(size)
+        number = max(1, LINKS_PER_TRIAL // size)
+
+        def single(links=links):
+            for link in links:
+                render_link(link)
+
+        def batch(links=links):
+            render_links(links)
+
+        per_link = 1e6 / (number * size)
+        results.append((size,
+                        best_time(single, number) * per_link,
+                        best_time(batch, number) * per_link))
+    return results
+
+
+def main():
+    configure_components()
+    print('%10s %15s %15s' % ('batch', 'single us/link', 'batch us/link'))
+    for size, single, batch in run():
+        print('%10d %15.2f %15.2f' % (size, single, batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the size, and the time it takes to encode and compress, of
+a collection response with its links rendered as usual and in the
+compact form of :mod:`nti.links.compact`.
+
+Run with ``python -m nti.links.benchmarks.bench_compact``. The
+collection is shaped like a page of a forum or stream: each item
+links to itself (``edit``, ``like``, ``flag`` and ``replies``), through
+its ``/Objects/`` href, and to its creator.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import zlib
+import json
+import argparse
+
+from timeit import default_timer
+
+from nti.links.benchmarks import configure_components
+
+from nti.links.externalization import compact_link_rendering
+from nti.links.externalization import LinkExternalObjectDecorator
+
+from nti.links.links import Link
+
+logger = __import__('logging').getLogger(__name__)
+
+OID = u'tag:nextthought.com,2011-10:%s-OID-0x%x:5573657273'
+
+USERS = (u'ichigo', u'aizen', u'rukia', u'byakuya', u'kenpachi')
+
+BASE = u'/dataserver2/'
+
+
+def collection_links(items):
+    """
+    Return the links of each of *items* items in the collection.
+    """
+    result = []
+    for i in range(items):
+        user = USERS[i % len(USERS)]
+        href = u'/dataserver2/users/%s/Objects/%s' % (user, OID % (user, 0x1000 + i))
+        result.append([Link(href, rel=u'edit', method=u'PUT'),
+                       Link(href, rel=u'like', elements=(u'@@like',), method=u'POST'),
+                       Link(href, rel=u'flag', elements=(u'@@flag',), method=u'POST'),
+                       Link(href, rel=u'replies', elements=(u'@@replies',)),
+                       Link(u'/dataserver2/users/' + user, rel=u'creator')])
+    return result
+
+
+def encode(links, base=None, compact=False, dumps=json.dumps):
+    """
+    Decorate an external collection holding *links* and encode it
+    with *dumps*, with compact links if *compact*.
+
+    :return: The encoded response, as UTF-8 bytes.
+    """
+    decorator = LinkExternalObjectDecorator()
+    items = [{u'Class': u'Note', u'Links': list(item_links)} for item_links in links]
+    if not compact:
+        for item in items:
+            decorator.decorateExternalObject(None, item)
+        return dumps({u'Items': items}).encode('utf-8')
+    with compact_link_rendering(base) as table:
+        for item in items:
+            decorator.decorateExternalObject(None, item)
+    response = {u'Items': items}
+    response.update(table.external())
+    return dumps(response).encode('utf-8')
+
+
+def measure(links, repeat=5, level=6, **kwargs):
+    """
+    Encode and compress *links* (see :func:`encode`) *repeat* times.
+
+    :return: A dictionary with the size of the response (``bytes``)
+        and of it compressed (``gzip_bytes``), and the best times in
+        milliseconds to encode it (``encode_ms``) and to compress it
+        (``gzip_ms``).
+    """
+    encode_times, gzip_times = [], []
+    for _ in range(repeat):
+        start = default_timer()
+        data = encode(links, **kwargs)
+        encoded = default_timer()
+        compressed = zlib.compress(data, level)
+        encode_times.append(encoded - start)
+        gzip_times.append(default_timer() - encoded)
+    return {'bytes': len(data),
+            'gzip_bytes': len(compressed),
+            'encode_ms': min(encode_times) * 1000,
+            'gzip_ms': min(gzip_times) * 1000}
+
+
+def main(argv=None, out=None):
+    out = sys.stdout if out is None else out
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    configure_components()
+    links = collection_links(args.items)
+    print('%-16s %10s %10s %10s %10s' % ('', 'bytes', 'gzip', 'encode ms', 'gzip ms'),
+          file=out)
+    for name, kwargs in (('full', {}),
+                         ('compact', {'compact': True}),
+                         ('compact+base', {'compact': True, 'base': BASE})):
+        result = measure(links, args.repeat, **kwargs)
+        print('%-16s %10d %10d %10.2f %10.2f' % (name,
+                                                 result['bytes'],
+                                                 result['gzip_bytes'],
+                                                 result['encode_ms'],
+                                                 result['gzip_ms']),
+              file=out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the time it takes to import this package, in fresh
+interpreters, and checks it against a budget.
+
+Run with ``python -m nti.links.benchmarks.bench_import``. The exit
+status is non-zero if a module takes longer than its budget, or if
+importing :mod:`nti.links` (and making a link) loads one of the
+modules only needed to render links (:data:`RENDERING_MODULES`).
+
+On Python 3.7 and later the report also lists the modules that take
+the most time, parsed from the output of ``python -X importtime``.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import argparse
+import subprocess
+
+from collections import OrderedDict
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The modules measured, and the most milliseconds their import
+#: (including everything it imports) may take. These are generous
+#: enough for a slow machine; compare the reported times across
+#: releases to notice smaller regressions.
+BUDGETS = OrderedDict((
+    ('nti.links', 300),
+    ('nti.links.externalization', 1000),
+))
+
+#: Modules that importing :mod:`nti.links` and making a link must not
+#: load.
+RENDERING_MODULES = (
+    'nti.coremetadata',
+    'nti.externalization',
+    'nti.links.externalization',
+    'nti.ntiids',
+    'nti.traversal',
+    'zope.location',
+    'zope.traversing',
+)
+
+_SCRIPT = """
+import sys, time
+start = time.time()
+import %(module)s
+elapsed = time.time() - start
+if %(module)r == 'nti.links':
+    nti.links.Link('/dataserver2')
+print(elapsed)
+print(' '.join(sorted(sys.modules)))
+"""
+
+_HAS_IMPORTTIME = sys.version_info >= (3, 7)
+
+
+def _run(args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    process = subprocess.Popen([sys.executable] + args,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               env=env)
+    out, err = process.communicate()
+    if process.returncode:
+        raise RuntimeError("Import failed", args, err.decode('utf-8', 'replace'))
+    return out.decode('utf-8'), err.decode('utf-8')
+
+
+def parse_importtime(text):
+    """
+    Parse the output of ``python -X importtime``.
+
+    :return: An ordered mapping from each module name to a tuple of
+        its own and its cumulative import time, in microseconds.
+    """
+    result = OrderedDict()
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except (IndexError, ValueError):
+            # The header
+            continue
+        result[fields[2].strip()] = (own, cumulative)
+    return result
+
+
+def measure(module, repeat=3):
+    """
+    Import *module* in *repeat* fresh interpreters.
+
+    :return: A dictionary with the best time in milliseconds
+        (``ms``), the names of the modules loaded (``modules``), and,
+        if available, the times of the modules imported, as returned
+        by :func:`parse_importtime`, from the fastest run
+        (``importtime``).
+    """
+    best = None
+    for _ in range(repeat):
+        args = ['-c', _SCRIPT % {'module': module}]
+        if _HAS_IMPORTTIME:
+            args = ['-X', 'importtime'] + args
+        out, err = _run(args)
+        lines = out.splitlines()
+        result = {
+            'ms': float(lines[0]) * 1000,
+            'modules': lines[1].split(),
+            'importtime': parse_importtime(err) if _HAS_IMPORTTIME else None,
+        }
+        if best is None or result['ms'] < best['ms']:
+            best = result
+    return best
+
+
+def report(module, result, budget, top=10, out=None):
+    """
+    Print *result* from :func:`measure` to *out* (by default, standard
+    output), and return whether it is within *budget* (milliseconds).
+    """
+    out = sys.stdout if out is None else out
+    ok = result['ms'] <= budget
+    print('%-30s %8.1f ms (budget %d ms)%s' % (module, result['ms'], budget,
+                                              '' if ok else '  OVER BUDGET'),
+          file=out)
+    times = result['importtime']
+    if times:
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (own, _) in slowest[:top]:
+            print('    %-40s %8.1f ms' % (name, own / 1000.0), file=out)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10,
+                        help="How many of the slowest modules to list")
+    args = parser.parse_args(argv)
+
+    ok = True
+    for module, budget in BUDGETS.items():
+        result = measure(module, args.repeat)
+        ok = report(module, result, budget, args.top) and ok
+        if module == 'nti.links':
+            loaded = sorted(set(RENDERING_MODULES).intersection(result['modules']))
+            if loaded:
+                print('    Loads rendering modules: %s' % ', '.join(loaded))
+                ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
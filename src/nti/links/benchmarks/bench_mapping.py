@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares rendering links into ``LocatedExternalDict`` objects, the
+default, with rendering them into
+:class:`~nti.links.externalization.RenderedLinkDict` objects, by the
+memory allocated for the rendered links, and the time it takes to
+render and to encode them.
+
+Run with ``python -m nti.links.benchmarks.bench_mapping``. Memory is
+measured with :mod:`tracemalloc`, where it is available (Python 3).
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import json
+import argparse
+
+from contextlib import contextmanager
+
+from timeit import default_timer
+
+from zope import component
+
+from nti.links.benchmarks import configure_components
+
+from nti.links.externalization import RenderedLinkDict
+from nti.links.externalization import render_links
+
+from nti.links.interfaces import ILinkExternalMappingFactory
+
+from nti.links.links import Link
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@contextmanager
+def link_dicts():
+    """
+    Render links into :class:`~nti.links.externalization.RenderedLinkDict`
+    objects while this is in effect.
+    """
+    gsm = component.getGlobalSiteManager()
+    gsm.registerUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+    try:
+        yield
+    finally:
+        gsm.unregisterUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+
+
+def _links(count):
+    return [Link(u'/dataserver2/users/user%d' % i, rel=u'edit', method=u'PUT')
+            for i in range(count)]
+
+
+def _best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    return min(times)
+
+
+def measure(count=1000, repeat=5, dumps=json.dumps):
+    """
+    Render *count* links, and encode them with *dumps*.
+
+    :return: A dictionary with the number of memory blocks allocated
+        for, and still held by, the rendered links (``blocks``), their
+        size in bytes (``bytes``), and the best times in milliseconds
+        to render them (``render_ms``) and to encode them
+        (``encode_ms``). The memory is ``None`` without
+        :mod:`tracemalloc`.
+    """
+    links = _links(count)
+    result = {'blocks': None, 'bytes': None}
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            measured = render_links(links)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        result['blocks'] = sum(stat.count_diff for stat in stats)
+        result['bytes'] = sum(stat.size_diff for stat in stats)
+        measured = None
+    rendered = render_links(links)
+    result['render_ms'] = _best(lambda: render_links(links), repeat) * 1000
+    result['encode_ms'] = _best(lambda: dumps(rendered), repeat) * 1000
+    return result
+
+
+def main(argv=None, out=None):
+    out = sys.stdout if out is None else out
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    configure_components()
+    print('%-20s %10s %10s %10s %10s' % ('', 'blocks', 'bytes', 'render ms', 'encode ms'),
+          file=out)
+    results = [('LocatedExternalDict', measure(args.links, args.repeat))]
+    with link_dicts():
+        results.append(('RenderedLinkDict', measure(args.links, args.repeat)))
+    for name, result in results:
+        print('%-20s %10s %10s %10.2f %10.2f' % (name,
+                                                 result['blocks'],
+                                                 result['bytes'],
+                                                 result['render_ms'],
+                                                 result['encode_ms']),
+              file=out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the memory used by :class:`~nti.links.links.Link` and
+:class:`~nti.links.links.CompactLink` instances with :mod:`tracemalloc`.
+
+Run with ``python -m nti.links.benchmarks.bench_memory``. It needs
+:mod:`tracemalloc`, so it only runs on Python 3.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import gc
+import sys
+import argparse
+
+from nti.links.links import Link
+from nti.links.links import CompactLink
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The number of links allocated for each measurement.
+COUNT = 100000
+
+
+def _make(factory, count):
+    # A typical mix: every link gets a method and elements, and
+    # the rel strings are built at runtime rather than being literals.
+    rels = [''.join(('ed', 'it')), ''.join(('self',))]
+    return [factory('/dataserver2/users/user%d' % i,
+                    rel=rels[i % 2],
+                    elements=tuple(['@@edit']),
+                    method='PUT',
+                    params=None)
+            for i in range(count)]
+
+
+def measure(factory, count=COUNT):
+    """
+    :return: The number of bytes allocated per link by *factory*, not
+        counting the targets themselves.
+    """
+    targets_only = _allocated(lambda: ['/dataserver2/users/user%d' % i
+                                       for i in range(count)])
+    return (_allocated(lambda: _make(factory, count)) - targets_only) / count
+
+
+def _allocated(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        del result
+    finally:
+        tracemalloc.stop()
+    return size
+
+
+def main(argv=None, out=None):
+    out = sys.stdout if out is None else out
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=COUNT)
+    args = parser.parse_args(argv)
+
+    if tracemalloc is None:  # pragma: no cover
+        print('tracemalloc is not available; use Python 3', file=out)
+        return 1
+    link = measure(Link, args.count)
+    compact = measure(CompactLink, args.count)
+    print('%-12s %8.1f bytes/link' % ('Link', link), file=out)
+    print('%-12s %8.1f bytes/link' % ('CompactLink', compact), file=out)
+    print('Saving: %.1f%%' % (100.0 * (link - compact) / link), file=out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,520 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The link rendering benchmark suite.
+
+This is installed as the ``nti_links_benchmark`` script. It runs
+entirely offline, against the global component registry configured
+with the ZCML of this package and its dependencies, and writes its
+results as JSON so that two runs (for example, before and after an
+upgrade) can be compared::
+
+    $ nti_links_benchmark -o before.json
+    ... upgrade ...
+    $ nti_links_benchmark -o after.json --compare before.json
+    $ nti_links_benchmark --results after.json --compare before.json
+
+The benchmarks of NTIID links use the interfaces of the ``legacy``
+extra if it is installed, and otherwise need :mod:`fudge` (from the
+``test`` extra) to stand them in while they run.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+
+from collections import OrderedDict
+
+from contextlib import contextmanager
+
+from zope import component
+from zope import interface
+
+from zope.location.interfaces import IRoot
+from zope.location.interfaces import ILocation
+
+from nti.links import externalization
+
+from nti.links.benchmarks import configure_components
+
+from nti.links.benchmarks.bench_mapping import link_dicts
+
+from nti.links.caching import enable_lineage_path_cache
+from nti.links.caching import enable_component_lookup_cache
+from nti.links.caching import disable_component_lookup_cache
+from nti.links.caching import disable_lineage_path_cache
+
+from nti.links.externalization import LinkExternal
+from nti.links.externalization import LinkExternalObjectDecorator
+from nti.links.externalization import render_link
+from nti.links.externalization import render_links
+from nti.links.externalization import render_external_links
+from nti.links.externalization import compact_link_rendering
+from nti.links.externalization import json_link_rendering
+from nti.links.externalization import enable_rendered_link_cache
+from nti.links.externalization import disable_rendered_link_cache
+from nti.links.externalization import enable_shared_rendered_link_cache
+from nti.links.externalization import disable_shared_rendered_link_cache
+
+from nti.links.fingerprint import links_fingerprint
+
+from nti.links.links import Link
+from nti.links.links import LinkTemplate
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The format version of the JSON results.
+RESULTS_VERSION = 1
+
+OID = u'tag:nextthought.com,2011-10:system-OID-0x12:5573657273'
+NTIID = u'tag:nextthought.com,2011-10:BLEACH-NTIVideo-Ichigo.vs.Aizen'
+
+
+@interface.implementer(IRoot)
+class _Root(object):
+    __name__ = None
+    __parent__ = None
+
+
+@interface.implementer(ILocation)
+class _Location(object):
+
+    def __init__(self, parent, name):
+        self.__parent__ = parent
+        self.__name__ = name
+
+
+def _lineage(depth):
+    # site -> community -> forum -> topic -> comment ...
+    node = _Location(_Root(), u'dataserver2')
+    for i in range(depth):
+        node = _Location(node, u'level%d' % i)
+    return node
+
+
+class _IDataserver(interface.Interface):
+    pass
+
+
+@interface.implementer(_IDataserver)
+class _Dataserver(object):
+
+    def __init__(self):
+        self.root = _Location(_Root(), u'dataserver2')
+
+
+if externalization.IDataserver is not None:  # pragma: no cover
+    _IShouldHaveTraversablePath = externalization.IShouldHaveTraversablePath
+else:
+    class _IShouldHaveTraversablePath(interface.Interface):
+        pass
+
+
+@contextmanager
+def _legacy_interfaces():
+    # The interfaces of the ``legacy`` extra, or, without it, stand-ins
+    # patched in for the duration of the benchmark.
+    if externalization.IDataserver is not None:  # pragma: no cover
+        yield externalization.IDataserver
+        return
+    import fudge
+    with fudge.patched_context(externalization, 'IShouldHaveTraversablePath',
+                               _IShouldHaveTraversablePath), \
+         fudge.patched_context(externalization, 'IDataserver', _IDataserver):
+        # Render plans remember what the interface said about targets
+        externalization.invalidate_render_plans()
+        try:
+            yield _IDataserver
+        finally:
+            externalization.invalidate_render_plans()
+
+
+@contextmanager
+def _legacy():
+    # Enable the NTIID code paths of render_link by registering a
+    # dataserver.
+    dataserver = _Dataserver()
+    with _legacy_interfaces() as iface:
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(dataserver, iface)
+        try:
+            yield
+        finally:
+            gsm.unregisterUtility(dataserver, iface)
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+@contextmanager
+def _lineage_cache():
+    enable_lineage_path_cache()
+    try:
+        yield
+    finally:
+        disable_lineage_path_cache()
+
+
+@contextmanager
+def _legacy_lookup_cache():
+    enable_component_lookup_cache()
+    try:
+        with _legacy():
+            yield
+    finally:
+        disable_component_lookup_cache()
+
+
+@contextmanager
+def _legacy_shared_cache():
+    # As read by a process that has only just started
+    tmpdir = tempfile.mkdtemp()
+    enable_shared_rendered_link_cache(os.path.join(tmpdir, 'links.cache'))
+    try:
+        with _legacy():
+            yield
+    finally:
+        disable_shared_rendered_link_cache()
+        shutil.rmtree(tmpdir)
+
+
+def _dumps():
+    # The encoder that splices fragments in, if installed
+    try:
+        import simplejson
+    except ImportError:  # pragma: no cover
+        from nti.externalization.representation import to_json_representation_externalized
+        return to_json_representation_externalized
+    return simplejson.dumps
+
+
+@contextmanager
+def _rendered_cache():
+    enable_rendered_link_cache()
+    try:
+        yield
+    finally:
+        disable_rendered_link_cache()
+
+
+@contextmanager
+def _json_fragments():
+    with _rendered_cache(), json_link_rendering(_dumps()):
+        yield
+
+
+@contextmanager
+def _compact():
+    with compact_link_rendering(u'/dataserver2/'):
+        yield
+
+
+def _render_siblings(depth, count):
+    parent = _lineage(depth)
+    links = [Link(_Location(parent, u'item%d' % i), rel=u'edit') for i in range(count)]
+    return lambda: render_links(links)
+
+
+def _render(link):
+    return lambda: render_link(link)
+
+
+def _decorate_mapping(count):
+    links = [Link(u'/dataserver2/users/user%d' % i, rel=u'edit', method=u'PUT')
+             for i in range(count)]
+    decorator = LinkExternalObjectDecorator()
+    return lambda: decorator.decorateExternalObject(None, {u'Links': list(links)})
+
+
+def _encode_mapping(count):
+    links = [Link(u'/dataserver2/users/user%d' % i, rel=u'edit', method=u'PUT')
+             for i in range(count)]
+    decorator = LinkExternalObjectDecorator()
+    dumps = _dumps()
+
+    def encode():
+        external = {u'Links': list(links)}
+        decorator.decorateExternalObject(None, external)
+        return dumps(external)
+    return encode
+
+
+def _tree_links(i):
+    return [Link(u'/dataserver2/users/user%d' % i, rel=u'edit', method=u'PUT'),
+            Link(u'/dataserver2/users/user%d' % i, rel=u'like', elements=(u'@@like',))]
+
+
+def _external_tree(items, replies):
+    # A collection of items with replies, and the containers in it
+    # from the leaves up, in the order externalization decorates them.
+    containers = []
+    collection = {u'Items': [], u'Links': _tree_links(0)}
+    for i in range(items):
+        item = {u'Class': u'Note', u'Links': _tree_links(i), u'Replies': []}
+        for j in range(replies):
+            reply = {u'Class': u'Note', u'Links': _tree_links(j), u'Tags': [u'a', u'b']}
+            item[u'Replies'].append(reply)
+            containers.append(reply)
+        containers.append(item[u'Replies'])
+        containers.append(item)
+        collection[u'Items'].append(item)
+    containers.append(collection[u'Items'])
+    containers.append(collection)
+    return collection, containers
+
+
+def _decorate_tree(items, replies):
+    decorator = LinkExternalObjectDecorator()
+
+    def decorate():
+        _, containers = _external_tree(items, replies)
+        for container in containers:
+            decorator.decorateExternalObject(None, container)
+    return decorate
+
+
+def _walk_tree(items, replies):
+    def walk():
+        collection, _ = _external_tree(items, replies)
+        render_external_links(collection)
+    return walk
+
+
+def _decorate_sequence(count, href_only=False):
+    links = [Link(u'/dataserver2/users/user%d' % i, href_only=href_only)
+             for i in range(count)]
+    decorator = LinkExternalObjectDecorator()
+    return lambda: decorator.decorateExternalObject(None, list(links))
+
+
+def _render_edit_links(count):
+    targets = [u'/dataserver2/users/user%d' % i for i in range(count)]
+    return lambda: render_links([Link(t, rel=u'edit', elements=(u'@@edit',),
+                                      params={u'v': u'1'}, method=u'PUT')
+                                 for t in targets])
+
+
+def _fingerprint_edit_links(count):
+    targets = [u'/dataserver2/users/user%d' % i for i in range(count)]
+    return lambda: links_fingerprint([Link(t, rel=u'edit', elements=(u'@@edit',),
+                                           params={u'v': u'1'}, method=u'PUT')
+                                      for t in targets])
+
+
+def _render_oid_links(count):
+    links = [Link(OID + u'%d' % i, rel=u'edit') for i in range(count)]
+    return lambda: render_links(links)
+
+
+def _render_template(count):
+    targets = [u'/dataserver2/users/user%d' % i for i in range(count)]
+    template = LinkTemplate(rel=u'edit', elements=(u'@@edit',),
+                            params={u'v': u'1'}, method=u'PUT')
+    return lambda: template.render(targets)
+
+
+class _Shaped(object):
+    ntiid = NTIID
+
+
+@interface.implementer(_IShouldHaveTraversablePath)
+class _Traversable(_Location):
+    ntiid = NTIID
+
+
+#: name -> (context manager factory, setup function returning the
+#: callable to time, operations per call)
+BENCHMARKS = OrderedDict((
+    ('render_link.url',
+     (_nothing, lambda: _render(Link(u'https://www.google.com', rel=u'google',
+                                     elements=(u'mail',), params={u'app': u'42'})), 1)),
+    ('render_link.oid_ntiid',
+     (_legacy, lambda: _render(Link(OID, rel=u'edit')), 1)),
+    ('render_link.oid_ntiid_lookup_cache',
+     (_legacy_lookup_cache, lambda: _render(Link(OID, rel=u'edit')), 1)),
+    ('render_link.ntiid',
+     (_legacy, lambda: _render(Link(NTIID, rel=u'alternate')), 1)),
+    ('render_link.ntiid_attribute',
+     (_legacy, lambda: _render(Link(_Shaped(), rel=u'alternate')), 1)),
+    ('render_link.lineage_depth_5',
+     (_nothing, lambda: _render(Link(_lineage(5), rel=u'edit')), 1)),
+    ('render_link.lineage_depth_20',
+     (_nothing, lambda: _render(Link(_lineage(20), rel=u'edit')), 1)),
+    ('render_links.siblings_depth_20_100',
+     (_nothing, lambda: _render_siblings(20, 100), 100)),
+    ('render_links.siblings_depth_20_100_lineage_cache',
+     (_lineage_cache, lambda: _render_siblings(20, 100), 100)),
+    ('render_link.href_only',
+     (_nothing, lambda: _render(Link(_lineage(5), rel=u'edit', href_only=True)), 1)),
+    ('render_link.legacy_traversable_path',
+     (_legacy, lambda: _render(Link(_Traversable(_lineage(5), u'item'), rel=u'edit')), 1)),
+    ('LinkExternal.toExternalObject',
+     (_nothing, lambda: LinkExternal(Link(u'/dataserver2/users/ichigo')).toExternalObject, 1)),
+    ('LinkExternal.toExternalObject_lookup_cache',
+     (_legacy_lookup_cache,
+      lambda: LinkExternal(Link(u'/dataserver2/users/ichigo')).toExternalObject, 1)),
+    ('decorator.mapping_1',
+     (_nothing, lambda: _decorate_mapping(1), 1)),
+    ('decorator.mapping_10',
+     (_nothing, lambda: _decorate_mapping(10), 10)),
+    ('decorator.mapping_1000',
+     (_nothing, lambda: _decorate_mapping(1000), 1000)),
+    ('encode.mapping_1000',
+     (_rendered_cache, lambda: _encode_mapping(1000), 1000)),
+    ('encode.mapping_1000_json_fragments',
+     (_json_fragments, lambda: _encode_mapping(1000), 1000)),
+    ('decorator.mapping_1000_compact',
+     (_compact, lambda: _decorate_mapping(1000), 1000)),
+    ('decorator.tree_100x5',
+     (_nothing, lambda: _decorate_tree(100, 5), 1202)),
+    ('render_external_links.tree_100x5',
+     (_nothing, lambda: _walk_tree(100, 5), 1202)),
+    ('decorator.sequence_10000',
+     (_nothing, lambda: _decorate_sequence(10000), 10000)),
+    ('render_links.edit_1000',
+     (_nothing, lambda: _render_edit_links(1000), 1000)),
+    ('render_links.edit_1000_link_dicts',
+     (link_dicts, lambda: _render_edit_links(1000), 1000)),
+    ('links_fingerprint.edit_1000',
+     (_nothing, lambda: _fingerprint_edit_links(1000), 1000)),
+    ('render_links.oid_ntiid_1000',
+     (_legacy, lambda: _render_oid_links(1000), 1000)),
+    ('render_links.oid_ntiid_1000_shared_cache',
+     (_legacy_shared_cache, lambda: _render_oid_links(1000), 1000)),
+    ('LinkTemplate.render_1000',
+     (_nothing, lambda: _render_template(1000), 1000)),
+    ('decorator.sequence_href_only_10000',
+     (_nothing, lambda: _decorate_sequence(10000, href_only=True), 10000)),
+))
+
+
+def _time(func, number):
+    begin = time.time()
+    for _ in range(number):
+        func()
+    return time.time() - begin
+
+
+def measure(func, repeat=5, min_time=0.1):
+    """
+    Return the best time in seconds for a single call of *func*, taken
+    over *repeat* trials that each last at least *min_time* seconds.
+    """
+    number = 1
+    while True:
+        elapsed = _time(func, number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, _time(func, number))
+    return best / number
+
+
+def run_benchmarks(names=None, repeat=5, min_time=0.1):
+    """
+    Run the named benchmarks (default: all of them).
+
+    :return: A mapping from benchmark name to a mapping with the
+        ``usec_per_op`` of that benchmark.
+    """
+    results = OrderedDict()
+    for name, (context, setup, ops) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        with context():
+            func = setup()
+            seconds = measure(func, repeat, min_time)
+        results[name] = {'usec_per_op': seconds * 1e6 / ops}
+    return results
+
+
+def _metadata():
+    try:
+        import pkg_resources  # pylint: disable=import-outside-toplevel
+        version = pkg_resources.get_distribution('nti.links').version
+    except Exception:  # pragma: no cover pylint: disable=broad-except
+        version = None
+    return {'nti.links': version,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform()}
+
+
+def compare(baseline, current, out=sys.stdout):
+    """
+    Print a table comparing two results documents.
+
+    :return: A mapping of benchmark name to the ratio of the
+        current time to the baseline time.
+    """
+    ratios = OrderedDict()
+    old = baseline['benchmarks']
+    new = current['benchmarks']
+    print('%-40s %12s %12s %8s' % ('benchmark', 'baseline us', 'current us', 'ratio'),
+          file=out)
+    for name in new:
+        if name not in old:
+            continue
+        before = old[name]['usec_per_op']
+        after = new[name]['usec_per_op']
+        ratios[name] = ratio = after / before if before else float('inf')
+        print('%-40s %12.3f %12.3f %7.2fx' % (name, before, after, ratio), file=out)
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help="Benchmarks to run (default: all): " + ', '.join(BENCHMARKS))
+    parser.add_argument('-o', '--output', help="Write the JSON results to this file")
+    parser.add_argument('--results',
+                        help="Use these saved results instead of running the benchmarks")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="Compare the results with these saved results")
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help="Minimum duration in seconds of each trial")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("Unknown benchmarks: " + ', '.join(sorted(unknown)))
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        configure_components()
+        results = {'version': RESULTS_VERSION,
+                   'metadata': _metadata(),
+                   'benchmarks': run_benchmarks(args.names, args.repeat, args.min_time)}
+        if not args.compare:
+            for name, result in results['benchmarks'].items():
+                print('%-40s %12.3f us' % (name, result['usec_per_op']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        compare(baseline, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,672 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Caches used while rendering links.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import re
+import weakref
+import threading
+
+import six
+
+from collections import OrderedDict
+
+from contextlib import contextmanager
+
+from timeit import default_timer
+
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class LinkRenderingCache(object):
+    """
+    A short-lived cache of values that are expensive to derive while
+    rendering links, such as the resource path of a creator or the
+    dataserver root.
+
+    Entries are keyed by object identity and hold only weak references
+    to those objects, so the cache never keeps a persistent object (or
+    its connection) alive. Objects that cannot be weakly referenced are
+    simply not cached.
+
+    Instances are meant to be scoped to a single request; see
+    :func:`link_rendering_cache`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._paths = {}
+        self._dataserver_root = None
+
+    def _forget(self, key, unused_ref=None):
+        self._paths.pop(key, None)
+
+    def resource_path(self, obj, compute):
+        """
+        Return the resource path of *obj*, calling ``compute(obj)`` only
+        if it has not already been computed for this very object.
+
+        Exceptions raised by *compute* propagate and nothing is cached.
+        """
+        key = id(obj)
+        entry = self._paths.get(key)
+        if entry is not None and entry[0]() is obj:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        path = compute(obj)
+        try:
+            ref = weakref.ref(obj, lambda r, k=key: self._forget(k, r))
+        except TypeError:
+            # Not weakly referenceable (None, strings, ...)
+            pass
+        else:
+            self._paths[key] = (ref, path)
+        return path
+
+    def peek_path(self, obj):
+        """
+        Return the resource path already computed for *obj*, or
+        ``None``.
+        """
+        entry = self._paths.get(id(obj))
+        if entry is not None and entry[0]() is obj:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def dataserver_root(self, compute):
+        """
+        Return the dataserver root object, calling ``compute()`` to find
+        it the first time.
+        """
+        root = self._dataserver_root() if self._dataserver_root is not None else None
+        if root is not None:
+            self.hits += 1
+            return root
+
+        self.misses += 1
+        root = compute()
+        try:
+            self._dataserver_root = weakref.ref(root)
+        except TypeError:
+            self._dataserver_root = None
+        return root
+
+    def clear(self):
+        self._paths.clear()
+        self._dataserver_root = None
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __repr__(self):
+        return "<%s entries=%d hits=%d misses=%d>" % (type(self).__name__,
+                                                     len(self),
+                                                     self.hits,
+                                                     self.misses)
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping holding at most *maxsize* entries, discarding
+    the least recently used entry when it is full.
+    """
+
+    def __init__(self, maxsize=1024):
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Re-inserting makes this the most recently used entry.
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "<%s entries=%d/%d hits=%d misses=%d>" % (type(self).__name__,
+                                                        len(self),
+                                                        self.maxsize,
+                                                        self.hits,
+                                                        self.misses)
+
+
+# Names that path quoting leaves unchanged. See
+# nti.traversal.compat.quote_path_segment.
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9._~!$&'()*+,;=:@-]+$").match
+
+
+def _stamp(obj):
+    # The identity and serial of *obj*, if it is persistent, as a
+    # tuple of stamps.
+    if getattr(obj, '_p_jar', None) is None:
+        return ()
+    try:
+        ref = weakref.ref(obj)
+    except TypeError:
+        # Can't be told apart from a replacement; never unchanged
+        ref = lambda: None
+    return ((ref, obj._p_serial),)
+
+
+def _lineage_stamps(obj):
+    stamps = ()
+    while obj is not None:
+        stamps += _stamp(obj)
+        obj = getattr(obj, '__parent__', None)
+    return stamps
+
+
+def _unchanged(stamps):
+    for ref, serial in stamps:
+        obj = ref()
+        # A ghost may have been invalidated by a transaction whose
+        # serial it won't have until it is loaded.
+        if obj is None or obj._p_changed is None or obj._p_serial != serial:
+            return False
+    return True
+
+
+class LineagePathCache(object):
+    """
+    A cache of the resource paths of objects located by ``__parent__``
+    and ``__name__``, so that siblings share the work of finding the
+    path of their container.
+
+    The path of an object whose name needs no quoting is its parent's
+    path plus its name, using the cached path of the parent; other
+    paths are computed in full. Entries are keyed by identity and hold
+    weak references, and an entry is only used while the object still
+    has the parent and name it had when it was cached.
+
+    An entry also remembers the ``_p_serial`` of each of the
+    persistent ancestors of the object, and is only used while they
+    are all loaded and still have that serial. A transaction committed
+    elsewhere that moves an ancestor changes its serial, and
+    invalidates the loaded copy (making it a ghost) in the
+    connections of this process, so paths are not reused across such a
+    change. A change to the location of an ancestor that is *not*
+    persistent is only noticed through the object events of this
+    process; see :func:`invalidate_lineage_paths`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key, ref):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del self._entries[key]
+
+    def _get(self, obj):
+        entry = self._entries.get(id(obj))
+        if     entry is None \
+            or entry[0]() is not obj \
+            or getattr(obj, '__parent__', None) is not entry[2]() \
+            or getattr(obj, '__name__', None) != entry[3] \
+            or (entry[4] and not _unchanged(entry[4])):
+            return None
+        return entry
+
+    def _set(self, obj, path, parent, name, stamps):
+        key = id(obj)
+        try:
+            ref = weakref.ref(obj, lambda r, k=key: self._forget(k, r))
+            parent_ref = weakref.ref(parent) if parent is not None else lambda: None
+        except TypeError:
+            # Not weakly referenceable
+            return
+        with self._lock:
+            self._entries[key] = (ref, path, parent_ref, name, stamps)
+
+    def path(self, obj, compute):
+        """
+        Return the resource path of *obj*, calling ``compute(obj)`` for
+        the objects (*obj* or one of its ancestors) whose path can't be
+        derived from a cached one.
+
+        Exceptions raised by *compute* propagate and nothing is cached
+        for the objects below it.
+        """
+        entry = self._get(obj)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+        # Walk up to an ancestor with a known path, or whose path must
+        # be computed (including the children of the root, which has
+        # no path of its own), then derive the paths back down.
+        chain = []
+        node = obj
+        while True:
+            parent = getattr(node, '__parent__', None)
+            name = getattr(node, '__name__', None)
+            if     parent is None \
+                or getattr(parent, '__parent__', None) is None \
+                or not isinstance(name, six.string_types) \
+                or not _SAFE_NAME(name):
+                path = compute(node)
+                stamps = _lineage_stamps(parent)
+                self._set(node, path, parent, name, stamps)
+                break
+            chain.append((node, parent, name))
+            node = parent
+            entry = self._get(node)
+            if entry is not None:
+                path, stamps = entry[1], entry[4]
+                break
+
+        for node, parent, name in reversed(chain):
+            stamps += _stamp(parent)
+            if path.endswith('/'):
+                # Empty names are collapsed by normalization
+                path = compute(node)
+            else:
+                path = path + '/' + name
+            self._set(node, path, parent, name, stamps)
+        return path
+
+    def peek(self, obj):
+        """
+        Return the cached path of *obj* without reading its location,
+        which would load it if it is a ghost, or ``None``.
+
+        The parent and name *obj* had when its path was cached are
+        assumed to be unchanged; only its ancestors are checked. A ghost
+        that was moved by a transaction it hasn't been loaded since
+        gets the path it had before.
+        """
+        entry = self._entries.get(id(obj))
+        if     entry is None \
+            or entry[0]() is not obj \
+            or (entry[4] and not _unchanged(entry[4])):
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def discard(self, obj):
+        with self._lock:
+            self._entries.pop(id(obj), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "<%s entries=%d hits=%d misses=%d>" % (type(self).__name__,
+                                                     len(self),
+                                                     self.hits,
+                                                     self.misses)
+
+
+_lineage_path_cache = None
+
+
+def enable_lineage_path_cache():
+    """
+    Make link rendering use a :class:`LineagePathCache` for the paths
+    of objects, and return it.
+    """
+    global _lineage_path_cache  # pylint: disable=global-statement
+    _lineage_path_cache = LineagePathCache()
+    return _lineage_path_cache
+
+
+def disable_lineage_path_cache():
+    global _lineage_path_cache  # pylint: disable=global-statement
+    _lineage_path_cache = None
+
+
+def lineage_path_cache():
+    """
+    Return the cache enabled by :func:`enable_lineage_path_cache`, or
+    ``None``.
+    """
+    return _lineage_path_cache
+
+
+def invalidate_lineage_paths(event):
+    """
+    A subscriber for ``IObjectMovedEvent``, which includes objects
+    being added and removed. Adding forgets the object; moving or
+    removing it forgets everything, because the paths of all its
+    descendants change too.
+    """
+    cache = _lineage_path_cache
+    if cache is None:
+        return
+    if IObjectAddedEvent.providedBy(event):
+        cache.discard(event.object)
+    else:
+        cache.clear()
+
+
+class FailedTargetCache(object):
+    """
+    Remembers, for *ttl* seconds, the link targets whose lineage
+    couldn't be walked, and how, so that links to them can be dropped
+    without walking the broken lineage again each time.
+
+    Targets are remembered by identity, with weak references; targets
+    that can't be weakly referenced, such as strings, aren't. At most
+    *maxsize* targets are kept; when there are more, those that failed
+    longest ago are forgotten first.
+    """
+
+    def __init__(self, ttl=60.0, maxsize=10000, clock=default_timer):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # id -> (weak ref, expiration, exception class, args)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _forget(self, key, ref):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del self._entries[key]
+
+    def get(self, target):
+        """
+        If *target* failed to render less than :attr:`ttl` seconds
+        ago, return a new exception like the one it raised; otherwise
+        return ``None``.
+        """
+        key = id(target)
+        entry = self._entries.get(key)
+        if entry is None or entry[0]() is not target:
+            self.misses += 1
+            return None
+        if self.clock() >= entry[1]:
+            self._forget(key, entry[0])
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2](*entry[3])
+
+    def add(self, target, error):
+        """
+        Remember that finding the path of *target* raised *error*.
+
+        The exception isn't kept, only its class and the text of its
+        arguments, so it doesn't keep the target alive.
+        """
+        key = id(target)
+        try:
+            ref = weakref.ref(target, lambda r, k=key: self._forget(k, r))
+        except TypeError:
+            # Not weakly referenceable
+            return
+        args = tuple(str(arg) for arg in error.args)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (ref, self.clock() + self.ttl, type(error), args)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, target):
+        with self._lock:
+            self._entries.pop(id(target), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "<%s entries=%d/%d hits=%d misses=%d>" % (type(self).__name__,
+                                                        len(self),
+                                                        self.maxsize,
+                                                        self.hits,
+                                                        self.misses)
+
+
+_failed_target_cache = None
+
+
+def enable_failed_target_cache(ttl=60.0, maxsize=10000):
+    """
+    Make link rendering remember the targets that fail with a
+    :class:`FailedTargetCache`, and return it.
+    """
+    global _failed_target_cache  # pylint: disable=global-statement
+    _failed_target_cache = FailedTargetCache(ttl, maxsize)
+    return _failed_target_cache
+
+
+def disable_failed_target_cache():
+    global _failed_target_cache  # pylint: disable=global-statement
+    _failed_target_cache = None
+
+
+def failed_target_cache():
+    """
+    Return the cache enabled by :func:`enable_failed_target_cache`, or
+    ``None``.
+    """
+    return _failed_target_cache
+
+
+def forget_failed_target(event):
+    """
+    A subscriber for ``IObjectMovedEvent``: an object that has been
+    moved (or added, or removed) may no longer fail to render.
+    """
+    cache = _failed_target_cache
+    if cache is not None:
+        cache.discard(event.object)
+
+
+class ComponentLookupCache(object):
+    """
+    Remembers, for each site manager, the components that rendering
+    links looks up in it (such as the dataserver), which only change
+    when the registry does.
+
+    Site managers are weakly referenced; those that can't be aren't
+    cached. Entries are kept until :meth:`clear`, which
+    :func:`invalidate_component_lookups` calls for every component
+    registration event.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # id(site manager) -> (weak ref, {key: result}). This is
+        # faster to read than a WeakKeyDictionary.
+        self._lookups = {}
+
+    def _forget(self, key, unused_ref=None):
+        self._lookups.pop(key, None)
+
+    def lookup(self, site_manager, key, compute):
+        """
+        Return the result of ``compute(site_manager)`` for *key*,
+        calling it only the first time for this site manager.
+
+        Exceptions raised by *compute* propagate and nothing is cached.
+        """
+        sm_key = id(site_manager)
+        entry = self._lookups.get(sm_key)
+        if entry is not None and entry[0]() is site_manager:
+            lookups = entry[1]
+            try:
+                result = lookups[key]
+            except KeyError:
+                pass
+            else:
+                self.hits += 1
+                return result
+        else:
+            lookups = {}
+            try:
+                ref = weakref.ref(site_manager, lambda r, k=sm_key: self._forget(k, r))
+            except TypeError:
+                # Not weakly referenceable
+                pass
+            else:
+                self._lookups[sm_key] = (ref, lookups)
+
+        self.misses += 1
+        result = lookups[key] = compute(site_manager)
+        return result
+
+    def clear(self):
+        self._lookups.clear()
+
+    def __len__(self):
+        return sum(len(entry[1]) for entry in list(self._lookups.values()))
+
+    def __repr__(self):
+        return "<%s entries=%d hits=%d misses=%d>" % (type(self).__name__,
+                                                     len(self),
+                                                     self.hits,
+                                                     self.misses)
+
+
+_component_lookup_cache = None
+
+
+def enable_component_lookup_cache():
+    """
+    Make link rendering use a :class:`ComponentLookupCache`, and
+    return it.
+
+    This is only safe if :func:`invalidate_component_lookups` is
+    subscribed to registration events, as it is in this package's
+    ``configure.zcml``.
+    """
+    global _component_lookup_cache  # pylint: disable=global-statement
+    _component_lookup_cache = ComponentLookupCache()
+    return _component_lookup_cache
+
+
+def disable_component_lookup_cache():
+    global _component_lookup_cache  # pylint: disable=global-statement
+    _component_lookup_cache = None
+
+
+def component_lookup_cache():
+    """
+    Return the cache enabled by :func:`enable_component_lookup_cache`,
+    or ``None``.
+    """
+    return _component_lookup_cache
+
+
+def invalidate_component_lookups(*unused_args):
+    """
+    A subscriber for ``IRegistrationEvent``: after any registration
+    or unregistration, in any registry (site managers see the
+    components of their bases), every lookup may have a new result.
+    """
+    cache = _component_lookup_cache
+    if cache is not None:
+        cache.clear()
+
+
+class _Local(threading.local):
+    cache = None
+
+_local = _Local()
+
+
+def current_link_rendering_cache():
+    """
+    Return the :class:`LinkRenderingCache` active for this thread, or
+    ``None``.
+    """
+    return _local.cache
+
+
+@contextmanager
+def link_rendering_cache(cache=None):
+    """
+    A context manager that makes a :class:`LinkRenderingCache` active
+    for the current thread for the duration of the block, typically
+    one request. Nested uses share the outermost cache.
+
+    Yields the active cache so that its statistics can be inspected::
+
+        with link_rendering_cache() as cache:
+            to_external_object(feed)
+        logger.debug("Link roots: %s", cache)
+    """
+    outer = _local.cache
+    if outer is not None:
+        yield outer
+        return
+
+    _local.cache = cache = LinkRenderingCache() if cache is None else cache
+    try:
+        yield cache
+    finally:
+        _local.cache = None
+        cache.clear()
+
+
+@contextmanager
+def shared_link_rendering_cache(cache):
+    """
+    A context manager that makes the existing *cache* (which may be
+    ``None``) the active one for the current thread, without clearing
+    it afterwards. This is how a request's cache is shared with the
+    workers of a :class:`~nti.links.pool.LinkRenderingPool`.
+    """
+    outer = _local.cache
+    _local.cache = cache
+    try:
+        yield cache
+    finally:
+        _local.cache = outer
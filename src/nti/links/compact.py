@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A compact encoding of rendered links, for clients that ask for it.
+
+In a large response nearly every href repeats a long prefix (the path
+of a user, an ``/Objects/`` path), and every link repeats
+``"Class": "Link"``. While
+:func:`~nti.links.externalization.compact_link_rendering` is in
+effect, links are rendered compactly through a
+:class:`CompactLinkTable` for the whole response:
+
+- ``Class`` is left out; everything in ``Links`` is a link.
+- An href is written as a pair ``[index, rest]``, where ``index`` is
+  the position of its prefix (everything up to its last ``/``) in the
+  table, and ``rest`` is what follows the prefix.
+- Unless that prefix is too short to be worth it. Then, an href that
+  starts with the declared *base* (which should end with a ``/``) is
+  written relative to it, as a relative reference that resolves
+  against the base as URLs do (so one whose first segment has a
+  colon, such as an NTIID, starts with ``./``); other hrefs are left
+  as they are, unless they would look relative to the base.
+
+The other fields of a link are unchanged. The response must include
+the table, from :meth:`CompactLinkTable.external`, typically at its
+top level; clients resolve hrefs with it as :meth:`CompactLinkTable.expand`
+does::
+
+    {"LinkBase": "/dataserver2/",
+     "LinkPrefixes": ["/dataserver2/users/ichigo/Objects/"],
+     "Items": [{"Links": [{"rel": "edit", "href": [0, "tag:..."]},
+                          {"rel": "help", "href": "help"}]}]}
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import re
+import threading
+
+from six import string_types
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The name of the base in :meth:`CompactLinkTable.external`.
+LINK_BASE = u'LinkBase'
+
+#: The name of the table of prefixes in :meth:`CompactLinkTable.external`.
+LINK_PREFIXES = u'LinkPrefixes'
+
+#: Prefixes shorter than this (beyond the base) are left in their
+#: hrefs; the index and brackets would take nearly as much room.
+MIN_PREFIX_LENGTH = 8
+
+
+# RFC 3986
+_SCHEME = re.compile(r'[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+
+def _is_relative(href):
+    return not href.startswith('/') and _SCHEME.match(href) is None
+
+
+class CompactLinkTable(object):
+    """
+    The base and the prefixes of the hrefs of the compact links in one
+    response.
+
+    :param str base: If given, hrefs starting with it that have no
+        long prefix beyond it are written relative to it.
+    """
+
+    def __init__(self, base=None):
+        self.base = base
+        self.prefixes = []
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, prefix):
+        index = self._indexes.get(prefix)
+        if index is None:
+            # Links may be rendered by the workers of a pool
+            with self._lock:
+                index = self._indexes.get(prefix)
+                if index is None:
+                    index = self._indexes[prefix] = len(self.prefixes)
+                    self.prefixes.append(prefix)
+        return index
+
+    def compact_href(self, href):
+        """
+        Return the compact form of *href*.
+        """
+        base = self.base
+        start = len(base) if base and href.startswith(base) else 0
+        slash = href.rfind('/') + 1
+        if slash - start >= MIN_PREFIX_LENGTH:
+            return [self._index(href[:slash]), href[slash:]]
+        if start:
+            relative = href[start:]
+            if not _is_relative(relative) or relative.startswith('./'):
+                # Such as an NTIID, which would look like a URL
+                relative = './' + relative
+            return relative
+        if base and _is_relative(href):
+            return [self._index(href[:slash]), href[slash:]]
+        return href
+
+    def compact(self, rendered):
+        """
+        Return the compact form of *rendered*, a link as rendered by
+        :func:`~nti.links.externalization.render_link`. A mapping is
+        changed in place.
+        """
+        if isinstance(rendered, string_types):
+            return self.compact_href(rendered)
+        rendered.pop(u'Class', None)
+        rendered[u'href'] = self.compact_href(rendered[u'href'])
+        return rendered
+
+    def expand_href(self, href):
+        """
+        Return the href that *href*, from :meth:`compact_href`, stands
+        for.
+        """
+        if isinstance(href, string_types):
+            base = self.base
+            if base and _is_relative(href):
+                return base + (href[2:] if href.startswith('./') else href)
+            return href
+        index, rest = href
+        return self.prefixes[index] + rest
+
+    def expand(self, compact):
+        """
+        Return a new rendered link equal to the one that *compact*, a
+        result of :meth:`compact`, was made from.
+        """
+        if isinstance(compact, (string_types, list)):
+            return self.expand_href(compact)
+        result = {u'Class': u'Link'}
+        result.update(compact)
+        result[u'href'] = self.expand_href(compact[u'href'])
+        return result
+
+    def external(self):
+        """
+        Return the mapping that declares this table to clients.
+        """
+        result = {LINK_PREFIXES: list(self.prefixes)}
+        if self.base:
+            result[LINK_BASE] = self.base
+        return result
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def __repr__(self):
+        return "<%s base=%r prefixes=%d>" % (type(self).__name__, self.base, len(self))
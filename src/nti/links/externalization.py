@@ -8,13 +8,28 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import sys
+import logging
+import binascii
+import threading
 import collections
+
+from contextlib import contextmanager
+
+from timeit import default_timer
+
+import six
 from six import string_types
 from six.moves import urllib_parse
 
 from zope import component
 from zope import interface
 
+from zope.interface import providedBy
+
+from zope.component.hooks import site as current_site
+from zope.component.hooks import getSite
+
 from zope.location.interfaces import LocationError
 
 from zope.traversing.interfaces import TraversalError
@@ -31,6 +46,12 @@ except ImportError:
 else:
     from nti.coremetadata.interfaces import IDataserver
 
+# simplejson writes instances of RawJSON out as they are
+try:
+    from simplejson import RawJSON as _RawJSON
+except ImportError:  # pragma: no cover
+    _RawJSON = object
+
 from nti.externalization.interfaces import StandardExternalFields
 from nti.externalization.interfaces import ILocatedExternalMapping
 from nti.externalization.interfaces import IExternalObjectDecorator
@@ -38,13 +59,40 @@ from nti.externalization.interfaces import IInternalObjectExternalizer
 
 from nti.externalization.singleton import Singleton
 
+from nti.links.caching import LRUCache
+from nti.links.caching import failed_target_cache
+from nti.links.caching import component_lookup_cache
+from nti.links.caching import lineage_path_cache
+from nti.links.caching import shared_link_rendering_cache
+from nti.links.caching import current_link_rendering_cache
+
+from nti.links.compact import CompactLinkTable
+
 from nti.links.interfaces import ILink
+from nti.links.interfaces import ILinksRendered
+from nti.links.interfaces import ILinkExternalMappingFactory
 from nti.links.interfaces import ILinkExternalHrefOnly
 
-from nti.mimetype.mimetype import nti_mimetype_from_object
+from nti.links.links import LinkParams
+
+from nti.links.metrics import BRANCH_GHOST
+from nti.links.metrics import BRANCH_CACHED
+from nti.links.metrics import BRANCH_TRAVERSAL
+from nti.links.metrics import BRANCH_NTIID_NTIIDS
+from nti.links.metrics import BRANCH_NTIID_OBJECTS
+from nti.links.metrics import BRANCH_RESOURCE_PATH
+from nti.links.metrics import BRANCH_NTIID_BACKDOOR
+from nti.links.metrics import RateLimitedLog
+from nti.links.metrics import record_error
+from nti.links.metrics import record_render
+from nti.links.metrics import get_metrics_sink
+
+from nti.links.targets import INVALID
+from nti.links.targets import OID_NTIID
+from nti.links.targets import classify_target
 
 from nti.ntiids.ntiids import TYPE_OID
-from nti.ntiids.ntiids import is_ntiid_of_type
+from nti.ntiids.ntiids import make_ntiid
 from nti.ntiids.ntiids import is_valid_ntiid_string
 
 from nti.traversal.traversal import normal_resource_path
@@ -52,6 +100,89 @@ from nti.traversal.traversal import is_valid_resource_path
 
 logger = __import__('logging').getLogger(__name__)
 
+_MISSING = object()
+
+_error_log = RateLimitedLog(logger)
+
+
+def link_error_log():
+    """
+    Return the :class:`~nti.links.metrics.RateLimitedLog` through
+    which failures to render links are logged.
+    """
+    return _error_log
+
+
+def set_link_error_log(log):
+    """
+    Replace the :class:`~nti.links.metrics.RateLimitedLog` returned by
+    :func:`link_error_log`, for example to change its interval, and
+    return the previous one.
+    """
+    global _error_log  # pylint: disable=global-statement
+    old, _error_log = _error_log, log
+    return old
+
+_STRING_TYPES = (six.text_type, six.binary_type)
+
+
+def _normal_resource_path(obj):
+    lineage = lineage_path_cache()
+    if lineage is None:
+        return normal_resource_path(obj)
+    return lineage.path(obj, normal_resource_path)
+
+
+def _resource_path(obj):
+    # normal_resource_path, consulting the request-scoped cache and
+    # the lineage cache if there are any.
+    cache = current_link_rendering_cache()
+    if cache is None:
+        return _normal_resource_path(obj)
+    return cache.resource_path(obj, _normal_resource_path)
+
+
+def _site_lookup(key, compute):
+    # ``compute(site_manager)``, remembered for the current site
+    # manager if the component lookup cache is enabled.
+    site_manager = component.getSiteManager()
+    cache = component_lookup_cache()
+    if cache is None:
+        return compute(site_manager)
+    return cache.lookup(site_manager, key, compute)
+
+
+def _lookup_dataserver(site_manager):
+    dataserver = site_manager.queryUtility(IDataserver) if IDataserver is not None else None
+    if dataserver is None:
+        _error_log(logging.WARNING, 'no dataserver',
+                   "No dataserver found, you must have provided a site. "
+                   "Only in test cases")
+    return dataserver
+
+
+def _lookup_mapping_factory(site_manager):
+    factory = site_manager.utilities.lookup((), ILinkExternalMappingFactory)
+    if factory is None:
+        factory = site_manager.adapters.lookup((), ILocatedExternalMapping)
+    if factory is None:  # pragma: no cover
+        # Let getMultiAdapter raise its usual error.
+        factory = lambda: component.getMultiAdapter((), ILocatedExternalMapping)
+    return factory
+
+
+def _dataserver_root():
+    # The root of the registered dataserver, or None. The root is
+    # not cached beyond the current request; it belongs to a
+    # connection.
+    def compute():
+        dataserver = _site_lookup(IDataserver, _lookup_dataserver)
+        return dataserver.root if dataserver is not None else None
+    cache = current_link_rendering_cache()
+    if cache is None:
+        return compute()
+    return cache.dataserver_root(compute)
+
 
 def _root_for_ntiid_link(link, nearest_site=None):
     # Place the NTIID reference under the most specific place possible: the owner,
@@ -60,21 +191,161 @@ def _root_for_ntiid_link(link, nearest_site=None):
     target = link.target
     if ICreated.providedBy(target) and target.creator:
         try:
-            root = normal_resource_path(target.creator)
+            root = _resource_path(target.creator)
         except TypeError:  # pragma: no cover
             pass
     if root is None and ICreated.providedBy(link) and link.creator:
         try:
-            root = normal_resource_path(link.creator)
+            root = _resource_path(link.creator)
         except TypeError:
             pass
 
     if root is None:
-        root = normal_resource_path(nearest_site)
+        root = _resource_path(nearest_site)
 
     return root
 
 
+#: The provider of the OID NTIIDs generated for ghosts, whose creator
+#: can't be known without loading them. This matches the masked
+#: creator of :func:`nti.ntiids.oids.to_external_ntiid_oid`.
+GHOST_OID_PROVIDER = 'unknown'
+
+
+def _is_ghost(target):
+    # Reading _p_changed doesn't activate; it's None only for ghosts.
+    return getattr(target, '_p_changed', 0) is None
+
+
+def ghost_ntiid_oid(target):
+    """
+    Return an OID NTIID for the persistent object *target* using only
+    its ``_p_oid`` and ``_p_jar``, so that it is not activated.
+
+    The specific part is what :func:`nti.externalization.oids.to_external_oid`
+    produces without an intid; the provider is :data:`GHOST_OID_PROVIDER`.
+    """
+    oid = target._p_oid
+    if not oid:
+        return None
+    specific = b'0x' + binascii.hexlify(oid.lstrip(b'\x00'))
+    jar = target._p_jar
+    if jar is not None:
+        db_name = jar.db().database_name
+        if not isinstance(db_name, bytes):
+            db_name = db_name.encode('utf-8')
+        specific += b':' + binascii.hexlify(db_name)
+    return make_ntiid(provider=GHOST_OID_PROVIDER,
+                      nttype=TYPE_OID,
+                      specific=specific.decode('ascii'))
+
+
+def _ghost_href(target, state):
+    # An href for the ghost *target* found without loading it: a path
+    # already computed for it in this request or by the lineage cache,
+    # or its OID under the dataserver root. None if none is possible.
+    cache = current_link_rendering_cache()
+    if cache is not None:
+        path = cache.peek_path(target)
+        if path is not None:
+            return path
+    lineage = lineage_path_cache()
+    if lineage is not None:
+        path = lineage.peek(target)
+        if path is not None:
+            return path
+    ds_root = state.dataserver_root()
+    if ds_root is None:
+        return None
+    # Ghosts always have an OID.
+    ntiid = ghost_ntiid_oid(target)
+    return _resource_path(ds_root) + '/Objects/' + classify_target(ntiid).quoted
+
+
+class _RenderingMode(threading.local):
+    lazy = False
+    deduplicate = False
+    activate_targets = True
+    pool = None
+    dumps = None
+    compact = None
+
+_mode = _RenderingMode()
+
+
+@contextmanager
+def ghost_safe_link_rendering():
+    """
+    A context manager that, for the current thread, renders links to
+    persistent objects that are ghosts without activating (loading)
+    them.
+
+    The href of a ghost is a path already computed for it in the
+    current :func:`~nti.links.caching.link_rendering_cache` or by the
+    :class:`~nti.links.caching.LineagePathCache`, if either has one. A
+    path from the lineage cache assumes the ghost itself hasn't moved
+    since it was cached (see :meth:`.LineagePathCache.peek`).
+
+    Otherwise, the href is an ``/Objects/`` href built from its OID
+    (see :func:`ghost_ntiid_oid`). That is a *different URL* from the
+    traversal path the same object renders with once it is loaded, or
+    outside this context manager, so clients comparing hrefs will not
+    see them as equal; the server must be able to resolve OID hrefs.
+
+    Properties that would need its state, such as its ``ntiid``, are
+    not rendered. Targets that are not ghosts, and ghosts when there is
+    no dataserver, render as usual.
+    """
+    old = _mode.activate_targets
+    _mode.activate_targets = False
+    try:
+        yield
+    finally:
+        _mode.activate_targets = old
+
+
+class _RenderState(object):
+    """
+    The lookups :func:`render_link` needs that do not depend on the
+    individual link. These are done lazily and at most once, so a
+    batch of links shares them.
+    """
+
+    _ds_root = _MISSING
+    _ntiid_root = _MISSING
+    _mapping_factory = None
+
+    #: How the href of the last link rendered was found; see
+    #: :mod:`nti.links.metrics`
+    branch = None
+
+    def __init__(self, nearest_site=None):
+        self.nearest_site = nearest_site
+        self.activate_targets = _mode.activate_targets
+        self.compact = _mode.compact
+        # Compact links are not encoded ahead of time
+        self.dumps = _mode.dumps if self.compact is None else None
+
+    def dataserver_root(self):
+        if self._ds_root is _MISSING:
+            root = _dataserver_root()
+            self._ds_root = self.nearest_site if root is None else root
+        return self._ds_root
+
+    def ntiid_root(self):
+        # The path under which NTIIDs of links without a creator go
+        if self._ntiid_root is _MISSING:
+            self._ntiid_root = _resource_path(self.dataserver_root())
+        return self._ntiid_root
+
+    def new_mapping(self):
+        factory = self._mapping_factory
+        if factory is None:
+            factory = _site_lookup(ILocatedExternalMapping, _lookup_mapping_factory)
+            self._mapping_factory = factory
+        return factory()
+
+
 def render_link(link, nearest_site=None):
     """
     :param link: The link to render. Optionally, the link may be
@@ -87,33 +358,302 @@ def render_link(link, nearest_site=None):
             site (probably the root).
     :param nearest_site: Currently unused.
     :type link: :class:`nti_interfaces.ILink`
+
+    .. seealso:: :func:`render_links` to render many links at once.
+    """
+    return _render_link(link, _RenderState(nearest_site))
+
+
+#: The maximum number of render plans kept; see :func:`_render_plan`.
+RENDER_PLAN_CACHE_SIZE = 1024
+
+_render_plans = {}
+
+
+class _RenderPlan(object):
+    """
+    What rendering needs to know about a link or target that depends
+    only on the interfaces it provides, derived once for each
+    specification instead of for each rendering.
     """
-    # pylint: disable=unused-variable
-    __traceback_info__ = link, nearest_site
 
+    __slots__ = ('sro', 'href_only', 'created', '_traversable')
+
+    def __init__(self, spec):
+        # A declaration that changes (classImplements, or a change to
+        # a base) gets a new resolution order, making this plan stale.
+        self.sro = spec.__sro__
+        self.href_only = spec.isOrExtends(ILinkExternalHrefOnly)
+        self.created = spec.isOrExtends(ICreated)
+        # Only asked about targets
+        self._traversable = None
+
+    def traversable(self, target):
+        if self._traversable is None:
+            self._traversable = bool(IShouldHaveTraversablePath.providedBy(target))
+        return self._traversable
+
+
+def _render_plan(obj):
+    # Note that this activates a persistent ghost.
+    spec = providedBy(obj)
+    plan = _render_plans.get(spec)
+    if plan is None or plan.sro is not spec.__sro__:
+        plan = _RenderPlan(spec)
+        if len(_render_plans) >= RENDER_PLAN_CACHE_SIZE:
+            _render_plans.clear()
+        _render_plans[spec] = plan
+    return plan
+
+
+def invalidate_render_plans(*unused_args):
+    """
+    Discard every render plan. Plans notice changed interface
+    declarations on their own; call this when what they are derived
+    from changes some other way, such as the interfaces of the
+    ``legacy`` extra becoming available.
+    """
+    _render_plans.clear()
+
+
+#: The default size of the cache enabled by :func:`enable_rendered_link_cache`.
+RENDERED_LINK_CACHE_SIZE = 10000
+
+_rendered_link_cache = None
+
+
+def enable_rendered_link_cache(maxsize=RENDERED_LINK_CACHE_SIZE):
+    """
+    Start memoizing the rendering of links whose target is a resource
+    path or NTIID string and that have nothing else (a creator, a
+    nearest site) that can change how they render.
+
+    Callers always get their own copy of a cached rendering.
+
+    :return: The :class:`~nti.links.caching.LRUCache` holding the
+        renderings, for statistics.
+    """
+    global _rendered_link_cache  # pylint: disable=global-statement
+    _rendered_link_cache = LRUCache(maxsize)
+    return _rendered_link_cache
+
+
+def disable_rendered_link_cache():
+    global _rendered_link_cache  # pylint: disable=global-statement
+    _rendered_link_cache = None
+
+
+def rendered_link_cache():
+    """
+    Return the cache enabled by :func:`enable_rendered_link_cache`, or
+    ``None``.
+    """
+    return _rendered_link_cache
+
+
+def invalidate_rendered_link_cache(*unused_args):
+    """
+    Discard everything in the rendered link cache. This is registered
+    as a subscriber for component registration events, because the
+    rendering of NTIIDs depends on the registered dataserver.
+    """
+    cache = _rendered_link_cache
+    if cache is not None:
+        cache.clear()
+
+
+_shared_rendered_link_cache = None
+
+
+def enable_shared_rendered_link_cache(path, **kwargs):
+    """
+    Start sharing the renderings that :func:`enable_rendered_link_cache`
+    would memoize with the other processes using the file at *path*,
+    whether or not that cache is also enabled. Reading the shared
+    cache costs more than reading that one, so enable both: renderings
+    found in the shared cache are added to the cache of the process.
+
+    The keyword arguments are passed to
+    :class:`~nti.links.shared.SharedLinkCache`.
+
+    :return: The :class:`~nti.links.shared.SharedLinkCache`.
+    """
+    # It needs fcntl, so only POSIX platforms can import it.
+    from nti.links.shared import SharedLinkCache
+    global _shared_rendered_link_cache  # pylint: disable=global-statement
+    disable_shared_rendered_link_cache()
+    _shared_rendered_link_cache = SharedLinkCache(path, **kwargs)
+    return _shared_rendered_link_cache
+
+
+def disable_shared_rendered_link_cache():
+    global _shared_rendered_link_cache  # pylint: disable=global-statement
+    cache, _shared_rendered_link_cache = _shared_rendered_link_cache, None
+    if cache is not None:
+        cache.close()
+
+
+def shared_rendered_link_cache():
+    """
+    Return the cache enabled by :func:`enable_shared_rendered_link_cache`,
+    or ``None``.
+    """
+    return _shared_rendered_link_cache
+
+
+def _rendered_link_key(link, state, plan, href_only):
+    # The key for the rendered link cache, or None if the rendering
+    # of *link* may depend on more than its own fields.
     target = link.target
-    assert target is not None
-    rel = link.rel
-    content_type = link.target_mime_type
-    content_type_derived_from_target = False
-    if not content_type:
-        content_type = nti_mimetype_from_object(target)
-        content_type_derived_from_target = True
+    if     state.nearest_site is not None \
+        or type(target) not in _STRING_TYPES \
+        or plan.created:
+        return None
+    info = classify_target(target)
+    if info.kind is INVALID:
+        return None
+    # NTIIDs are placed under the root of the dataserver of the
+    # current site.
+    root = state.ntiid_root() \
+        if info.is_ntiid and not _render_plan(target).traversable(target) else None
+    params = link.params
+    params = params.pairs if isinstance(params, LinkParams) else LinkParams(params or ()).pairs
+    return (link.rel,
+            target,
+            root,
+            tuple(link.elements),
+            params,
+            link.method,
+            link.title,
+            link.target_mime_type,
+            bool(link.ignore_properties_of_target),
+            bool(href_only))
+
 
-    href = None
+def _render_link(link, state):
+    sink = get_metrics_sink()
+    if sink is None:
+        result = _render_link_memoized(link, state)
+    else:
+        start = default_timer()
+        state.branch = BRANCH_CACHED
+        try:
+            result = _render_link_memoized(link, state)
+        except Exception as e:
+            record_error(sink, e)
+            raise
+        record_render(sink, state.branch, default_timer() - start)
+    if state.compact is not None:
+        # Renderings are cached in full; the table is the response's
+        result = state.compact.compact(result)
+    return result
+
+
+def _render_link_memoized(link, state):
+    plan = _render_plan(link)
+    href_only = getattr(link, 'href_only', False) or plan.href_only
+    cache = _rendered_link_cache
+    dumps = state.dumps
+    key = None
+    if cache is not None or _shared_rendered_link_cache is not None:
+        key = _rendered_link_key(link, state, plan, href_only)
+    if key is None:
+        result = _render_link_uncached(link, state, href_only)
+    elif dumps is not None and cache is not None:
+        return _render_json_cached(link, state, href_only, key)
+    else:
+        result = _render_link_cached(link, state, href_only, key)
+    return result if dumps is None else RenderedLinkJSON(result, dumps)
+
+
+def _render_json_cached(link, state, href_only, key):
+    # The fragments are cached beside the renderings they encode.
+    cache = _rendered_link_cache
+    dumps = state.dumps
+    json_key = (dumps, key)
+    try:
+        fragment = cache.get(json_key)
+    except TypeError:
+        # Unhashable elements or params
+        return RenderedLinkJSON(_render_link_uncached(link, state, href_only), dumps)
+    if fragment is None:
+        fragment = RenderedLinkJSON(_render_link_cached(link, state, href_only, key),
+                                    dumps)
+        cache.set(json_key, fragment)
+    return fragment
+
+
+def _render_link_cached(link, state, href_only, key):
+    cache = _rendered_link_cache
+    shared = _shared_rendered_link_cache
+    cached = None
+    if cache is not None:
+        try:
+            cached = cache.get(key)
+        except TypeError:
+            # Unhashable elements or params
+            return _render_link_uncached(link, state, href_only)
+    if cached is None and shared is not None:
+        cached = shared.get(key)
+        if cached is not None and cache is not None:
+            cache.set(key, cached)
+
+    if cached is None:
+        result = _render_link_uncached(link, state, href_only)
+        cached = result if isinstance(result, string_types) else tuple(result.items())
+        if cache is not None:
+            cache.set(key, cached)
+        if shared is not None:
+            shared.set(key, cached)
+    elif isinstance(cached, string_types):
+        result = cached
+    else:
+        result = state.new_mapping()
+        result.update(cached)
+    return result
+
+
+def _render_link_uncached(link, state, href_only):
+    if href_only:
+        return _render_href(link, state)
+    return _render_link_mapping(link, state)
+
+
+def _target_ntiid(target):
+    # The NTIID, if any, that the target provides or is, and its
+    # classification; also the classification of a string target.
+    # Each string is parsed at most once; see nti.links.targets
+    target_info = ntiid_info = None
+    ntiid_derived_from_target = False
     ntiid = getattr(target, 'ntiid', None) \
          or getattr(target, 'NTIID', None)
     if ntiid:
         ntiid_derived_from_target = True
-    elif isinstance(target, string_types) and is_valid_ntiid_string(target):
-        ntiid = target
-        ntiid_derived_from_target = False  # it *is* the target
+        ntiid_info = classify_target(ntiid)
+    elif isinstance(target, string_types):
+        target_info = classify_target(target)
+        if target_info.is_ntiid:
+            ntiid = target
+            ntiid_info = target_info
+            ntiid_derived_from_target = False  # it *is* the target
+    return ntiid, ntiid_info, ntiid_derived_from_target, target_info
+
 
-    if ntiid and not IShouldHaveTraversablePath.providedBy(target):
+def _href(link, state, ghost_href, ntiid, ntiid_info, target_info):
+    # pylint: disable=unused-variable
+    nearest_site = state.nearest_site
+    __traceback_info__ = link, nearest_site
+
+    target = link.target
+    if ghost_href is not None:
+        href = ghost_href
+        state.branch = BRANCH_GHOST
+    elif ntiid and not _render_plan(target).traversable(target):
         # Although (enclosures and entities and other things with IShouldHaveTraversablePath)
         # have an NTIID, we want to avoid using it
         # if possible because it has a much nicer pretty url.
         href = ntiid
+        state.branch = BRANCH_NTIID_BACKDOOR
         # We're using ntiid as a backdoor for arbitrary strings.
         # But if it really is an NTIID, then direct it specially if
         # we can.
@@ -129,81 +669,647 @@ def render_link(link, nearest_site=None):
         # This legacy behaviour is activated by the installation of the `legacy` extras, specifically
         # the inclusion of IShouldHaveTraversablePath from nti.coremetadata.
         # https://github.com/NextThought/nti.links/issues/2
-        if is_valid_ntiid_string(ntiid):
+        if ntiid_info is not None and ntiid_info.is_ntiid:
             # In the past, if the link was not ICreated, the root would become
             # the nearest site. But not all site objects support the Objects and
             # NTIIDs traversal. So the simplest thing to do is to use the root
             # site
             # This may not be quite correct for NTIIDs in the future?
             # It should always be correct for OIDs though.
-            try:
-                ds_root = component.getUtility(IDataserver).root
-            except LookupError:
-                msg = "No dataserver found, you must have provided a site. Only in test cases"
-                logger.warn(msg)
-                ds_root = nearest_site
+            ds_root = state.dataserver_root()
             root = _root_for_ntiid_link(link, ds_root)
 
-            if is_ntiid_of_type(ntiid, TYPE_OID):
-                href = root + '/Objects/' + urllib_parse.quote(ntiid)
+            if ntiid_info.kind is OID_NTIID:
+                href = root + '/Objects/' + ntiid_info.quoted
+                state.branch = BRANCH_NTIID_OBJECTS
             else:
-                href = root + '/NTIIDs/' + urllib_parse.quote(ntiid)
+                href = root + '/NTIIDs/' + ntiid_info.quoted
+                state.branch = BRANCH_NTIID_NTIIDS
 
-    elif is_valid_resource_path(target):
+    elif (target_info.is_resource_path if target_info is not None
+          else is_valid_resource_path(target)):
         href = target
+        state.branch = BRANCH_RESOURCE_PATH
     else:
         # This will raise a LocationError or TypeError if something is broken
         # in the chain. That shouldn't happen and needs to be dealt with
         # at dev time.
         # next fun puts target in __traceback_info__
-        __traceback_info__ = rel, link.elements
-        href = normal_resource_path(target)
+        __traceback_info__ = link.rel, link.elements
+        state.branch = BRANCH_TRAVERSAL
+        try:
+            href = _resource_path(target)
+        except (TypeError, LocationError) as e:
+            # Every link to the target would fail the same way
+            failed = failed_target_cache()
+            if failed is not None:
+                failed.add(target, e)
+            raise
 
     assert href
 
-    # Join any additional path segments that were requested
-    if link.elements:
-        href = href + ('/' if not href.endswith('/') else '')
-        href += '/'.join(link.elements)
-    if link.params:
-        href = href + '?%s' % urllib_parse.urlencode(link.params)
+    template = getattr(link, 'template', None)
+    if template is not None:
+        href = template.href(href)
+    else:
+        # Join any additional path segments that were requested
+        if link.elements:
+            href = href + ('/' if not href.endswith('/') else '')
+            href += '/'.join(link.elements)
+        params = link.params
+        if params:
+            query = params.query_string if isinstance(params, LinkParams) \
+                    else urllib_parse.urlencode(params)
+            href = href + '?' + query
+
+    if      not is_valid_resource_path(href) \
+        and not is_valid_ntiid_string(href):  # pragma: no cover
+        # This shouldn't be possible anymore.
+        __traceback_info__ = href, link, target, nearest_site
+        raise TraversalError(href)
+    return href
+
+
+def _render_href(link, state):
+    # Only the href of an ILinkExternalHrefOnly link is externalized,
+    # so nothing else (the ntiid field, the mapping) is derived.
+    target = link.target
+    assert target is not None
+    if not state.activate_targets and _is_ghost(target):
+        ghost_href = _ghost_href(target, state)
+        if ghost_href is not None:
+            return _href(link, state, ghost_href, None, None, None)
+    ntiid, ntiid_info, _, target_info = _target_ntiid(target)
+    return _href(link, state, None, ntiid, ntiid_info, target_info)
+
+
+def _external_fields(link):
+    # The fields of the external form that come from the link alone:
+    # those before the ntiid, and those after.
+    # Only an explicit target_mime_type is ever emitted; one derived
+    # from the target would be ignored, so it is not computed. If a
+    # method was provided, the type is emitted regardless of
+    # ignore_properties_of_target.
+    content_type = link.target_mime_type
+    if content_type and (link.method or not link.ignore_properties_of_target):
+        type_fields = (('type', content_type),)
+    else:
+        type_fields = ()
+    trailing_fields = []
+    if link.method:
+        trailing_fields.append(('method', link.method))
+    if link.title:
+        trailing_fields.append(('title', link.title))
+    return type_fields, tuple(trailing_fields)
+
+
+def _render_link_mapping(link, state):
+    target = link.target
+    assert target is not None
+    # Nothing may be read from a ghost that isn't activating it
+    ghost_href = None
+    if not state.activate_targets and _is_ghost(target):
+        ghost_href = _ghost_href(target, state)
+    if ghost_href is None:
+        ntiid, ntiid_info, ntiid_derived_from_target, target_info = _target_ntiid(target)
+    else:
+        ntiid = ntiid_info = target_info = None
+        ntiid_derived_from_target = False
+    ntiid_is_valid = ntiid_info is not None and ntiid_info.is_ntiid
+
+    href = _href(link, state, ghost_href, ntiid, ntiid_info, target_info)
+
+    template = getattr(link, 'template', None)
+    if template is None:
+        type_fields, trailing_fields = _external_fields(link)
+    else:
+        fields = template.external_fields
+        if fields is None:
+            fields = template.external_fields = _external_fields(link)
+        type_fields, trailing_fields = fields
 
-    result = component.getMultiAdapter((), ILocatedExternalMapping)
+    result = state.new_mapping()
     result.update({StandardExternalFields.CLASS: 'Link',
                    StandardExternalFields.HREF: href,
-                   'rel': rel})
-    if content_type:
-        # If a method was provided, do not try to infer from the target object,
-        # must be explicit
-        if link.method and link.target_mime_type:
-            result['type'] = content_type
-        elif not link.method:
-            if      not link.ignore_properties_of_target \
-                and not content_type_derived_from_target:
-                result['type'] = content_type
-
-    if is_valid_ntiid_string(ntiid):
+                   'rel': link.rel})
+    result.update(type_fields)
+
+    if ntiid_is_valid:
         if not link.ignore_properties_of_target or not ntiid_derived_from_target:
             result['ntiid'] = ntiid
 
-    if link.method:
-        result['method'] = link.method
+    result.update(trailing_fields)
+    return result
 
-    if link.title:
-        result['title'] = link.title
 
-    if      not is_valid_resource_path(href) \
-        and not is_valid_ntiid_string(href):  # pragma: no cover
-        # This shouldn't be possible anymore.
-        __traceback_info__ = href, link, target, nearest_site
-        raise TraversalError(href)
+@interface.provider(ILinkExternalMappingFactory)
+@interface.implementer(ILocatedExternalMapping)
+class RenderedLinkDict(dict):
+    """
+    A minimal mapping for rendered links: a ``dict`` that provides
+    ``ILocatedExternalMapping``, with slots for its ``__parent__``,
+    ``__name__``, ``__acl__`` and ``mimeType`` and no room for anything
+    else. As for a ``LocatedExternalDict``, these are ``None`` (an
+    empty ``__acl__``) until they are set.
 
-    if ILinkExternalHrefOnly_providedBy(link):
-        # The marker that identifies the link should be replaced by just the href
-        # Because of the decorator, it's easiest to just do this here
-        result = result['href']
+    Links are rendered into ``LocatedExternalDict`` objects unless
+    this (or another
+    :class:`~nti.links.interfaces.ILinkExternalMappingFactory`) is
+    registered::
 
-    return result
+        <utility component="nti.links.externalization.RenderedLinkDict"
+                 provides="nti.links.interfaces.ILinkExternalMappingFactory" />
+
+    They are smaller and quicker to make; encoders treat them exactly
+    as they treat a ``dict``.
+    """
+
+    __slots__ = ('__parent__', '__name__', '__acl__', 'mimeType')
+
+    def __getattr__(self, name):
+        # Only called for slots that haven't been set (and for
+        # attributes that don't exist).
+        try:
+            return _RENDERED_LINK_DICT_DEFAULTS[name]
+        except KeyError:
+            raise AttributeError(name)
+
+_RENDERED_LINK_DICT_DEFAULTS = {
+    '__parent__': None,
+    '__name__': None,
+    '__acl__': (),
+    'mimeType': None,
+}
+
+
+@interface.implementer(IInternalObjectExternalizer)
+class RenderedLinkJSON(_RawJSON):
+    """
+    A rendered link together with its JSON encoding, which
+    :func:`render_link` returns while :func:`json_link_rendering` is
+    in effect.
+
+    If ``simplejson`` is installed, this is a ``simplejson.RawJSON``,
+    which ``simplejson`` writes out as it is, without encoding it
+    again. That is only what it would have written for the rendered
+    link if the fragment was encoded with the same options, and
+    without indentation: ``simplejson.dumps(..., indent=2)`` would not
+    indent it. Encoders that externalize objects they don't know (such
+    as those of :mod:`nti.externalization`) encode the rendered link
+    from :meth:`toExternalObject` instead; other encoders, such as the
+    standard library's :mod:`json`, can't encode it at all.
+    :func:`json_link_rendering` only returns these for encoders that
+    write them out as they would the rendered link.
+
+    Instances are immutable, so they may be cached and shared.
+
+    .. attribute:: encoded_json
+
+       The JSON encoding of the rendered link.
+    """
+
+    __slots__ = ('encoded_json', '_record')
+
+    def __init__(self, rendered, dumps):
+        # pylint: disable=super-init-not-called
+        self.encoded_json = dumps(rendered)
+        if isinstance(rendered, string_types):
+            self._record = rendered
+        else:
+            self._record = tuple(rendered.items())
+
+    def toExternalObject(self, **unused_kwargs):
+        """
+        Return the rendered link, a new mapping (or an href string)
+        each time.
+        """
+        record = self._record
+        if isinstance(record, string_types):
+            return record
+        result = _RenderState().new_mapping()
+        result.update(record)
+        return result
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self.encoded_json)
+
+
+class LinkRenderingFailure(object):
+    """
+    Stands in for a link that :func:`render_links` could not render.
+    """
+
+    __slots__ = ('link', 'exc_info')
+
+    def __init__(self, link, exc_info):
+        self.link = link
+        self.exc_info = exc_info
+
+    @property
+    def error(self):
+        return self.exc_info[1]
+
+    def reraise(self):
+        six.reraise(*self.exc_info)
+
+    def __repr__(self):
+        return "<%s %r %r>" % (type(self).__name__, self.link, self.error)
+
+
+def _render_iter(links, state):
+    failed = failed_target_cache()
+    for link in links:
+        # pylint: disable=unused-variable
+        __traceback_info__ = link
+        if not ILink_providedBy(link):
+            yield link
+            continue
+        if failed is not None:
+            error = failed.get(link.target)
+            if error is not None:
+                yield LinkRenderingFailure(link, (type(error), error, None))
+                continue
+        try:
+            rendered = _render_link(link, state)
+        except Exception:  # pylint: disable=broad-except
+            rendered = LinkRenderingFailure(link, sys.exc_info())
+        yield rendered
+
+
+def _render_pooled(links, nearest_site, pool):
+    # Render chunks of the links in the workers of *pool*, with the
+    # site, cache and mode of this thread.
+    site = getSite()
+    cache = current_link_rendering_cache()
+    size = pool.chunksize
+    # The states capture this thread's rendering mode.
+    tasks = [(links[i:i + size], _RenderState(nearest_site))
+             for i in range(0, len(links), size)]
+
+    def render_chunk(task):
+        with current_site(site), shared_link_rendering_cache(cache):
+            return list(_render_iter(*task))
+
+    for rendered in pool.map(render_chunk, tasks):
+        for x in rendered:
+            yield x
+
+
+def _threads_may_load(links, pool):
+    # Whether threads of *pool* could activate persistent targets,
+    # which a ZODB connection doesn't allow.
+    from nti.links.pool import THREAD
+    if pool.kind != THREAD or not _mode.activate_targets:
+        return False
+    for link in links:
+        if getattr(getattr(link, 'target', None), '_p_jar', None) is not None:
+            return True
+    return False
+
+
+def _render_batch(links, nearest_site, pool):
+    if pool is not None:
+        links = list(links)
+        if len(links) >= pool.threshold:
+            if not _threads_may_load(links, pool):
+                return _render_pooled(links, nearest_site, pool)
+            _error_log(logging.WARNING, 'persistent targets in threads',
+                       "Not rendering links to persistent objects with %r; "
+                       "use ghost_safe_link_rendering or a gevent pool", pool)
+    return _render_iter(links, _RenderState(nearest_site))
+
+
+def render_links(links, nearest_site=None, pool=None):
+    """
+    Render each of the *links* as :func:`render_link` would.
+
+    Lookups that do not depend on the individual link, such as the
+    dataserver root and the external mapping factory, are done once
+    for the whole batch.
+
+    If a :class:`~nti.links.pool.LinkRenderingPool` is given as *pool*,
+    large batches are rendered by its workers; see :mod:`nti.links.pool`
+    for what that requires.
+
+    :return: A list with one entry for each of the *links*, in order.
+        Rendered links are exactly what :func:`render_link` returns;
+        objects that are not :class:`~nti.links.interfaces.ILink` are
+        passed through unchanged, and links that raised an exception
+        are represented by a :class:`LinkRenderingFailure`.
+    """
+    return list(_render_batch(links, nearest_site, pool))
+
+
+def iter_rendered_links(links, nearest_site=None, pool=None):
+    """
+    Lazily render the *links*, one at a time as the result is iterated.
+
+    Objects that are not links are passed through unchanged. Like
+    :class:`LinkExternalObjectDecorator`, links that raise
+    ``TypeError`` or ``LocationError`` are left out, and any other
+    exception propagates. Those that are left out are logged through
+    :func:`link_error_log`, at most once a minute for each relation
+    and class of target. (With
+    :func:`~nti.links.caching.enable_failed_target_cache`, links to
+    targets that failed recently are left out without trying again.)
+
+    Rendering happens while the caller iterates, so the component
+    site (and any :func:`~nti.links.caching.link_rendering_cache`)
+    that the links need must still be active then. With a *pool* (see
+    :func:`render_links`), a large batch is rendered all at once when
+    iteration begins.
+    """
+    for rendered in _without_failures(_render_batch(links, nearest_site, pool)):
+        yield rendered
+
+
+def _without_failures(results):
+    # The rendered links in *results*, leaving out (and logging) those
+    # that failed with TypeError or LocationError.
+    sink = get_metrics_sink()
+    count = 0
+    for rendered in results:
+        if isinstance(rendered, LinkRenderingFailure):
+            if not isinstance(rendered.error, (TypeError, LocationError)):
+                rendered.reraise()
+            link = rendered.link
+            _error_log(logging.ERROR, (link.rel, type(link.target).__name__),
+                       "Error rendering link %s: %r", link, rendered.error)
+            if sink is not None:
+                sink.incr('decorator.swallowed_errors')
+            continue
+        count += 1
+        yield rendered
+    if sink is not None:
+        sink.observe('decorator.links_per_object', count)
+
+
+# What render_external_links finds in the values of a type
+_SCALAR = 0
+_MAPPING = 1
+_SEQUENCE = 2
+_OTHER = 3
+
+_SCALAR_TYPES = (six.text_type, six.binary_type, int, float, bool, type(None)) \
+    + six.integer_types
+
+_kinds = {}
+
+
+def _kind(kind_type):
+    kind = _kinds.get(kind_type)
+    if kind is None:
+        if issubclass(kind_type, _SCALAR_TYPES):
+            kind = _SCALAR
+        elif issubclass(kind_type, _MutableMapping):
+            kind = _MAPPING
+        elif issubclass(kind_type, _MutableSequence):
+            kind = _SEQUENCE
+        else:
+            kind = _OTHER
+        _kinds[kind_type] = kind
+    return kind
+
+
+def _count_links(values):
+    count = 0
+    for value in values:
+        if ILink_providedBy(value):
+            count += 1
+    return count
+
+
+def _is_link_container(value):
+    # Such as a LinkCollection, but not deferred links
+    return hasattr(value, '__iter__') \
+        and not isinstance(value, (LazyRenderedLinks, _MutableMapping))
+
+
+def render_external_links(external, nearest_site=None, mark=False):
+    """
+    Render, in place, every link anywhere in *external*, a finished
+    external structure of mutable mappings and sequences.
+
+    This does in one pass, without recursion (so structures of any
+    depth are fine), what :class:`LinkExternalObjectDecorator` does at
+    each level: the ``Links`` of a mapping become a list of the
+    rendered links, leaving out those that raise ``TypeError`` or
+    ``LocationError`` (see :func:`iter_rendered_links`), and links
+    that are items of sequences (or other values of mappings) are
+    replaced by their rendering, letting any exception propagate. All
+    the links share the lookups of one batch (see
+    :func:`render_links`).
+
+    Mappings and sequences that provide
+    :class:`~nti.links.interfaces.ILinksRendered` are not looked
+    into, nor are the deferred ``Links`` of
+    :func:`lazy_link_rendering`. If *mark* is true, the mappings and
+    sequences looked into are marked that way afterwards (those that
+    can be), so walking them again costs nothing.
+
+    :param external: A mapping or sequence.
+    :return: The number of links rendered (or left out).
+    """
+    state = _RenderState(nearest_site)
+    count = 0
+    kinds = _kinds
+    seen = set()
+    walked = []
+    stack = [(external, _kind(type(external)))]
+    while stack:
+        obj, obj_kind = stack.pop()
+        if id(obj) in seen or ILinksRendered_providedBy(obj):
+            continue
+        seen.add(id(obj))
+        walked.append(obj)
+
+        links = None
+        rendered_links = None
+        for key, value in (obj.items() if obj_kind is _MAPPING else enumerate(obj)):
+            kind = kinds.get(type(value))
+            if kind is None:
+                kind = _kind(type(value))
+            if kind is _SCALAR:
+                continue
+            if kind is _OTHER and ILink_providedBy(value):
+                if links is None:
+                    links = []
+                links.append((key, value))
+            elif key == LINKS and (kind is _SEQUENCE or _is_link_container(value)):
+                found = list(value)
+                found_count = _count_links(found)
+                if found_count:
+                    count += found_count
+                    rendered_links = list(_without_failures(_render_iter(found, state)))
+            elif kind is not _OTHER:
+                stack.append((value, kind))
+        # Not while iterating over them
+        if rendered_links is not None:
+            obj[LINKS] = rendered_links
+        if links is not None:
+            count += len(links)
+            rendered = _render_iter([link for _, link in links], state)
+            for (key, _), x in zip(links, rendered):
+                if isinstance(x, LinkRenderingFailure):
+                    x.reraise()
+                obj[key] = x
+
+    if mark:
+        for obj in walked:
+            try:
+                interface.alsoProvides(obj, ILinksRendered)
+            except AttributeError:
+                # Such as a plain dict or list
+                pass
+    return count
+
+
+class LazyRenderedLinks(object):
+    """
+    An iterable of the rendered form of some links, which are only
+    rendered as it is iterated; see :func:`iter_rendered_links`.
+
+    :class:`LinkExternalObjectDecorator` puts these in place of the
+    ``Links`` list while :func:`lazy_link_rendering` is in effect.
+    They are meant for encoders that stream iterables, such as
+    ``simplejson`` with ``iterable_as_array=True``; each iteration
+    renders the links again.
+    """
+
+    __slots__ = ('links', 'nearest_site')
+
+    def __init__(self, links, nearest_site=None):
+        self.links = links
+        self.nearest_site = nearest_site
+
+    def __iter__(self):
+        return iter_rendered_links(self.links, self.nearest_site)
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.links)
+
+
+@contextmanager
+def deduplicated_link_rendering():
+    """
+    A context manager that, for the current thread, makes
+    :class:`LinkExternalObjectDecorator` drop the links in the
+    ``Links`` of a mapping with the same
+    :attr:`~nti.links.links.Link.identity_key` as an earlier one,
+    typically contributed by several decorators, before rendering
+    them.
+    """
+    old = _mode.deduplicate
+    _mode.deduplicate = True
+    try:
+        yield
+    finally:
+        _mode.deduplicate = old
+
+
+@contextmanager
+def lazy_link_rendering():
+    """
+    A context manager that, for the current thread, makes
+    :class:`LinkExternalObjectDecorator` defer rendering: the
+    ``Links`` of mappings become :class:`LazyRenderedLinks`, and links
+    in sequences are left for the encoder to render with
+    :func:`iter_rendered_links`.
+
+    Use this around the externalization of large collections that
+    are then written out with a streaming encoder.
+    """
+    old = _mode.lazy
+    _mode.lazy = True
+    try:
+        yield
+    finally:
+        _mode.lazy = old
+
+
+def _writes_fragments(dumps):
+    # Whether *dumps* writes a RenderedLinkJSON out exactly as it
+    # writes the rendering it holds.
+    rendered = {'href': '/', 'rel': 'self'}
+    try:
+        return dumps([RenderedLinkJSON(rendered, dumps)]) == dumps([rendered])
+    except (TypeError, ValueError):
+        return False
+
+
+@contextmanager
+def json_link_rendering(dumps=None):
+    """
+    A context manager that, for the current thread, makes
+    :func:`render_link` (and so :func:`render_links` and
+    :class:`LinkExternalObjectDecorator`) return each rendered link as
+    a :class:`RenderedLinkJSON`, encoded with *dumps*.
+
+    *dumps* must be the function (with the options) of the encoder
+    that writes the result, so that the fragments hold exactly what it
+    would have written; by default, that of
+    :mod:`nti.externalization`. With
+    :func:`enable_rendered_link_cache`, the fragments are cached too,
+    and links that render the same are encoded only once.
+
+    If *dumps* would not write a fragment out the way it writes the
+    rendered link (because it indents, or can't encode fragments),
+    links are rendered as usual instead.
+    """
+    if dumps is None:
+        from nti.externalization.representation import to_json_representation_externalized
+        dumps = to_json_representation_externalized
+    if not _writes_fragments(dumps):
+        dumps = None
+    old = _mode.dumps
+    _mode.dumps = dumps
+    try:
+        yield
+    finally:
+        _mode.dumps = old
+
+
+@contextmanager
+def compact_link_rendering(base=None):
+    """
+    A context manager that, for the current thread, makes
+    :func:`render_link` (and so :func:`render_links` and
+    :class:`LinkExternalObjectDecorator`) render links in the compact
+    form described in :mod:`nti.links.compact`, for clients that ask
+    for it.
+
+    Use it around the externalization of a whole response, which must
+    then include the mapping returned by the
+    :meth:`~nti.links.compact.CompactLinkTable.external` method of the
+    :class:`~nti.links.compact.CompactLinkTable` this yields.
+    :func:`json_link_rendering` has no effect while this is in effect.
+
+    :param str base: If given, hrefs starting with it are written
+        relative to it.
+    """
+    old = _mode.compact
+    _mode.compact = table = CompactLinkTable(base)
+    try:
+        yield table
+    finally:
+        _mode.compact = old
+
+
+@contextmanager
+def concurrent_link_rendering(pool):
+    """
+    A context manager that, for the current thread, makes
+    :class:`LinkExternalObjectDecorator` render large lists of links
+    with the workers of *pool*, a
+    :class:`~nti.links.pool.LinkRenderingPool`. Errors are handled
+    exactly as without it.
+    """
+    old = _mode.pool
+    _mode.pool = pool
+    try:
+        yield pool
+    finally:
+        _mode.pool = old
 
 
 @component.adapter(ILink)
@@ -224,35 +1330,67 @@ _MutableMapping = collections.MutableMapping
 _MutableSequence = collections.MutableSequence
 
 ILink_providedBy = ILink.providedBy
-ILinkExternalHrefOnly_providedBy = ILinkExternalHrefOnly.providedBy
+ILinksRendered_providedBy = ILinksRendered.providedBy
 
 LINKS = StandardExternalFields.LINKS
 
 
+def _deduplicated(links):
+    # The links without those whose identity key was already seen,
+    # in order. Other objects are kept.
+    seen = set()
+    result = []
+    for link in links:
+        if ILink_providedBy(link):
+            try:
+                key = link.identity_key
+                if key in seen:
+                    continue
+                seen.add(key)
+            except (AttributeError, TypeError):
+                # Another ILink implementation, or unhashable params
+                pass
+        result.append(link)
+    return result
+
+
 @component.adapter(object)
 @interface.implementer(IExternalObjectDecorator)
 class LinkExternalObjectDecorator(Singleton):
     """
     An object decorator which (comes after the mapping decorators)
     to clean up any links that are added by decorators that didn't get rendered.
+
+    The ``Links`` of a mapping may be any iterable of links, such as a
+    list or a :class:`~nti.links.links.LinkCollection`; they are
+    replaced by a list of the rendered links.
     """
 
     def decorateExternalObject(self, unused_context, obj):
-        if isinstance(obj, _MutableSequence):
-            for i, x in enumerate(obj):
-                if ILink_providedBy(x):
-                    obj[i] = render_link(x)
+        if _mode.lazy:
+            self._defer(obj)
+        elif isinstance(obj, _MutableSequence):
+            indexes = [i for i, x in enumerate(obj) if ILink_providedBy(x)]
+            if indexes:
+                rendered = render_links([obj[i] for i in indexes], pool=_mode.pool)
+                sink = get_metrics_sink()
+                if sink is not None:
+                    sink.observe('decorator.links_per_object', len(indexes))
+                for i, x in zip(indexes, rendered):
+                    if isinstance(x, LinkRenderingFailure):
+                        x.reraise()
+                    obj[i] = x
         elif isinstance(obj, _MutableMapping) and obj.get(LINKS, ()):
-            links = []
-            for link in obj[LINKS]:
-                # pylint: disable=unused-variable
-                __traceback_info__ = link
-                try:
-                    if ILink_providedBy(link):
-                        rendered = render_link(link)
-                    else:
-                        rendered = link
-                    links.append(rendered)
-                except (TypeError, LocationError):
-                    logger.error("Error rendering link %s", link)
-            obj[LINKS] = links
+            links = obj[LINKS]
+            if _mode.deduplicate:
+                links = _deduplicated(links)
+            obj[LINKS] = list(iter_rendered_links(links, pool=_mode.pool))
+
+    def _defer(self, obj):
+        if      isinstance(obj, _MutableMapping) \
+            and obj.get(LINKS, ()) \
+            and not isinstance(obj[LINKS], LazyRenderedLinks):
+            links = obj[LINKS]
+            if _mode.deduplicate:
+                links = _deduplicated(links)
+            obj[LINKS] = LazyRenderedLinks(links)
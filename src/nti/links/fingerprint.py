@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fingerprints of links, computed without rendering them.
+
+A fingerprint is a digest of what determines how a sequence of links
+renders: for each link, its relation, elements, parameters, method,
+title and mime type, and the identity and version of its target (and
+creator). It changes when any of those change, so it can serve as
+(part of) an ETag, answering a conditional request before the links,
+or the object that has them, are externalized::
+
+    etag = links_fingerprint(context.links)
+    if etag is not None and etag in request.if_none_match:
+        return HTTPNotModified()
+
+Targets are identified as follows:
+
+- A string is its own identity.
+- A persistent object is identified by its OID and serial (its
+  transaction id), so it changes whenever the object does. A ghost
+  is loaded to find its serial.
+- Other objects can't be identified in a way that is stable from one
+  request to the next, so a sequence of links with one of them has no
+  fingerprint, unless they provide (or are adapted to)
+  :class:`~nti.links.interfaces.ILinkTargetVersion`. In that case
+  the version must identify the object, too.
+
+The serial of a persistent object doesn't change when one of its
+*containers* is moved or renamed, though that changes its path. If
+that can happen, targets should provide an
+:class:`~nti.links.interfaces.ILinkTargetVersion`, whose version is
+included for persistent objects as well.
+
+A fingerprint covers only the links. Anything else that changes how
+they render (the site, or the code of this package, which is what
+:data:`FINGERPRINT_VERSION` is for) must be part of the ETag too.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import marshal
+import hashlib
+
+import six
+
+from six.moves import urllib_parse
+
+from nti.links.interfaces import ILinkTargetVersion
+from nti.links.interfaces import ILinkExternalHrefOnly
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Included in every fingerprint; incremented when a change to this
+#: package changes how the same links render.
+FINGERPRINT_VERSION = 1
+
+# See nti.links.shared
+_MARSHAL_VERSION = 2 if six.PY3 else 0
+
+
+def _version(target):
+    versioned = ILinkTargetVersion(target, None)
+    return None if versioned is None else versioned.version
+
+
+def _target_inputs(target):
+    # None if the target can't be identified
+    if isinstance(target, six.string_types):
+        return target
+    oid = getattr(target, '_p_oid', None)
+    if oid is not None:
+        if getattr(target, '_p_changed', 0) is None:
+            # A ghost's serial isn't known until it is loaded
+            target._p_activate()
+        return (oid, target._p_serial, _version(target))
+    version = _version(target)
+    if version is None:
+        return None
+    return (type(target).__module__, type(target).__name__, version)
+
+
+def _link_inputs(link):
+    # None if the link has no fingerprint
+    target = _target_inputs(link.target)
+    if target is None:
+        return None
+    creator = getattr(link, 'creator', None)
+    if creator is not None:
+        creator = _target_inputs(creator)
+        if creator is None:
+            return None
+    params = link.params
+    if params:
+        query = getattr(params, 'query_string', None)
+        if query is None:
+            query = urllib_parse.urlencode(params)
+    else:
+        query = None
+    href_only = getattr(link, 'href_only', False) or ILinkExternalHrefOnly.providedBy(link)
+    return (link.rel,
+            target,
+            creator,
+            tuple(link.elements or ()),
+            query,
+            link.method,
+            link.title,
+            link.target_mime_type,
+            bool(link.ignore_properties_of_target),
+            bool(href_only))
+
+
+def links_fingerprint(links):
+    """
+    Return a fingerprint of the *links*, in order, as a string of hex
+    digits, or ``None`` if one of them has a target (or creator) that
+    can't be identified.
+
+    Anything in *links* that isn't a link, such as a link that has
+    already been rendered, is included by value, if it is made of
+    strings, numbers, and containers of those.
+    """
+    digest = hashlib.sha1(str(FINGERPRINT_VERSION).encode('ascii'))
+    for link in links:
+        if hasattr(link, 'target') and hasattr(link, 'rel'):
+            inputs = _link_inputs(link)
+            if inputs is None:
+                return None
+        elif hasattr(link, 'items'):
+            inputs = tuple(link.items())
+        else:
+            inputs = link
+        try:
+            encoded = marshal.dumps(inputs, _MARSHAL_VERSION)
+        except ValueError:
+            return None
+        digest.update(encoded)
+    return digest.hexdigest()
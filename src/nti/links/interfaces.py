@@ -61,6 +61,10 @@ class ILinkExternalHrefOnly(ILink):
     A marker interface intended to be used when a link
     object should be externalized as its 'href' value only and
     not the wrapping object.
+
+    Links with a true ``href_only`` attribute (see
+    :class:`nti.links.links.Link`) are externalized the same way
+    without providing this interface.
     """
 
 
@@ -69,3 +73,66 @@ class ILinked(interface.Interface):
     Something that possess links to other objects.
     """
     links = Iterable(title=u'Iterator over the ILinks this object contains.')
+
+
+class ILinksRendered(interface.Interface):
+    """
+    A marker for an external mapping or sequence in which every link,
+    at any depth, has been rendered, so that
+    :func:`~nti.links.externalization.render_external_links` doesn't
+    look inside it.
+    """
+
+
+class ILinkExternalMappingFactory(interface.Interface):
+    """
+    A utility that creates the mappings links are rendered into,
+    instead of the ``ILocatedExternalMapping`` factory of
+    :mod:`nti.externalization` (see
+    :class:`nti.links.externalization.RenderedLinkDict`).
+    """
+
+    def __call__():  # pylint: disable=no-method-argument
+        """
+        Return a new, empty mapping that provides
+        ``ILocatedExternalMapping``.
+        """
+
+
+class ILinkTargetVersion(interface.Interface):
+    """
+    The version of a link target, included in the fingerprints of the
+    links to it (see :mod:`nti.links.fingerprint`).
+
+    Targets may provide this themselves, or be adapted to it.
+    """
+
+    version = interface.Attribute(
+        """
+        A string or number that changes whenever the rendering of a
+        link to the target may change, such as when the target or one
+        of its containers is moved or renamed.
+        """)
+
+
+class ILinkMetricsSink(interface.Interface):
+    """
+    Receives the metrics recorded while rendering links.
+
+    See :mod:`nti.links.metrics`.
+    """
+
+    def incr(name, count=1):
+        """
+        Add *count* to the counter *name*.
+        """
+
+    def timing(name, seconds):
+        """
+        Record a duration, in seconds, in the histogram *name*.
+        """
+
+    def observe(name, value):
+        """
+        Record *value* in the histogram *name*.
+        """
@@ -13,17 +13,233 @@ from __future__ import absolute_import
 import six
 from functools import total_ordering
 
+from collections import OrderedDict
+
+from six.moves import intern
+from six.moves import urllib_parse
+from six.moves import collections_abc
+
 from zope import interface
 
 from nti.links.interfaces import ILink
+from nti.links.interfaces import ILinked
 from nti.links.interfaces import ILinkExternalHrefOnly
 
 logger = __import__('logging').getLogger(__name__)
 
 
+def _intern(s):
+    # Only native strings can be interned (on Python 2, unicode can't).
+    return intern(s) if type(s) is str else s  # pylint: disable=unidiomatic-typecheck
+
+
+#: The maximum number of distinct ``elements`` tuples shared
+#: between :class:`CompactLink` instances.
+SHARED_ELEMENTS_LIMIT = 1024
+
+_shared_elements = {}
+
+
+def _share_elements(elements):
+    # Return an equal tuple already in use by another link, if any.
+    if type(elements) is not tuple:  # pylint: disable=unidiomatic-typecheck
+        return elements
+    try:
+        return _shared_elements[elements]
+    except KeyError:
+        if len(_shared_elements) < SHARED_ELEMENTS_LIMIT:
+            _shared_elements[elements] = elements
+    except TypeError:  # pragma: no cover
+        # Unhashable members.
+        pass
+    return elements
+
+
+class LinkParams(collections_abc.Mapping):
+    """
+    An immutable mapping of query string parameters that encodes
+    itself at most once; see :attr:`query_string`.
+
+    Links keep their ``params`` in one of these. It is constructed like
+    a ``dict``, keeping the order of the parameters, and compares equal
+    to a ``dict`` with the same items. A sequence of pairs may repeat a
+    name; all of its values are encoded (see :attr:`pairs`), while the
+    mapping has the last one, as a ``dict`` would.
+    """
+
+    __slots__ = ('_params', '_pairs', '_query_string')
+
+    def __init__(self, params=(), **kwargs):
+        if hasattr(params, 'items'):
+            params = params.items()
+        self._pairs = tuple(params) + tuple(kwargs.items())
+        self._params = OrderedDict(self._pairs)
+        self._query_string = None
+
+    @property
+    def pairs(self):
+        """
+        The parameters as a tuple of ``(name, value)`` pairs, in order,
+        including repeated names.
+        """
+        return self._pairs
+
+    @property
+    def query_string(self):
+        """
+        The parameters encoded with ``urlencode``.
+        """
+        if self._query_string is None:
+            self._query_string = urllib_parse.urlencode(self._pairs)
+        return self._query_string
+
+    def __getitem__(self, key):
+        return self._params[key]
+
+    def __iter__(self):
+        return iter(self._params)
+
+    def __len__(self):
+        return len(self._params)
+
+    def _repeats(self):
+        return len(self._pairs) != len(self._params)
+
+    def __eq__(self, other):
+        if isinstance(other, LinkParams) and (self._repeats() or other._repeats()):
+            return self._pairs == other._pairs
+        return collections_abc.Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(frozenset(self._pairs))
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, list(self._pairs))
+
+
+def _link_params(params):
+    if params is None or isinstance(params, LinkParams):
+        return params
+    return LinkParams(params)
+
+
+def _has_identity_equality(target):
+    # Reading the type of a persistent object doesn't activate it.
+    return type(target).__eq__ is object.__eq__
+
+
+def _target_hash(target):
+    if isinstance(target, six.string_types):
+        return hash(target)
+    if _has_identity_equality(target):
+        return id(target)
+    try:
+        return hash(target)
+    except TypeError:
+        # Compared by value, but unhashable
+        return 0
+
+
+def _link_hash(link):
+    elements = link.elements
+    try:
+        elements = hash(tuple(elements)) if elements else 0
+    except TypeError:
+        elements = 0
+    return hash((link.rel, _target_hash(link.target), elements))
+
+
+def _target_key(target):
+    if isinstance(target, six.string_types):
+        return target
+    # Neither of these activates a persistent object
+    oid = getattr(target, '_p_oid', None)
+    if oid is not None:
+        return (oid, id(getattr(target, '_p_jar', None)))
+    return id(target)
+
+
+def _params_key(params):
+    if not params:
+        return None
+    if isinstance(params, LinkParams):
+        return params
+    return tuple(params.items()) if hasattr(params, 'items') else tuple(params)
+
+
 @total_ordering
+class _AbstractLink(object):
+    """
+    Comparison, hashing and pickling shared by the link implementations.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        # Its very easy to get into an infinite recursion here
+        # if the target wants to print its links
+        return "<Link rel='%s' %s/%s>" % (self.rel,
+                                          type(self.target),
+                                          id(self.target))
+
+    def __hash__(self):
+        # Not cached: links may still be changed after they are made.
+        return _link_hash(self)
+
+    def __eq__(self, other):
+        try:
+            return self is other or (self.rel == other.rel and
+                                     self.target == other.target and
+                                     self.elements == other.elements)
+        except AttributeError:  # pragma: no cover
+            return NotImplemented
+
+    @property
+    def identity_key(self):
+        """
+        A hashable key of everything about this link that its
+        rendering depends on: its relation, target (by OID, string
+        value, or identity), elements, parameters, method, title,
+        target MIME type, whether the properties of the target are
+        ignored, whether only its href is rendered, and its creator,
+        if it has one. Links with equal keys render the same way.
+        """
+        creator = getattr(self, 'creator', None)
+        return (self.rel,
+                _target_key(self.target),
+                tuple(self.elements or ()),
+                _params_key(self.params),
+                self.method,
+                self.title,
+                self.target_mime_type,
+                bool(self.ignore_properties_of_target),
+                bool(self.href_only) or ILinkExternalHrefOnly.providedBy(self),
+                None if creator is None else _target_key(creator))
+
+    def __lt__(self, other):
+        try:
+            return (self.rel, self.target, self.elements) < (other.rel, other.target, other.elements)
+        except AttributeError:  # pragma: no cover
+            return NotImplemented
+
+    def __gt__(self, other):
+        try:
+            return (self.rel, self.target, self.elements) > (other.rel, other.target, other.elements)
+        except AttributeError:  # pragma: no cover
+            return NotImplemented
+
+    def __reduce_ex__(self, protocol):
+        raise TypeError("Not allowed to pickle")
+
+    def __reduce__(self):
+        return self.__reduce_ex__(0)
+
+
 @interface.implementer(ILink)
-class Link(object):
+class Link(_AbstractLink):
     """
     Default implementation of ILink.
     These are non-persistent and should be generated at runtime.
@@ -36,6 +252,8 @@ class Link(object):
     elements = ()
     target_mime_type = None
     ignore_properties_of_target = False
+    href_only = False
+    template = None
 
     def __init__(self,
                  target,
@@ -45,7 +263,8 @@ class Link(object):
                  method=None,
                  title=None,
                  params=None,
-                 ignore_properties_of_target=False):
+                 ignore_properties_of_target=False,
+                 href_only=False):
         """
         :param target: The destination object for this link. Required to be
                 non-``None``. The exact value of what is accepted depends on
@@ -60,12 +279,16 @@ class Link(object):
         :keyword str title: If given, a human-readable description for the link
                 (usually localized).
         :keyword dict params: If given, a dictionary of query string parameters
-                that will be added to the link. You should not mutate this dictionary
-                after giving it to us, we may copy it.
+                that will be added to the link. It is copied into an immutable
+                :class:`LinkParams` (unless it already is one).
         :keyword bool ignore_properties_of_target: If given and ``True``, this
                 will cause the externalization process to ignore any information
                 that would otherwise be derived from the ``target``, such as its
                 ntiid and mime type.
+        :keyword bool href_only: If given and ``True``, the link will be
+                externalized as just its href, as if it provided
+                :class:`~nti.links.interfaces.ILinkExternalHrefOnly`, but
+                without the cost of ``interface.alsoProvides``.
         """
         # pylint: disable=unused-variable
         __traceback_info__ = target, rel, elements, target_mime_type
@@ -85,49 +308,71 @@ class Link(object):
         if title:
             self.title = title
         if params is not None:
-            self.params = params
+            self.params = _link_params(params)
         if ignore_properties_of_target:
             self.ignore_properties_of_target = True
+        if href_only:
+            self.href_only = True
 
-    def __repr__(self):
-        # Its very easy to get into an infinite recursion here
-        # if the target wants to print its links
-        return "<Link rel='%s' %s/%s>" % (self.rel,
-                                          type(self.target),
-                                          id(self.target))
 
-    def __hash__(self):
-        # In infinite recursion cases we do a terrible job. We only
-        # really work in simple cases
-        if isinstance(self.target, six.string_types):
-            return hash(self.rel + self.target)
-        return hash(self.rel)
+@interface.implementer(ILink)
+class CompactLink(_AbstractLink):
+    """
+    An implementation of ILink that uses ``__slots__`` instead of an
+    instance dictionary, for applications that keep large numbers of
+    links alive.
 
-    def __eq__(self, other):
-        try:
-            return self is other or (self.rel == other.rel and
-                                     self.target == other.target and
-                                     self.elements == other.elements)
-        except AttributeError:  # pragma: no cover
-            return NotImplemented
+    It accepts the same arguments as :class:`Link` and compares equal
+    to it. The ``rel`` and ``method`` strings are interned, and equal
+    ``elements`` tuples are shared between instances.
 
-    def __lt__(self, other):
-        try:
-            return (self.rel, self.target, self.elements) < (other.rel, other.target, other.elements)
-        except AttributeError:  # pragma: no cover
-            return NotImplemented
+    Because there is no instance dictionary, arbitrary attributes
+    (such as ``creator``) cannot be set, and interfaces cannot be
+    provided directly by instances; use a subclass instead.
+    """
 
-    def __gt__(self, other):
-        try:
-            return (self.rel, self.target, self.elements) > (other.rel, other.target, other.elements)
-        except AttributeError:  # pragma: no cover
-            return NotImplemented
+    __slots__ = (
+        'rel',
+        'target',
+        'elements',
+        'target_mime_type',
+        'method',
+        'title',
+        'params',
+        'ignore_properties_of_target',
+        'href_only',
+        'template',
+        '__weakref__',
+    )
 
-    def __reduce_ex__(self, protocol):
-        raise TypeError("Not allowed to pickle")
+    mime_type = Link.mime_type
 
-    def __reduce__(self):
-        return self.__reduce_ex__(0)
+    def __init__(self,
+                 target,
+                 rel=u'alternate',
+                 elements=(),
+                 target_mime_type=None,
+                 method=None,
+                 title=None,
+                 params=None,
+                 ignore_properties_of_target=False,
+                 href_only=False):
+        """
+        See :class:`Link`.
+        """
+        # pylint: disable=unused-variable
+        __traceback_info__ = target, rel, elements, target_mime_type
+        assert target is not None
+        self.rel = _intern(rel)
+        self.target = target
+        self.elements = _share_elements(elements) if elements else ()
+        self.target_mime_type = target_mime_type or None
+        self.method = _intern(method) if method else None
+        self.title = title or None
+        self.params = _link_params(params)
+        self.ignore_properties_of_target = bool(ignore_properties_of_target)
+        self.href_only = bool(href_only)
+        self.template = None
 
 
 @interface.implementer(ILinkExternalHrefOnly)
@@ -135,3 +380,255 @@ class LinkExternalHrefOnly(Link):
     """
     A link implementation that always renders as a plain href.
     """
+
+    href_only = True
+
+
+class LinkTemplate(object):
+    """
+    Makes links of the same shape (relation, elements, parameters,
+    method and so on) to many targets, deriving what doesn't depend
+    on the target once.
+
+    It accepts the keyword arguments of :class:`Link` except for the
+    target, as well as the *factory* of the links. The links it makes
+    refer to it through their ``template`` attribute, so they must not
+    be changed afterwards.
+
+    For example::
+
+        edit = LinkTemplate(rel='edit', elements=('@@edit',), method='PUT')
+        links = edit.links(items)
+    """
+
+    __slots__ = (
+        'rel',
+        'elements',
+        'target_mime_type',
+        'method',
+        'title',
+        'params',
+        'ignore_properties_of_target',
+        'href_only',
+        'factory',
+        'path',
+        'query',
+        'external_fields',
+    )
+
+    def __init__(self,
+                 rel=u'alternate',
+                 elements=(),
+                 target_mime_type=None,
+                 method=None,
+                 title=None,
+                 params=None,
+                 ignore_properties_of_target=False,
+                 href_only=False,
+                 factory=Link):
+        self.rel = _intern(rel)
+        self.elements = _share_elements(tuple(elements))
+        self.target_mime_type = target_mime_type
+        self.method = _intern(method) if method else None
+        self.title = title
+        self.params = _link_params(params)
+        self.ignore_properties_of_target = ignore_properties_of_target
+        self.href_only = href_only
+        self.factory = factory
+        #: The elements joined as a path, or None if there are none.
+        self.path = '/'.join(self.elements) if self.elements else None
+        #: The query string suffix of the href, including the ``?``.
+        self.query = '?' + self.params.query_string if self.params else ''
+        #: The fields of the external form that don't depend on the
+        #: target, filled in by the renderer when first needed.
+        self.external_fields = None
+
+    def link(self, target):
+        """
+        Return a new link to *target*.
+        """
+        link = self.factory(target,
+                            rel=self.rel,
+                            elements=self.elements,
+                            target_mime_type=self.target_mime_type,
+                            method=self.method,
+                            title=self.title,
+                            params=self.params,
+                            ignore_properties_of_target=self.ignore_properties_of_target,
+                            href_only=self.href_only)
+        link.template = self
+        return link
+
+    def links(self, targets):
+        """
+        Return a list of new links, one to each of the *targets*.
+        """
+        return [self.link(target) for target in targets]
+
+    def render(self, targets, nearest_site=None, pool=None):
+        """
+        Return the rendered links to each of the *targets*; see
+        :func:`nti.links.externalization.render_links`.
+        """
+        from nti.links.externalization import render_links
+        return render_links(self.links(targets), nearest_site, pool)
+
+    def href(self, target_href):
+        """
+        Return the complete href of a link whose target is at
+        *target_href*.
+        """
+        path = self.path
+        if path is not None:
+            target_href += path if target_href.endswith('/') else '/' + path
+        return target_href + self.query
+
+    def __repr__(self):
+        return "<%s rel='%s' elements=%r>" % (type(self).__name__, self.rel, self.elements)
+
+
+class _Entry(object):
+
+    __slots__ = ('rel', 'value', 'factory')
+
+    def __init__(self, rel, value, factory):
+        self.rel = rel
+        self.value = value
+        self.factory = factory
+
+
+@interface.implementer(ILinked)
+class LinkCollection(object):
+    """
+    An ordered collection of links, indexed by relation.
+
+    Links can be looked up, replaced and removed by their ``rel`` in
+    constant time, and are iterated in the order they were added. A
+    link can also be added as a *factory*, a callable returning the
+    link (or ``None`` for no link) that is only called when the link
+    is first looked up or iterated, so relations that are never used,
+    or that are replaced or removed first, cost nothing.
+
+    :class:`~nti.links.externalization.LinkExternalObjectDecorator`
+    renders these when they are the ``Links`` of an external mapping,
+    and :meth:`append` lets decorators add to them as they would to a
+    list.
+    """
+
+    def __init__(self, links=()):
+        self._entries = OrderedDict()
+        self._by_rel = {}
+        self.extend(links)
+
+    def _add(self, rel, value, factory):
+        entry = _Entry(rel, value, factory)
+        self._entries[entry] = None
+        self._by_rel.setdefault(rel, []).append(entry)
+
+    def _link(self, entry):
+        if entry.factory:
+            link = entry.value()
+            if link is None:
+                self._discard(entry)
+                return None
+            entry.value = link
+            entry.factory = False
+        return entry.value
+
+    def _discard(self, entry):
+        del self._entries[entry]
+        entries = self._by_rel[entry.rel]
+        entries.remove(entry)
+        if not entries:
+            del self._by_rel[entry.rel]
+
+    def append(self, link):
+        self._add(link.rel, link, False)
+
+    def extend(self, links):
+        for link in links:
+            self.append(link)
+
+    def append_factory(self, rel, factory):
+        """
+        Add the link with relation *rel* returned by calling *factory*
+        when it is first needed.
+        """
+        self._add(rel, factory, True)
+
+    def _replace(self, rel, value, factory):
+        entries = self._by_rel.get(rel)
+        if not entries:
+            self._add(rel, value, factory)
+            return
+        first = entries[0]
+        for entry in entries[1:]:
+            self._discard(entry)
+        first.value = value
+        first.factory = factory
+
+    def replace(self, link):
+        """
+        Replace the links with the relation of *link* by it, in the
+        place of the first of them, or add it if there are none.
+        """
+        self._replace(link.rel, link, False)
+
+    def replace_factory(self, rel, factory):
+        """
+        Like :meth:`replace`, but with a factory as for
+        :meth:`append_factory`.
+        """
+        self._replace(rel, factory, True)
+
+    def remove(self, rel):
+        """
+        Remove all the links with relation *rel*.
+
+        :raises KeyError: If there are none.
+        """
+        for entry in list(self._by_rel[rel]):
+            self._discard(entry)
+
+    def get(self, rel, default=None):
+        """
+        Return the first link with relation *rel*, or *default*.
+        """
+        for entry in list(self._by_rel.get(rel, ())):
+            link = self._link(entry)
+            if link is not None:
+                return link
+        return default
+
+    def get_all(self, rel):
+        """
+        Return a list of the links with relation *rel*.
+        """
+        links = (self._link(entry) for entry in list(self._by_rel.get(rel, ())))
+        return [link for link in links if link is not None]
+
+    def rels(self):
+        """
+        Return the relations that have links, in order.
+        """
+        return list(OrderedDict((entry.rel, None) for entry in self._entries))
+
+    @property
+    def links(self):
+        return list(self)
+
+    def __contains__(self, rel):
+        return rel in self._by_rel
+
+    def __len__(self):
+        # Factories that return None are counted until called.
+        return len(self._entries)
+
+    def __iter__(self):
+        for entry in list(self._entries):
+            link = self._link(entry)
+            if link is not None:
+                yield link
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.rels())
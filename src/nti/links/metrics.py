@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of link rendering.
+
+Metrics are off by default, and cost a single function call per
+rendered link while off. Call :func:`enable_metrics` to start sending
+them to an :class:`~nti.links.interfaces.ILinkMetricsSink`: either the
+in-process :class:`MetricsRegistry` or, through
+:class:`StatsdMetricsSink`, a statsd client.
+
+The metrics are:
+
+``render.<branch>``
+    A counter and a timing for each link rendered, where ``branch``
+    is how :func:`~nti.links.externalization.render_link` found the
+    href; one of the ``BRANCH_`` constants in this module.
+``render.errors.<exception class>``
+    A counter of links that raised while rendering.
+``decorator.links_per_object``
+    The number of links rendered for each object by
+    :class:`~nti.links.externalization.LinkExternalObjectDecorator`.
+``decorator.swallowed_errors``
+    A counter of links the decorator dropped because they raised
+    ``TypeError`` or ``LocationError``.
+
+Whether or not metrics are enabled, those dropped links, and links
+rendered without a registered dataserver, are logged through a
+:class:`RateLimitedLog` (see
+:func:`~nti.links.externalization.link_error_log`), so a burst of
+identical failures makes one log record per kind per interval.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import bisect
+import logging
+import threading
+
+from collections import OrderedDict
+
+from timeit import default_timer
+
+from zope import interface
+
+from nti.links.interfaces import ILinkMetricsSink
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The target was an NTIID-looking string that isn't a valid NTIID,
+#: and is used as the href as-is.
+BRANCH_NTIID_BACKDOOR = 'ntiid_backdoor'
+#: The href was built from an OID NTIID under ``/Objects/``
+BRANCH_NTIID_OBJECTS = 'ntiid_objects'
+#: The href was built from another NTIID under ``/NTIIDs/``
+BRANCH_NTIID_NTIIDS = 'ntiid_ntiids'
+#: The target was a resource path string.
+BRANCH_RESOURCE_PATH = 'resource_path'
+#: The href was found by traversing the lineage of the target.
+BRANCH_TRAVERSAL = 'traversal'
+#: The rendering came from the rendered link cache.
+BRANCH_CACHED = 'cached'
+#: The target was a ghost rendered without activating it.
+BRANCH_GHOST = 'ghost'
+
+#: Upper bounds, in seconds, of the buckets of timing histograms.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 1.0)
+#: Upper bounds of the buckets of other histograms.
+VALUE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 10000)
+
+
+class Histogram(object):
+    """
+    A distribution of values counted into fixed buckets.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        bounds = list(self.bounds) + ['inf']
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'buckets': list(zip(bounds, self.buckets))}
+
+
+@interface.implementer(ILinkMetricsSink)
+class MetricsRegistry(object):
+    """
+    The default, in-process, sink. Counters and histograms are kept
+    in memory until :meth:`reset`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def _add(self, name, value, bounds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.add(value)
+
+    def timing(self, name, seconds):
+        self._add(name, seconds, LATENCY_BUCKETS)
+
+    def observe(self, name, value):
+        self._add(name, value, VALUE_BUCKETS)
+
+    def snapshot(self):
+        """
+        Return a JSON-compatible copy of the current metrics.
+        """
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'histograms': {k: v.snapshot() for k, v in self.histograms.items()}}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+@interface.implementer(ILinkMetricsSink)
+class StatsdMetricsSink(object):
+    """
+    Sends metrics to a statsd-style client, for example
+    :class:`perfmetrics.statsd.StatsdClient`, that has ``incr(name,
+    count)`` and ``timing(name, milliseconds)`` methods. Histograms
+    other than timings are also sent as timings, which statsd
+    aggregates the same way.
+    """
+
+    def __init__(self, client, prefix='nti.links.'):
+        self.client = client
+        self.prefix = prefix
+
+    def incr(self, name, count=1):
+        self.client.incr(self.prefix + name, count)
+
+    def timing(self, name, seconds):
+        self.client.timing(self.prefix + name, seconds * 1000.0)
+
+    def observe(self, name, value):
+        self.client.timing(self.prefix + name, value)
+
+
+_sink = None
+
+
+def enable_metrics(sink=None):
+    """
+    Start sending metrics to *sink*, by default a new
+    :class:`MetricsRegistry`.
+
+    :return: The sink.
+    """
+    global _sink  # pylint: disable=global-statement
+    _sink = MetricsRegistry() if sink is None else sink
+    return _sink
+
+
+def disable_metrics():
+    global _sink  # pylint: disable=global-statement
+    _sink = None
+
+
+def get_metrics_sink():
+    """
+    Return the sink enabled by :func:`enable_metrics`, or ``None``.
+    """
+    return _sink
+
+
+def record_render(sink, branch, seconds):
+    name = 'render.' + branch
+    sink.incr(name)
+    sink.timing(name, seconds)
+
+
+def record_error(sink, error):
+    sink.incr('render.errors.' + type(error).__name__)
+
+
+class RateLimitedLog(object):
+    """
+    Logs to the logger *log* at most one message per *interval*
+    seconds for each key, counting the others.
+
+    The first message for a key is logged; the messages for it in the
+    *interval* seconds that follow are only counted, and their number
+    is added to the next message for that key logged after the
+    interval. :meth:`flush` logs the counts still pending. At most
+    *maxkeys* keys are tracked; when there are more, the least
+    recently logged is dropped, with its count.
+    """
+
+    def __init__(self, log, interval=60.0, maxkeys=1000, clock=default_timer):
+        self.log = log
+        self.interval = interval
+        self.maxkeys = maxkeys
+        self.clock = clock
+        # key -> [time last logged, suppressed count]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, level, key, msg, *args):
+        """
+        Log the message *msg* % *args* at *level*, unless one was
+        logged for *key* less than :attr:`interval` seconds ago.
+
+        :return: Whether the message was logged.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self._entries.pop(key, None)
+            self._entries[key] = [now, 0]
+            if len(self._entries) > self.maxkeys:
+                self._entries.popitem(last=False)
+        if suppressed:
+            msg += " (and %d more for %r in the last %.0f seconds)"
+            args += (suppressed, key, self.interval)
+        self.log.log(level, msg, *args)
+        return True
+
+    def suppressed(self):
+        """
+        Return a dictionary of the keys with messages that have been
+        counted but not yet reported, and their counts.
+        """
+        with self._lock:
+            return {k: v[1] for k, v in self._entries.items() if v[1]}
+
+    def flush(self, level=logging.ERROR):
+        """
+        Log the counts of the messages not yet reported, and forget
+        all the keys.
+        """
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+        for key, (_, suppressed) in entries.items():
+            if suppressed:
+                self.log.log(level, "%d more link rendering messages for %r",
+                             suppressed, key)
+
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Worker pools for rendering large batches of links concurrently.
+
+A :class:`LinkRenderingPool` is given to
+:func:`~nti.links.externalization.render_links`,
+:func:`~nti.links.externalization.iter_rendered_links`, or, for
+:class:`~nti.links.externalization.LinkExternalObjectDecorator`,
+:func:`~nti.links.externalization.concurrent_link_rendering`. This
+pays off when rendering blocks, typically on storage I/O during the
+lineage walks of ``normal_resource_path``; rendering links whose
+targets are strings or loaded objects is CPU bound, and only slower
+with threads.
+
+Thread safety
+=============
+
+Rendered links come back in their original order, and failures are
+reported per link exactly as without a pool.
+
+The workers render with the component site and the
+:func:`~nti.links.caching.link_rendering_cache` that are current in
+the thread that submits the batch, and with its
+:func:`~nti.links.externalization.ghost_safe_link_rendering` setting.
+
+Reading from the zope component registries (global or site-local) is
+thread-safe, but registering or unregistering components while a
+batch is being rendered is not supported. The caches of this package
+(:func:`~nti.links.targets.classify_target`, the rendered link cache,
+and the metrics registry) are locked; the hit and miss counts of a
+shared :class:`~nti.links.caching.LinkRenderingCache` may be slightly
+off.
+
+A ZODB ``Connection`` is not thread-safe, so a thread pool must not
+be used to load (activate) objects of one connection from several
+threads at once. A :data:`THREAD` pool therefore renders batches with
+a persistent target (one with a ``_p_jar``) in the calling thread,
+logging a warning through
+:func:`~nti.links.externalization.link_error_log`, unless targets
+are not being activated (see
+:func:`~nti.links.externalization.ghost_safe_link_rendering`). The
+ancestors that the lineage walk of a loaded target may load are still
+the caller's responsibility. Under gevent the workers are greenlets
+of the submitting thread, which only switch while waiting on I/O,
+and all batches are rendered by them.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Use a pool of threads.
+THREAD = 'thread'
+
+#: Use a pool of gevent greenlets.
+GEVENT = 'gevent'
+
+
+def _gevent_threading_patched():
+    try:
+        from gevent.monkey import is_module_patched
+    except ImportError:  # pragma: no cover
+        return False
+    return is_module_patched('threading')
+
+
+class LinkRenderingPool(object):
+    """
+    A pool of workers rendering chunks of a batch of links.
+
+    :keyword int size: The number of workers.
+    :keyword str kind: :data:`THREAD` or :data:`GEVENT`. By default,
+        greenlets are used if gevent has monkey-patched ``threading``,
+        and threads otherwise.
+    :keyword int chunksize: The number of links each worker renders at a
+        time. Each chunk shares its lookups, like a call to
+        ``render_links`` does.
+    :keyword int threshold: Batches with fewer links than this are
+        rendered in the calling thread.
+
+    The workers are started when first needed and stopped by
+    :meth:`close`; pools are also context managers.
+    """
+
+    def __init__(self, size=4, kind=None, chunksize=64, threshold=128):
+        if kind is None:
+            kind = GEVENT if _gevent_threading_patched() else THREAD
+        if kind not in (THREAD, GEVENT):
+            raise ValueError("Unknown pool kind", kind)
+        self.size = size
+        self.kind = kind
+        self.chunksize = chunksize
+        self.threshold = threshold
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _workers(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == GEVENT:
+                    from gevent.pool import Pool
+                    self._pool = Pool(self.size)
+                else:
+                    self._pool = ThreadPool(self.size)
+            return self._pool
+
+    def map(self, func, items):
+        """
+        Return a list of ``func(item)`` for each of the *items*, in
+        order, called in the workers.
+        """
+        return self._workers().map(func, items)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        if self.kind == GEVENT:
+            pool.join()
+        else:
+            pool.close()
+            pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_args):
+        self.close()
+
+    def __repr__(self):
+        return "<%s kind=%s size=%d chunksize=%d threshold=%d>" % (type(self).__name__,
+                                                                  self.kind,
+                                                                  self.size,
+                                                                  self.chunksize,
+                                                                  self.threshold)
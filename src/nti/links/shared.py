@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A cache of rendered links shared by the processes of one machine.
+
+A :class:`SharedLinkCache` lives in a memory-mapped file, so every
+process that opens the same file (for example, all the workers of one
+application server) shares the links any of them has rendered, and a
+new process starts with a warm cache. It needs ``fcntl``, so it is
+only available on POSIX platforms. It is enabled with
+:func:`~nti.links.externalization.enable_shared_rendered_link_cache`
+and holds the same renderings as
+:func:`~nti.links.externalization.enable_rendered_link_cache`: links
+whose target is a resource path or NTIID string and that nothing but
+their own fields can change.
+
+File format
+===========
+
+The file starts with a header, followed by a fixed number of
+fixed-size slots; the cache never grows. A key is hashed to a digest,
+which picks its slot, and a new entry simply replaces whatever was in
+its slot. Each slot holds a sequence number, the generation it was
+written in, the digest of its key and the length of its record,
+followed by the record.
+
+Records are UTF-8 text. A link rendered as just its href is stored as
+``h`` followed by the href; a link rendered as a mapping is stored as
+``m`` followed by its names and values, in order, separated by NUL
+characters (see :func:`encode_record`). Links themselves can't be
+pickled, and these renderings have nothing but strings in them.
+
+Concurrency
+===========
+
+Reads take no locks. A writer makes the sequence number of the slot
+odd before changing it, and even again afterwards; a reader that sees
+an odd number, or a different number after reading the record, treats
+the entry as missing rather than waiting. Writers are serialized with
+an exclusive ``flock`` of the file.
+
+Invalidation
+============
+
+:meth:`SharedLinkCache.invalidate` starts a new generation; entries
+written in earlier generations are ignored, in all the processes.
+Unlike the cache of a single process, this is not done when components
+are registered, which happens in every process as it starts; all the
+processes sharing a file must render the same links the same way, so
+start a new generation (or use a new file) when deploying a change to
+how links render.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import mmap
+import fcntl
+import struct
+import marshal
+import hashlib
+import threading
+
+from contextlib import contextmanager
+
+import six
+
+from six import string_types
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The default number of slots.
+SLOTS = 8192
+
+#: The default size of a slot, in bytes. Records larger than this
+#: (less the slot header) aren't cached.
+SLOT_SIZE = 512
+
+_MAGIC = b'NTILNKC1'
+
+# magic, slots, slot size, generation
+_HEADER = struct.Struct('<8sIIQ')
+_HEADER_SIZE = 64
+_GENERATION = struct.Struct('<Q')
+_GENERATION_OFFSET = 16
+
+# sequence number, generation, key digest, record length
+_SLOT = struct.Struct('<QQ16sI')
+_SEQUENCE = struct.Struct('<Q')
+
+
+_HREF = b'h'
+_MAPPING = b'm'
+_SEPARATOR = u'\x00'
+
+
+def _text(value):
+    if not isinstance(value, string_types) or _SEPARATOR in value:
+        raise TypeError("Not a shareable value", value)
+    return value
+
+
+def encode_record(record):
+    """
+    Return the bytes stored for *record*, a rendered href string or a
+    sequence of ``(name, value)`` string pairs.
+
+    :raises TypeError: If the record holds anything other than
+        strings, or strings holding NUL characters.
+    """
+    if isinstance(record, string_types):
+        return _HREF + _text(record).encode('utf-8')
+    parts = []
+    for name, value in record:
+        parts.append(_text(name))
+        parts.append(_text(value))
+    return _MAPPING + _SEPARATOR.join(parts).encode('utf-8')
+
+
+def decode_record(data):
+    """
+    Return the record encoded in *data* by :func:`encode_record`: a
+    string, or a tuple of ``(name, value)`` pairs.
+    """
+    text = data[1:].decode('utf-8')
+    if data[:1] == _HREF:
+        return text
+    parts = iter(text.split(_SEPARATOR))
+    return tuple(zip(parts, parts))
+
+
+# The newest marshal format that doesn't depend on the identity of
+# the objects (strings being interned, or referred to more than once)
+_MARSHAL_VERSION = 2 if six.PY3 else 0
+
+
+def key_digest(key):
+    """
+    Return the 16 byte digest of *key*, a tuple of strings, numbers,
+    and other values that :mod:`marshal` supports, which is the same
+    in all processes running the same version of Python.
+
+    :raises TypeError: If *key* holds anything else.
+    """
+    try:
+        encoded = marshal.dumps(key, _MARSHAL_VERSION)
+    except ValueError:
+        raise TypeError("Not a shareable key", key)
+    return hashlib.sha1(encoded).digest()[:16]
+
+
+class SharedLinkCache(object):
+    """
+    A fixed-size cache of rendered link records in the memory-mapped
+    file at *path*, which is created if needed.
+
+    :keyword int slots: The number of entries.
+    :keyword int slot_size: The size of each entry in bytes.
+    :raises ValueError: If the file already exists with a different
+        number or size of slots, or isn't such a cache.
+    """
+
+    def __init__(self, path, slots=SLOTS, slot_size=SLOT_SIZE):
+        if slots < 1 or slot_size <= _SLOT.size:
+            raise ValueError("Invalid cache geometry", slots, slot_size)
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.hits = 0
+        self.misses = 0
+        self._capacity = slot_size - _SLOT.size
+        self._lock = threading.Lock()
+        size = _HEADER_SIZE + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with self._locked():
+                self._initialize(size)
+            self._map = mmap.mmap(self._fd, size)
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def _initialize(self, size):
+        existing = os.fstat(self._fd).st_size
+        if existing == 0:
+            os.ftruncate(self._fd, size)
+            os.write(self._fd, _HEADER.pack(_MAGIC, self.slots, self.slot_size, 0))
+            return
+        header = os.read(self._fd, _HEADER.size)
+        if len(header) < _HEADER.size or existing < _HEADER_SIZE:
+            raise ValueError("Not a shared link cache", self.path)
+        magic, slots, slot_size, _ = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError("Not a shared link cache", self.path)
+        if (slots, slot_size) != (self.slots, self.slot_size) or existing != size:
+            raise ValueError("Shared link cache has a different size",
+                             self.path, slots, slot_size)
+
+    @contextmanager
+    def _locked(self):
+        # Threads of one process share the file description, which
+        # flock doesn't tell apart.
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def generation(self):
+        return _GENERATION.unpack_from(self._map, _GENERATION_OFFSET)[0]
+
+    def _offset(self, digest):
+        index = struct.unpack_from('<Q', digest)[0] % self.slots
+        return _HEADER_SIZE + index * self.slot_size
+
+    def _read(self, digest):
+        data = self._map
+        generation = _GENERATION.unpack_from(data, _GENERATION_OFFSET)[0]
+        offset = self._offset(digest)
+        sequence, written, slot_digest, length = _SLOT.unpack_from(data, offset)
+        if     sequence & 1 \
+            or written != generation \
+            or slot_digest != digest \
+            or length > self._capacity:
+            return None
+        start = offset + _SLOT.size
+        record = data[start:start + length]
+        if _SEQUENCE.unpack_from(data, offset)[0] != sequence:
+            # Changed while we read it
+            return None
+        return record
+
+    def get(self, key, default=None):
+        """
+        Return the record cached for *key*, or *default*.
+        """
+        try:
+            digest = key_digest(key)
+        except TypeError:
+            return default
+        data = self._read(digest)
+        if data is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return decode_record(data)
+
+    def set(self, key, record):
+        """
+        Cache *record* for *key*, replacing whatever shares its slot.
+        Keys and records that can't be encoded, or that are too large
+        for a slot, are silently not cached.
+        """
+        try:
+            digest = key_digest(key)
+            encoded = encode_record(record)
+        except TypeError:
+            return
+        if len(encoded) > self._capacity:
+            return
+        data = self._map
+        offset = self._offset(digest)
+        start = offset + _SLOT.size
+        with self._locked():
+            sequence = _SEQUENCE.unpack_from(data, offset)[0]
+            # Odd while we write. (It's odd already if a writer died
+            # in the middle of it.)
+            sequence += 2 if sequence & 1 else 1
+            _SEQUENCE.pack_into(data, offset, sequence)
+            generation = _GENERATION.unpack_from(data, _GENERATION_OFFSET)[0]
+            _SLOT.pack_into(data, offset, sequence, generation, digest, len(encoded))
+            data[start:start + len(encoded)] = encoded
+            _SEQUENCE.pack_into(data, offset, sequence + 1)
+
+    def invalidate(self):
+        """
+        Start a new generation, discarding every entry for all the
+        processes using the file.
+        """
+        with self._locked():
+            _GENERATION.pack_into(self._map, _GENERATION_OFFSET, self.generation + 1)
+
+    def close(self):
+        if self._fd is None:
+            return
+        self._map.close()
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_args):
+        self.close()
+
+    def __repr__(self):
+        return "<%s %r slots=%d hits=%d misses=%d>" % (type(self).__name__,
+                                                       self.path,
+                                                       self.slots,
+                                                       self.hits,
+                                                       self.misses)
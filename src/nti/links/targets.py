@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Classification of string link targets.
+
+Rendering a link needs to know several things about its target
+string: whether it is an NTIID, whether that NTIID is an OID, whether
+it is a resource path, and its quoted form. Each of those checks
+parses the string again, so :func:`classify_target` does them once
+and remembers the answer for popular strings.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+import six
+from six.moves import urllib_parse
+
+from nti.links.caching import LRUCache
+
+from nti.ntiids.ntiids import TYPE_OID
+from nti.ntiids.ntiids import is_ntiid_of_type
+from nti.ntiids.ntiids import is_valid_ntiid_string
+
+from nti.traversal.traversal import is_valid_resource_path
+
+logger = __import__('logging').getLogger(__name__)
+
+#: An NTIID of type ``OID``
+OID_NTIID = 'oid-ntiid'
+#: Any other valid NTIID
+NTIID = 'ntiid'
+#: A path or URL, as defined by ``is_valid_resource_path``
+RESOURCE_PATH = 'resource-path'
+#: None of the above
+INVALID = 'invalid'
+
+#: How many distinct strings :func:`classify_target` remembers.
+TARGET_CACHE_SIZE = 10000
+
+
+class TargetInfo(namedtuple('TargetInfo', ('kind', 'quoted'))):
+    """
+    The classification of a target string.
+
+    .. attribute:: kind
+
+       One of :data:`OID_NTIID`, :data:`NTIID`, :data:`RESOURCE_PATH`
+       or :data:`INVALID`.
+
+    .. attribute:: quoted
+
+       For NTIIDs, the URL-quoted string; otherwise ``None``.
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_ntiid(self):
+        return self.kind is OID_NTIID or self.kind is NTIID
+
+    @property
+    def is_resource_path(self):
+        return self.kind is RESOURCE_PATH
+
+
+_INVALID = TargetInfo(INVALID, None)
+_RESOURCE_PATH = TargetInfo(RESOURCE_PATH, None)
+
+_cache = LRUCache(TARGET_CACHE_SIZE)
+
+_STRING_TYPES = (six.text_type, six.binary_type)
+
+
+def _classify(target):
+    if is_valid_ntiid_string(target):
+        kind = OID_NTIID if is_ntiid_of_type(target, TYPE_OID) else NTIID
+        return TargetInfo(kind, urllib_parse.quote(target))
+    if is_valid_resource_path(target):
+        return _RESOURCE_PATH
+    return _INVALID
+
+
+def classify_target(target):
+    """
+    Classify the string *target*, returning a :class:`TargetInfo`.
+
+    Results for strings are cached in a bounded LRU cache. Other
+    values are classified but never cached.
+    """
+    if not isinstance(target, _STRING_TYPES):
+        return _classify(target)
+    info = _cache.get(target)
+    if info is None:
+        info = _classify(target)
+        _cache.set(target, info)
+    return info
+
+
+def target_cache():
+    """
+    Return the :class:`~nti.links.caching.LRUCache` used by
+    :func:`classify_target`, for statistics or clearing.
+    """
+    return _cache
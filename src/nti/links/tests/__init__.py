@@ -20,7 +20,7 @@ class SharedConfiguringTestLayer(ZopeComponentLayer,
                                  GCLayerMixin,
                                  ConfiguringLayerMixin):
 
-    set_up_packages = ('nti.externalization', 'nti.ntiids', 'nti.links',)
+    set_up_packages = ('zope.location', 'nti.externalization', 'nti.ntiids', 'nti.links',)
 
     @classmethod
     def setUp(cls):
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import has_key
+from hamcrest import has_item
+from hamcrest import contains_string
+from hamcrest import assert_that
+from hamcrest import greater_than
+
+import json
+
+from six import StringIO
+
+import fudge
+
+from nti.links.benchmarks import bench_import
+from nti.links.benchmarks import bench_compact
+from nti.links.benchmarks import bench_memory
+from nti.links.benchmarks import bench_mapping
+
+from nti.links.benchmarks.suite import BENCHMARKS
+from nti.links.benchmarks.suite import compare
+from nti.links.benchmarks.suite import run_benchmarks
+
+from nti.links.compact import CompactLinkTable
+
+from nti.links.tests import LinksTestCase
+
+
+class TestBenchmarkSuite(LinksTestCase):
+
+    def test_run_and_compare(self):
+        results = run_benchmarks(repeat=1, min_time=0)
+        assert_that(list(results), is_(list(BENCHMARKS)))
+        for result in results.values():
+            assert_that(result['usec_per_op'], is_(greater_than(0)))
+
+        baseline = {'benchmarks': {'render_link.url': {'usec_per_op': 2.0},
+                                   'gone': {'usec_per_op': 1.0}}}
+        current = {'benchmarks': {'render_link.url': {'usec_per_op': 3.0},
+                                  'new': {'usec_per_op': 1.0}}}
+        out = StringIO()
+        ratios = compare(baseline, current, out)
+        assert_that(ratios, is_({'render_link.url': 1.5}))
+        assert_that(out.getvalue(), contains_string('1.50x'))
+
+    def test_run_named(self):
+        results = run_benchmarks(['render_link.url'], repeat=1, min_time=0)
+        assert_that(results, has_key('render_link.url'))
+        assert_that(len(results), is_(1))
+
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     zope.interface.ro
+import time:      1500 |       1620 |   nti.links.links
+import time:        30 |       1650 | nti.links
+"""
+
+
+class TestImportBenchmark(LinksTestCase):
+
+    def test_parse_importtime(self):
+        assert_that(bench_import.parse_importtime(IMPORTTIME + 'other output\n'),
+                    is_({'zope.interface.ro': (120, 120),
+                         'nti.links.links': (1500, 1620),
+                         'nti.links': (30, 1650)}))
+
+    def test_measure(self):
+        result = bench_import.measure('nti.links', repeat=1)
+        assert_that(result['ms'], is_(greater_than(0)))
+        assert_that(set(bench_import.RENDERING_MODULES).intersection(result['modules']),
+                    is_(set()))
+        assert_that(result['modules'], has_item('nti.links.links'))
+        with self.assertRaises(RuntimeError):
+            bench_import.measure('nti.links.does_not_exist', repeat=1)
+
+    def test_main(self):
+        results = {'nti.links': {'ms': 1.0, 'modules': ['nti.ntiids'],
+                                 'importtime': bench_import.parse_importtime(IMPORTTIME)},
+                   'nti.links.externalization': {'ms': 1.0, 'modules': [],
+                                                 'importtime': None}}
+        with fudge.patched_context(bench_import, 'measure',
+                                   lambda module, unused_repeat: results[module]):
+            out = StringIO()
+            with fudge.patched_context(bench_import.sys, 'stdout', out):
+                assert_that(bench_import.main(['--top', '1']), is_(1))
+            assert_that(out.getvalue(), contains_string('Loads rendering modules: nti.ntiids'))
+            assert_that(out.getvalue(), contains_string('nti.links.links'))
+
+            results['nti.links']['modules'] = []
+            with fudge.patched_context(bench_import.sys, 'stdout', StringIO()):
+                assert_that(bench_import.main([]), is_(0))
+
+            results['nti.links']['ms'] = 1e6
+            out = StringIO()
+            with fudge.patched_context(bench_import.sys, 'stdout', out):
+                assert_that(bench_import.main([]), is_(1))
+            assert_that(out.getvalue(), contains_string('OVER BUDGET'))
+
+
+class TestCompactBenchmark(LinksTestCase):
+
+    def test_main(self):
+        out = StringIO()
+        assert_that(bench_compact.main(['--items', '10', '--repeat', '1'], out), is_(0))
+        assert_that(out.getvalue(), contains_string('compact+base'))
+
+    def test_same_links(self):
+        links = bench_compact.collection_links(3)
+        full = json.loads(bench_compact.encode(links).decode('utf-8'))
+        for base in (None, bench_compact.BASE):
+            compact = json.loads(bench_compact.encode(links, base, True).decode('utf-8'))
+            table = CompactLinkTable(compact.get('LinkBase'))
+            table.prefixes = compact['LinkPrefixes']
+            assert_that([[table.expand(link) for link in item['Links']]
+                         for item in compact['Items']],
+                        is_([item['Links'] for item in full['Items']]))
+
+
+class TestMemoryBenchmark(LinksTestCase):
+
+    def test_main(self):
+        out = StringIO()
+        assert_that(bench_memory.main(['--count', '100'], out), is_(0))
+        assert_that(out.getvalue(), contains_string('CompactLink'))
+
+
+class TestMappingBenchmark(LinksTestCase):
+
+    def test_main(self):
+        out = StringIO()
+        assert_that(bench_mapping.main(['--links', '10', '--repeat', '1'], out), is_(0))
+        assert_that(out.getvalue(), contains_string('RenderedLinkDict'))
+
+    def test_measure(self):
+        with bench_mapping.link_dicts():
+            smaller = bench_mapping.measure(100, 1)
+        larger = bench_mapping.measure(100, 1)
+        assert_that(smaller['bytes'] < larger['bytes'], is_(True))
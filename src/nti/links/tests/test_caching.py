@@ -0,0 +1,634 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import gc
+import unittest
+
+import fudge
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.event import notify
+
+from zope.interface.registry import Components
+
+from zope.lifecycleevent import ObjectAddedEvent
+from zope.lifecycleevent import ObjectMovedEvent
+from zope.lifecycleevent import ObjectRemovedEvent
+
+from zope.location.interfaces import IRoot
+from zope.location.interfaces import LocationError
+from zope.location.interfaces import ILocation
+
+from nti.traversal.traversal import normal_resource_path
+
+from nti.base.interfaces import ICreated
+
+from nti.links.caching import LRUCache
+from nti.links.caching import ComponentLookupCache
+from nti.links.caching import FailedTargetCache
+from nti.links.caching import LineagePathCache
+from nti.links.caching import LinkRenderingCache
+from nti.links.caching import link_rendering_cache
+from nti.links.caching import lineage_path_cache
+from nti.links.caching import failed_target_cache
+from nti.links.caching import enable_failed_target_cache
+from nti.links.caching import disable_failed_target_cache
+from nti.links.caching import enable_lineage_path_cache
+from nti.links.caching import disable_lineage_path_cache
+from nti.links.caching import current_link_rendering_cache
+from nti.links.caching import component_lookup_cache
+from nti.links.caching import enable_component_lookup_cache
+from nti.links.caching import disable_component_lookup_cache
+from nti.links.caching import invalidate_component_lookups
+
+from nti.links.externalization import render_link
+from nti.links.externalization import render_links
+from nti.links.externalization import LinkExternalObjectDecorator
+from nti.links.externalization import _dataserver_root
+from nti.links.externalization import _root_for_ntiid_link
+from nti.links.externalization import RenderedLinkDict
+from nti.links.externalization import set_link_error_log
+
+from nti.links.interfaces import ILinkExternalMappingFactory
+
+from nti.links.links import Link
+
+from nti.links.tests import LinksTestCase
+
+
+class Creator(object):
+    pass
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert_that(cache.get('a'), is_(1))
+        cache.set('c', 3)
+        # 'b' was the least recently used
+        assert_that(cache.get('b'), is_(none()))
+        assert_that(cache.get('b', 42), is_(42))
+        assert_that(cache.get('a'), is_(1))
+        assert_that(cache.get('c'), is_(3))
+        cache.set('c', 4)
+        assert_that(cache.get('c'), is_(4))
+        assert_that(cache, has_length(2))
+        assert_that(cache.hits, is_(4))
+        assert_that(cache.misses, is_(2))
+        assert_that(repr(cache), is_('<LRUCache entries=2/2 hits=4 misses=2>'))
+
+        cache.clear()
+        assert_that(cache, has_length(0))
+        assert_that('a' in cache, is_(False))
+
+
+class TestLinkRenderingCache(unittest.TestCase):
+
+    def test_resource_path(self):
+        calls = []
+
+        def compute(obj):
+            calls.append(obj)
+            return '/dataserver2/users/ichigo'
+
+        cache = LinkRenderingCache()
+        creator = Creator()
+        for _ in range(3):
+            assert_that(cache.resource_path(creator, compute),
+                        is_('/dataserver2/users/ichigo'))
+        assert_that(calls, has_length(1))
+        assert_that(cache.hits, is_(2))
+        assert_that(cache.misses, is_(1))
+        assert_that(cache, has_length(1))
+
+    def test_weak_references(self):
+        cache = LinkRenderingCache()
+        creator = Creator()
+        cache.resource_path(creator, lambda unused: '/path')
+        assert_that(cache, has_length(1))
+        del creator
+        gc.collect()
+        assert_that(cache, has_length(0))
+
+    def test_not_weakly_referenceable(self):
+        cache = LinkRenderingCache()
+        assert_that(cache.resource_path(None, lambda unused: '/'), is_('/'))
+        assert_that(cache.resource_path(None, lambda unused: '/'), is_('/'))
+        assert_that(cache, has_length(0))
+        assert_that(cache.misses, is_(2))
+
+    def test_errors_not_cached(self):
+        cache = LinkRenderingCache()
+
+        def compute(unused):
+            raise TypeError()
+
+        creator = Creator()
+        for _ in range(2):
+            with self.assertRaises(TypeError):
+                cache.resource_path(creator, compute)
+        assert_that(cache, has_length(0))
+
+    def test_dataserver_root(self):
+        cache = LinkRenderingCache()
+        root = Creator()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return root
+        assert_that(cache.dataserver_root(compute), is_(same_instance(root)))
+        assert_that(cache.dataserver_root(compute), is_(same_instance(root)))
+        assert_that(calls, has_length(1))
+
+    def test_dataserver_root_not_weakly_referenceable(self):
+        cache = LinkRenderingCache()
+        assert_that(cache.dataserver_root(lambda: None), is_(none()))
+        assert_that(cache.dataserver_root(lambda: None), is_(none()))
+        assert_that(cache.misses, is_(2))
+
+    def test_context_manager(self):
+        assert_that(current_link_rendering_cache(), is_(none()))
+        with link_rendering_cache() as cache:
+            assert_that(current_link_rendering_cache(), is_(same_instance(cache)))
+            with link_rendering_cache() as inner:
+                assert_that(inner, is_(same_instance(cache)))
+            assert_that(current_link_rendering_cache(), is_(same_instance(cache)))
+        assert_that(current_link_rendering_cache(), is_(none()))
+        assert_that(repr(cache), is_('<LinkRenderingCache entries=0 hits=0 misses=0>'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_root_for_ntiid_link(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/tite.kubo').times_called(1)
+
+        @interface.implementer(ICreated)
+        class Bleach(object):
+            creator = Creator()
+        bleach = Bleach()
+
+        with link_rendering_cache() as cache:
+            for _ in range(5):
+                assert_that(_root_for_ntiid_link(Link(bleach)),
+                            is_('/dataserver2/users/tite.kubo'))
+        assert_that(cache.hits, is_(4))
+        assert_that(cache.misses, is_(1))
+
+    def test_cached_dataserver_lookup(self):
+        root = Creator()
+
+        class IDataserver(interface.Interface):
+            pass
+
+        @interface.implementer(IDataserver)
+        class Dataserver(object):
+            pass
+        dataserver = Dataserver()
+        dataserver.root = root
+
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(dataserver, IDataserver)
+        try:
+            with fudge.patched_context('nti.links.externalization',
+                                       'IDataserver', IDataserver):
+                with link_rendering_cache() as cache:
+                    assert_that(_dataserver_root(), is_(same_instance(root)))
+                    assert_that(_dataserver_root(), is_(same_instance(root)))
+                assert_that(cache.hits, is_(1))
+                assert_that(_dataserver_root(), is_(same_instance(root)))
+        finally:
+            gsm.unregisterUtility(dataserver, IDataserver)
+
+
+@interface.implementer(IRoot)
+class Root(object):
+    __name__ = None
+    __parent__ = None
+
+
+@interface.implementer(ILocation)
+class Location(object):
+
+    def __init__(self, parent, name):
+        self.__parent__ = parent
+        self.__name__ = name
+
+
+@interface.implementer(ILocation)
+class PersistentLocation(Persistent):
+    pass
+
+
+class _Jar(object):
+    # Loads the state last committed for an OID, with its serial
+
+    def __init__(self):
+        self.loads = 0
+        self.records = {}
+
+    def commit(self, obj, serial, parent, name):
+        self.records[obj._p_oid] = (serial, {'__parent__': parent, '__name__': name})
+
+    def register(self, obj):
+        pass
+
+    def setstate(self, obj):
+        self.loads += 1
+        serial, state = self.records[obj._p_oid]
+        obj.__setstate__(state)
+        obj._p_serial = serial
+
+
+class TestLineagePathCache(LinksTestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.ds = Location(Root(), u'dataserver2')
+        self.forum = Location(Location(self.ds, u'community'), u'forum')
+
+    def compute(self, obj):
+        self.calls.append(obj)
+        return normal_resource_path(obj)
+
+    def test_same_paths(self):
+        cache = LineagePathCache()
+        names = (u'topic', u'a topic', u'\xf1', u'', u'x/y', u"~!$&'()*+,;=:@-._")
+        for parent_name in names:
+            parent = Location(self.forum, parent_name)
+            for name in names:
+                child = Location(parent, name)
+                grandchild = Location(child, u'comment')
+                for obj in (grandchild, child, parent):
+                    assert_that(cache.path(obj, self.compute),
+                                is_(normal_resource_path(obj)))
+
+    def test_siblings_share_containers(self):
+        cache = LineagePathCache()
+        comments = [Location(Location(self.forum, u'topic%d' % i), u'comment')
+                    for i in range(10)]
+        for comment in comments:
+            cache.path(comment, self.compute)
+        # Only the top of the hierarchy was computed in full
+        assert_that(self.calls, is_([self.ds]))
+        assert_that(cache, has_length(23))
+        assert_that(cache.path(comments[0], self.compute),
+                    is_('/dataserver2/community/forum/topic0/comment'))
+        assert_that(cache.hits, is_(1))
+        assert_that(cache.misses, is_(10))
+        assert_that(repr(cache), is_('<LineagePathCache entries=23 hits=1 misses=10>'))
+
+    def test_moved_without_events(self):
+        cache = LineagePathCache()
+        topic = Location(self.forum, u'topic')
+        cache.path(topic, self.compute)
+        topic.__name__ = u'renamed'
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/community/forum/renamed'))
+        topic.__parent__ = self.ds
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/renamed'))
+
+    def test_persistent_ancestors(self):
+        jar = _Jar()
+        forum = PersistentLocation()
+        forum._p_oid = b'\x00' * 7 + b'\x12'
+        forum._p_jar = jar
+        jar.commit(forum, b'\x00' * 7 + b'\x01', self.forum.__parent__, u'forum')
+        forum._p_changed = False
+        forum._p_deactivate()
+        topic = Location(forum, u'topic')
+
+        cache = LineagePathCache()
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/community/forum/topic'))
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/community/forum/topic'))
+        assert_that(cache.hits, is_(1))
+
+        # Unloaded, but unchanged
+        forum._p_deactivate()
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/community/forum/topic'))
+        assert_that(cache.hits, is_(1))
+        assert_that(jar.loads, is_(2))
+
+        # Moved by another process, and invalidated here
+        jar.commit(forum, b'\x00' * 7 + b'\x02', self.ds, u'moved')
+        forum._p_invalidate()
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/moved/topic'))
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/moved/topic'))
+        assert_that(cache.hits, is_(2))
+
+        # Changed and committed here
+        forum.__name__ = u'renamed'
+        forum._p_changed = False
+        forum._p_serial = b'\x00' * 7 + b'\x03'
+        assert_that(cache.path(topic, self.compute),
+                    is_('/dataserver2/renamed/topic'))
+
+    def test_persistent_not_weakly_referenceable(self):
+        class Slotted(object):
+            __slots__ = ('__parent__', '__name__', '_p_jar', '_p_serial')
+        obj = Slotted()
+        obj.__parent__ = self.forum
+        obj.__name__ = u'slotted'
+        obj._p_jar = _Jar()
+        obj._p_serial = b'\x00' * 7 + b'\x01'
+        topic = Location(obj, u'topic')
+        cache = LineagePathCache()
+        for _ in range(2):
+            assert_that(cache.path(topic, self.compute),
+                        is_('/dataserver2/community/forum/slotted/topic'))
+        # It can't be known to be unchanged
+        assert_that(cache.hits, is_(0))
+
+    def test_peek(self):
+        cache = LineagePathCache()
+        topic = Location(self.forum, u'topic')
+        assert_that(cache.peek(topic), is_(none()))
+        cache.path(topic, self.compute)
+        # The location of the object itself isn't read
+        topic.__name__ = u'renamed'
+        assert_that(cache.peek(topic), is_('/dataserver2/community/forum/topic'))
+        assert_that(cache.hits, is_(1))
+
+        jar = _Jar()
+        forum = PersistentLocation()
+        forum._p_oid = b'\x00' * 7 + b'\x12'
+        forum._p_jar = jar
+        jar.commit(forum, b'\x00' * 7 + b'\x01', self.forum.__parent__, u'forum')
+        forum._p_changed = False
+        forum._p_deactivate()
+        topic = Location(forum, u'topic')
+        cache.path(topic, self.compute)
+        assert_that(cache.peek(topic), is_('/dataserver2/community/forum/topic'))
+        forum._p_invalidate()
+        assert_that(cache.peek(topic), is_(none()))
+
+    def test_errors(self):
+        cache = LineagePathCache()
+        orphan = Location(Location(Location(None, u'lost'), u'found'), u'child')
+
+        def compute(unused):
+            raise TypeError()
+        with self.assertRaises(TypeError):
+            cache.path(orphan, compute)
+        assert_that(cache, has_length(0))
+
+    def test_weak_references(self):
+        cache = LineagePathCache()
+        topic = Location(self.forum, u'topic')
+        cache.path(topic, self.compute)
+        assert_that(cache, has_length(4))
+        del topic
+        gc.collect()
+        assert_that(cache, has_length(3))
+        cache.discard(self.forum)
+        assert_that(cache, has_length(2))
+
+    def test_not_weakly_referenceable(self):
+        class Slotted(object):
+            __slots__ = ('__parent__', '__name__')
+        obj = Slotted()
+        obj.__parent__ = self.forum
+        obj.__name__ = u'slotted'
+        cache = LineagePathCache()
+        assert_that(cache.path(obj, self.compute),
+                    is_('/dataserver2/community/forum/slotted'))
+        assert_that(cache, has_length(3))
+
+    def test_events(self):
+        assert_that(lineage_path_cache(), is_(none()))
+        # Harmless when not enabled
+        notify(ObjectRemovedEvent(self.forum))
+        cache = enable_lineage_path_cache()
+        try:
+            assert_that(lineage_path_cache(), is_(same_instance(cache)))
+            topic = Location(self.forum, u'topic')
+            with fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                       self.compute):
+                assert_that(render_link(Link(topic))['href'],
+                            is_('/dataserver2/community/forum/topic'))
+                assert_that(render_link(Link(topic))['href'],
+                            is_('/dataserver2/community/forum/topic'))
+            assert_that(self.calls, is_([self.ds]))
+            assert_that(cache, has_length(4))
+
+            notify(ObjectAddedEvent(topic, self.forum, u'topic'))
+            assert_that(cache, has_length(3))
+            for event in (ObjectMovedEvent(self.forum, self.ds, u'forum',
+                                           self.ds, u'forum2'),
+                          ObjectRemovedEvent(self.forum)):
+                cache.path(topic, self.compute)
+                notify(event)
+                assert_that(cache, has_length(0))
+        finally:
+            disable_lineage_path_cache()
+        assert_that(lineage_path_cache(), is_(none()))
+
+
+class _Clock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFailedTargetCache(LinksTestCase):
+
+    def test_ttl(self):
+        clock = _Clock()
+        cache = FailedTargetCache(ttl=10, maxsize=2, clock=clock)
+        target = Creator()
+        assert_that(cache.get(target), is_(none()))
+        cache.add(target, LocationError(target, u'child'))
+        error = cache.get(target)
+        assert_that(error, is_(LocationError))
+        assert_that(error.args, is_((str(target), 'child')))
+
+        # Another object at the same address isn't confused with it
+        assert_that(cache.get(Creator()), is_(none()))
+
+        clock.now = 10
+        assert_that(cache.get(target), is_(none()))
+        assert_that(cache, has_length(0))
+        assert_that(repr(cache), is_('<FailedTargetCache entries=0/2 hits=1 misses=3>'))
+
+    def test_bounded(self):
+        cache = FailedTargetCache(maxsize=2)
+        targets = [Creator() for _ in range(3)]
+        for target in targets:
+            cache.add(target, TypeError())
+        assert_that(cache, has_length(2))
+        assert_that(cache.get(targets[0]), is_(none()))
+        assert_that(cache.get(targets[2]), is_(TypeError))
+
+        del target, targets
+        gc.collect()
+        assert_that(cache, has_length(0))
+
+        # Not strings, or other targets that can't be weakly referenced
+        cache.add(u'/dataserver2/broken', TypeError(u'broken'))
+        cache.add(42, TypeError())
+        assert_that(cache.get(u'/dataserver2/broken'), is_(none()))
+        assert_that(cache, has_length(0))
+        target = Creator()
+        cache.add(target, TypeError())
+        cache.discard(target)
+        assert_that(cache, has_length(0))
+        cache.add(target, TypeError())
+        cache.clear()
+        assert_that(cache, has_length(0))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_other_failures_not_remembered(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/target')
+        cache = enable_failed_target_cache()
+        try:
+            for target in (Location(None, u'target'), u'/dataserver2/target'):
+                # Only the first link is broken
+                decorated = {u'Links': [Link(target, rel=u'bad', elements=(1,)),
+                                        Link(target, rel=u'edit')]}
+                LinkExternalObjectDecorator().decorateExternalObject(None, decorated)
+                assert_that(decorated[u'Links'], has_length(1))
+                rendered = render_links([Link(target, rel=u'edit')])[0]
+                assert_that(rendered['href'], is_('/dataserver2/target'))
+            assert_that(cache, has_length(0))
+        finally:
+            disable_failed_target_cache()
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_rendering(self, mock_rp):
+        mock_rp.is_callable().raises(LocationError()).times_called(2)
+        broken = Location(None, u'broken')
+        links = [Link(broken), Link(broken, rel=u'edit'), Link(u'/dataserver2/help')]
+        assert_that(failed_target_cache(), is_(none()))
+        cache = enable_failed_target_cache()
+        try:
+            assert_that(failed_target_cache(), is_(same_instance(cache)))
+            for _ in range(3):
+                decorated = {u'Links': list(links)}
+                LinkExternalObjectDecorator().decorateExternalObject(None, decorated)
+                assert_that(decorated[u'Links'], has_length(1))
+            with self.assertRaises(LocationError):
+                LinkExternalObjectDecorator().decorateExternalObject(None, [Link(broken)])
+            assert_that(cache.hits, is_(6))
+
+            # Moving it may fix it
+            notify(ObjectMovedEvent(broken, None, u'broken', Root(), u'broken'))
+            assert_that(cache, has_length(0))
+            with self.assertRaises(LocationError):
+                render_links([Link(broken)])[0].reraise()
+        finally:
+            disable_failed_target_cache()
+        # Harmless when not enabled
+        notify(ObjectRemovedEvent(broken))
+
+
+class TestComponentLookupCache(LinksTestCase):
+
+    def test_lookup(self):
+        cache = ComponentLookupCache()
+        gsm = component.getGlobalSiteManager()
+        local = Components('local', bases=(gsm,))
+        calls = []
+
+        def compute(site_manager):
+            calls.append(site_manager)
+            return site_manager.__name__
+        for _ in range(2):
+            assert_that(cache.lookup(gsm, 'name', compute), is_(gsm.__name__))
+            assert_that(cache.lookup(local, 'name', compute), is_('local'))
+        assert_that(calls, is_([gsm, local]))
+        assert_that(cache, has_length(2))
+        assert_that(repr(cache), is_('<ComponentLookupCache entries=2 hits=2 misses=2>'))
+
+        # Site managers that can't be weakly referenced aren't cached
+        assert_that(cache.lookup(42, 'name', lambda sm: sm), is_(42))
+        assert_that(cache, has_length(2))
+
+        def broken(unused_site_manager):
+            raise LookupError()
+        for _ in range(2):
+            with self.assertRaises(LookupError):
+                cache.lookup(gsm, 'broken', broken)
+        assert_that(cache.misses, is_(5))
+
+        # Site managers are forgotten when they go away
+        del local, calls[:]
+        gc.collect()
+        assert_that(cache, has_length(1))
+
+        cache.clear()
+        assert_that(cache, has_length(0))
+
+    def test_rendering(self):
+        class IDataserver(interface.Interface):
+            pass
+
+        @interface.implementer(IDataserver)
+        class Dataserver(object):
+            root = Creator()
+        dataserver = Dataserver()
+
+        warnings = []
+        old_log = set_link_error_log(lambda *args: warnings.append(args))
+        assert_that(component_lookup_cache(), is_(none()))
+        cache = enable_component_lookup_cache()
+        gsm = component.getGlobalSiteManager()
+        try:
+            assert_that(component_lookup_cache(), is_(same_instance(cache)))
+            with fudge.patched_context('nti.links.externalization',
+                                       'IDataserver', IDataserver):
+                # The missing dataserver is only warned about once
+                for _ in range(3):
+                    assert_that(_dataserver_root(), is_(none()))
+                assert_that(warnings, has_length(1))
+
+                gsm.registerUtility(dataserver, IDataserver)
+                try:
+                    assert_that(cache, has_length(0))
+                    for _ in range(2):
+                        assert_that(_dataserver_root(), is_(same_instance(Dataserver.root)))
+                finally:
+                    gsm.unregisterUtility(dataserver, IDataserver)
+                assert_that(_dataserver_root(), is_(none()))
+                assert_that(warnings, has_length(2))
+
+            link = Link(u'/dataserver2/help')
+            render_link(link)
+            hits = cache.hits
+            render_link(link)
+            assert_that(cache.hits, is_(hits + 1))
+            gsm.registerUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+            try:
+                assert_that(type(render_link(link)), is_(same_instance(RenderedLinkDict)))
+            finally:
+                gsm.unregisterUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+            assert_that(type(render_link(link)), is_not(same_instance(RenderedLinkDict)))
+        finally:
+            disable_component_lookup_cache()
+            set_link_error_log(old_log)
+        # Harmless when not enabled
+        invalidate_component_lookups()
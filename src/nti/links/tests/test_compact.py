@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import assert_that
+
+import unittest
+
+from nti.links.compact import LINK_BASE
+from nti.links.compact import LINK_PREFIXES
+from nti.links.compact import CompactLinkTable
+
+OBJECT = u'/dataserver2/users/ichigo/Objects/tag:nextthought.com,2011-10:ichigo-OID-0x12'
+
+HREFS = (OBJECT,
+         u'/dataserver2/users/ichigo/Objects/tag:nextthought.com,2011-10:ichigo-OID-0x13',
+         u'/dataserver2/users/ichigo',
+         u'/dataserver2/tag:nextthought.com,2011-10:NTIVideo-Bleach',
+         u'/dataserver2/./odd',
+         u'/dataserver2/',
+         u'/dataserver2',
+         u'https://www.google.com/mail',
+         u'mailto:ichigo@example.com',
+         u'/help',
+         u'help',
+         u'a/b')
+
+
+class TestCompactLinkTable(unittest.TestCase):
+
+    def test_round_trip(self):
+        for base in (None, u'/dataserver2/'):
+            table = CompactLinkTable(base)
+            for href in HREFS:
+                assert_that(table.expand_href(table.compact_href(href)), is_(href))
+
+    def test_compact(self):
+        table = CompactLinkTable(u'/dataserver2/')
+        assert_that(table.compact_href(OBJECT),
+                    is_([0, u'tag:nextthought.com,2011-10:ichigo-OID-0x12']))
+        assert_that(table.compact_href(u'/dataserver2/users/aizen/Objects/x'), is_([1, u'x']))
+        assert_that(table.compact_href(OBJECT + u'/@@like'), is_([2, u'@@like']))
+        assert_that(table.compact_href(u'/dataserver2/users/ichigo/Objects/y'), is_([0, u'y']))
+        # Short prefixes beyond the base
+        assert_that(table.compact_href(u'/dataserver2/users/ichigo'), is_(u'users/ichigo'))
+        assert_that(table.compact_href(u'/dataserver2/tag:nextthought.com,2011-10:x'),
+                    is_(u'./tag:nextthought.com,2011-10:x'))
+        assert_that(table.compact_href(u'/help'), is_(u'/help'))
+        assert_that(table.compact_href(u'mailto:ichigo@example.com'),
+                    is_(u'mailto:ichigo@example.com'))
+        # Would look relative
+        assert_that(table.compact_href(u'help'), is_([3, u'help']))
+        assert_that(table.prefixes[3], is_(u''))
+        assert_that(len(table), is_(4))
+        assert_that(repr(table), is_("<CompactLinkTable base=%r prefixes=4>" % u'/dataserver2/'))
+        assert_that(table.external(),
+                    is_({LINK_BASE: u'/dataserver2/',
+                         LINK_PREFIXES: [u'/dataserver2/users/ichigo/Objects/',
+                                         u'/dataserver2/users/aizen/Objects/',
+                                         OBJECT + u'/',
+                                         u'']}))
+        assert_that(CompactLinkTable().external(), is_({LINK_PREFIXES: []}))
+
+    def test_links(self):
+        table = CompactLinkTable()
+        rendered = {u'Class': u'Link', u'href': OBJECT, u'rel': u'edit', u'method': u'PUT'}
+        compact = table.compact(dict(rendered))
+        assert_that(compact, is_({u'href': [0, u'tag:nextthought.com,2011-10:ichigo-OID-0x12'],
+                                  u'rel': u'edit', u'method': u'PUT'}))
+        assert_that(table.expand(compact), is_(rendered))
+        assert_that(table.compact(OBJECT), is_(compact[u'href']))
+        assert_that(table.expand(compact[u'href']), is_(OBJECT))
+        assert_that(table.expand(u'/help'), is_(u'/help'))
@@ -8,32 +8,92 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods,arguments-differ
 
 from hamcrest import is_
+from hamcrest import none
 from hamcrest import is_not
 from hamcrest import assert_that
+from hamcrest import has_length
 from hamcrest import has_entries
+from hamcrest import starts_with
+from hamcrest import instance_of
+from hamcrest import same_instance
 does_not = is_not
 
+import json
+
 import fudge
 
+import simplejson
+
+from persistent import Persistent
+
 from fudge.inspector import arg
 
+from zope import component
 from zope import interface
 
+from zope.component.hooks import site as current_site
+
+from zope.interface.registry import Components
+
+from zope.location.interfaces import LocationError
+
+from zope.traversing.interfaces import TraversalError
+
 from nti.base.interfaces import ICreated
 
 from nti.externalization.externalization import to_external_object
 
+from nti.externalization.interfaces import LocatedExternalDict
+from nti.externalization.interfaces import ILocatedExternalMapping
+
+from nti.externalization.representation import to_json_representation_externalized
+
 import nti.links
 
 from nti.links.links import Link
+from nti.links.links import CompactLink
+from nti.links.links import LinkTemplate
+from nti.links.links import LinkCollection
+from nti.links.links import LinkExternalHrefOnly
 
 from nti.links.externalization import render_link
+from nti.links.externalization import render_links
+from nti.links.externalization import invalidate_render_plans
 from nti.links.externalization import _root_for_ntiid_link
 
+from nti.links.caching import link_rendering_cache
+from nti.links.caching import enable_lineage_path_cache
+from nti.links.caching import disable_lineage_path_cache
+
+from nti.links.externalization import rendered_link_cache
+from nti.links.externalization import enable_rendered_link_cache
+from nti.links.externalization import disable_rendered_link_cache
+from nti.links.externalization import invalidate_rendered_link_cache
+
+from nti.links.externalization import ghost_ntiid_oid
+from nti.links.externalization import link_error_log
+from nti.links.externalization import set_link_error_log
+from nti.links.externalization import iter_rendered_links
+from nti.links.externalization import render_external_links
+from nti.links.externalization import ghost_safe_link_rendering
+from nti.links.externalization import lazy_link_rendering
+from nti.links.externalization import deduplicated_link_rendering
+from nti.links.externalization import json_link_rendering
+from nti.links.externalization import compact_link_rendering
+
+from nti.links.externalization import LazyRenderedLinks
+from nti.links.externalization import RenderedLinkDict
+from nti.links.externalization import RenderedLinkJSON
+from nti.links.externalization import LinkRenderingFailure
+
 from nti.links.externalization import LinkExternalObjectDecorator
 
+from nti.links.interfaces import ILinksRendered
+from nti.links.interfaces import ILinkExternalMappingFactory
 from nti.links.interfaces import ILinkExternalHrefOnly
 
+from nti.links.metrics import RateLimitedLog
+
 from nti.links.tests import LinksTestCase
 
 
@@ -107,6 +167,67 @@ class TestExternalization(LinksTestCase):
         assert_that(result,
                     is_('https://bleach.org/foo/bar/baz'))
 
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_href_only(self, mock_rp):
+        target = object()
+        mock_rp.is_callable().with_args(target).returns('/dataserver2/users/ichigo')
+        for link in (Link(target, rel='edit', elements=('@@edit',), href_only=True),
+                     CompactLink(target, rel='edit', elements=('@@edit',), href_only=True),
+                     LinkExternalHrefOnly(target, rel='edit', elements=('@@edit',))):
+            assert_that(render_link(link), is_('/dataserver2/users/ichigo/@@edit'))
+
+    def test_deduplicate(self):
+        target = object()
+        other = 'https://www.google.com'
+        mapping = {'Links': [Link(other, rel='google'),
+                             Link(target, rel='edit', method='PUT'),
+                             'not a link',
+                             Link(target, rel='edit', method='PUT'),
+                             Link(target, rel='edit', method='POST'),
+                             Link(other, rel='google')]}
+        unhashable = Link(other, rel='google')
+        unhashable.params = {'q': ['x']}
+        mapping['Links'].extend([unhashable, unhashable])
+
+        decorator = LinkExternalObjectDecorator()
+        with fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                   lambda unused: '/dataserver2/target'):
+            decorator.decorateExternalObject(None, dict(mapping))
+            with deduplicated_link_rendering():
+                result = dict(mapping)
+                decorator.decorateExternalObject(None, result)
+                assert_that(result['Links'], has_length(6))
+                assert_that([x['method'] for x in result['Links'][1:4:2]],
+                            is_(['PUT', 'POST']))
+
+                with lazy_link_rendering():
+                    result = dict(mapping)
+                    decorator.decorateExternalObject(None, result)
+                assert_that(list(result['Links']), has_length(6))
+
+                # Links that render differently are kept
+                result = {'Links': [Link(target, rel='edit', href_only=True),
+                                    Link(target, rel='edit', title=u'Edit',
+                                         target_mime_type='application/json')]}
+                decorator.decorateExternalObject(None, result)
+                assert_that(result['Links'][0], is_('/dataserver2/target'))
+                assert_that(result['Links'][1], has_entries('title', 'Edit',
+                                                            'type', 'application/json'))
+
+    def test_package_render_link(self):
+        import nti.links
+        link = Link('/dataserver2/users/ichigo', rel='edit')
+        assert_that(nti.links.render_link(link), is_(render_link(link)))
+
+    def test_decorator_link_collection(self):
+        links = LinkCollection([Link('https://www.google.com', rel='google')])
+        links.append_factory('edit', lambda: Link('/dataserver2/ichigo', rel='edit'))
+        links.append_factory('unused', lambda: None)
+        result = {'Links': links}
+        LinkExternalObjectDecorator().decorateExternalObject(None, result)
+        assert_that([x['href'] for x in result['Links']],
+                    is_(['https://www.google.com', '/dataserver2/ichigo']))
+
     def test_decorator(self):
         link = Link("https://www.google.com", rel='google', method='GET',
                     elements=('mail',),
@@ -116,7 +237,7 @@ class TestExternalization(LinksTestCase):
         decorator.decorateExternalObject(None, 
                                          {'Links': [link, 'https://www.amazon.com']})
 
-    @fudge.patch('nti.links.externalization.render_link')
+    @fudge.patch('nti.links.externalization._render_link')
     def test_type_error(self, mock_rl):
         link = Link("https://www.google.com", rel='google', method='GET',
                     elements=('mail',),
@@ -127,9 +248,57 @@ class TestExternalization(LinksTestCase):
         decorator.decorateExternalObject(None, links)
         assert_that(links, has_entries('Links', []))
 
+    def test_render_links(self):
+        links = [Link("https://www.google.com", rel='google', method='GET',
+                      elements=('mail',), params={'app': '42'}),
+                 'https://www.amazon.com',
+                 Link("/dataserver2/users/ichigo", rel='edit',
+                      target_mime_type='application/json')]
+        result = render_links(links)
+        assert_that(result, has_length(3))
+        assert_that(result[0], is_(render_link(links[0])))
+        assert_that(result[1], is_(same_instance(links[1])))
+        assert_that(result[2], is_(render_link(links[2])))
+        assert_that(render_links(()), is_([]))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_render_links_failure(self, mock_rp):
+        mock_rp.is_callable().raises(TypeError())
+        good = Link("https://www.google.com", rel='google')
+        bad = Link(object(), rel='broken')
+        result = render_links([bad, good])
+        assert_that(result[0], is_(instance_of(LinkRenderingFailure)))
+        assert_that(result[0].link, is_(same_instance(bad)))
+        assert_that(result[0].error, is_(instance_of(TypeError)))
+        assert_that(repr(result[0]), starts_with('<LinkRenderingFailure'))
+        assert_that(result[1], has_entries('rel', 'google'))
+
+        with self.assertRaises(TypeError):
+            LinkExternalObjectDecorator().decorateExternalObject(None, [good, bad])
+
+        links = {'Links': [bad, good]}
+        LinkExternalObjectDecorator().decorateExternalObject(None, links)
+        assert_that(links['Links'], has_length(1))
+        assert_that(links['Links'][0], has_entries('rel', 'google'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_decorator_reraises_other_errors(self, mock_rp):
+        mock_rp.is_callable().raises(ValueError())
+        links = {'Links': [Link(object(), rel='broken')]}
+        with self.assertRaises(ValueError):
+            LinkExternalObjectDecorator().decorateExternalObject(None, links)
+
 
 class TestLegacyIDLinks(LinksTestCase):
 
+    # Render plans remember what IShouldHaveTraversablePath, which
+    # these tests replace, said about targets.
+
+    def setUp(self):
+        invalidate_render_plans()
+
+    def tearDown(self):
+        invalidate_render_plans()
 
     @fudge.patch('nti.links.externalization._root_for_ntiid_link')
     @fudge.patch('nti.links.externalization.IShouldHaveTraversablePath')
@@ -159,3 +328,660 @@ class TestLegacyIDLinks(LinksTestCase):
         result = render_link(link)
         assert_that(result,
                     is_('/dataserver2/NTIIDs/tag%3Anextthought.com%2C2011-10%3ABLEACH-NTIVideo-Ichigo.vs.Aizen'))
+
+    @fudge.patch('nti.links.externalization._root_for_ntiid_link')
+    @fudge.patch('nti.links.externalization.IShouldHaveTraversablePath')
+    def test_ntiid_string_targets(self, mock_root, iface):
+        mock_root.is_callable().returns('/dataserver2')
+        iface.provides('providedBy').returns(False)
+
+        oid = 'tag:nextthought.com,2011-10:system-OID-0x12:5573657273'
+        result = render_link(Link(oid, rel='edit', elements=('@@edit',)))
+        assert_that(result,
+                    has_entries('rel', 'edit',
+                                'ntiid', oid,
+                                'href', '/dataserver2/Objects/'
+                                'tag%3Anextthought.com%2C2011-10%3Asystem-OID-0x12%3A5573657273'
+                                '/@@edit'))
+
+        # The NTIID from the target is validated but not used as a path
+        class Bleach(object):
+            ntiid = 'not an ntiid'
+        with self.assertRaises(TraversalError):
+            render_link(Link(Bleach()))
+
+
+class TestRenderedLinkCache(LinksTestCase):
+
+    def setUp(self):
+        self.cache = enable_rendered_link_cache(10)
+
+    def tearDown(self):
+        disable_rendered_link_cache()
+
+    def test_cached(self):
+        assert_that(rendered_link_cache(), is_(same_instance(self.cache)))
+        link = Link("/dataserver2/help", rel='help', elements=('index.html',),
+                    params={'lang': 'en'}, title=u'Help')
+        first = render_link(link)
+        second = render_link(Link("/dataserver2/help", rel='help', elements=('index.html',),
+                                  params={'lang': 'en'}, title=u'Help'))
+        assert_that(self.cache.misses, is_(1))
+        assert_that(self.cache.hits, is_(1))
+        assert_that(second, is_(first))
+        assert_that(second, is_not(same_instance(first)))
+        assert_that(list(second), is_(list(first)))
+        assert_that(type(second), is_(same_instance(type(first))))
+
+        # Callers can't corrupt the cache
+        second['href'] = 'corrupt'
+        assert_that(render_link(link), is_(first))
+
+        invalidate_rendered_link_cache()
+        assert_that(len(self.cache), is_(0))
+        assert_that(render_link(link), is_(first))
+
+    def test_repeated_params(self):
+        repeated = Link("/dataserver2/search", params=[('a', 1), ('a', 2)])
+        assert_that(render_link(repeated), has_entries('href', '/dataserver2/search?a=1&a=2'))
+        assert_that(render_link(Link("/dataserver2/search", params=[('a', 2)])),
+                    has_entries('href', '/dataserver2/search?a=2'))
+        assert_that(self.cache.hits, is_(0))
+
+    def test_href_only(self):
+        link = LinkExternalHrefOnly("/dataserver2/help", rel='help')
+        assert_that(render_link(link), is_('/dataserver2/help'))
+        assert_that(render_link(link), is_('/dataserver2/help'))
+        assert_that(self.cache.hits, is_(1))
+        # Not confused with the full rendering
+        assert_that(render_link(Link("/dataserver2/help", rel='help')),
+                    has_entries('href', '/dataserver2/help'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_not_cached(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo')
+        created = Link("/dataserver2/help")
+        created.creator = 'ichigo'
+        interface.alsoProvides(created, ICreated)
+        for link in (Link(object()),
+                     Link(u'ichigo'),
+                     created,
+                     Link("/dataserver2/help", params={'unhashable': []})):
+            render_link(link)
+            render_link(link)
+        render_link(Link("/dataserver2/help"), nearest_site=object())
+        assert_that(len(self.cache), is_(0))
+        assert_that(self.cache.hits, is_(0))
+
+    def test_ntiid_per_site(self):
+        gsm = component.getGlobalSiteManager()
+
+        class Root(object):
+            def __init__(self, path):
+                self.path = path
+
+        class Site(object):
+            def __init__(self, path):
+                self.site_manager = Components(path, bases=(gsm,))
+                self.site_manager.registerUtility(_Dataserver(Root(path)), _IDataserver)
+
+            def getSiteManager(self):
+                return self.site_manager
+
+        ntiid = 'tag:nextthought.com,2011-10:BLEACH-NTIVideo-Ichigo.vs.Aizen'
+        invalidate_render_plans()
+        with fudge.patched_context('nti.links.externalization', 'IDataserver', _IDataserver), \
+                fudge.patched_context('nti.links.externalization',
+                                      'IShouldHaveTraversablePath', _ITraversable), \
+                fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                      lambda root: root.path):
+            sites = {path: Site(path) for path in ('/site1', '/site2')}
+            for path in ('/site1', '/site2', '/site1'):
+                with current_site(sites[path]):
+                    assert_that(render_link(Link(ntiid)),
+                                has_entries('href', starts_with(path + '/NTIIDs/')))
+        invalidate_render_plans()
+        assert_that(self.cache.hits, is_(1))
+
+    def test_registration_invalidates(self):
+        render_link(Link("/dataserver2/help"))
+        assert_that(len(self.cache), is_(1))
+
+        class IThing(interface.Interface):
+            pass
+        thing = object()
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(thing, IThing)
+        gsm.unregisterUtility(thing, IThing)
+        assert_that(len(self.cache), is_(0))
+
+
+class TestLazyRendering(LinksTestCase):
+
+    def _links(self, count):
+        return [Link('/dataserver2/users/user%d' % i, rel='edit') for i in range(count)]
+
+    def test_iter_rendered_links_is_lazy(self):
+        links = self._links(3)
+        rendered = iter_rendered_links(links + ['not a link'])
+        with fudge.patched_context('nti.links.externalization', '_render_link',
+                                   fudge.Fake().is_callable().returns({}).times_called(1)):
+            assert_that(next(rendered), is_({}))
+        assert_that(list(rendered),
+                    is_([render_link(links[1]), render_link(links[2]), 'not a link']))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_iter_rendered_links_errors(self, mock_rp):
+        mock_rp.is_callable().raises(LocationError())
+        good = Link('/dataserver2/help')
+        assert_that(list(iter_rendered_links([Link(object()), good])),
+                    is_([render_link(good)]))
+
+        mock_rp.is_callable().raises(ValueError())
+        with self.assertRaises(ValueError):
+            list(iter_rendered_links([Link(object())]))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_errors_logged_once(self, mock_rp):
+        mock_rp.is_callable().raises(LocationError())
+        logger = fudge.Fake().provides('log').times_called(2)
+        log = RateLimitedLog(logger)
+        old = set_link_error_log(log)
+        try:
+            assert_that(link_error_log(), is_(same_instance(log)))
+            for _ in range(3):
+                list(iter_rendered_links([Link(object()), Link(object(), rel='edit')]))
+            assert_that(log.suppressed(), is_({('alternate', 'object'): 2,
+                                               ('edit', 'object'): 2}))
+        finally:
+            set_link_error_log(old)
+        assert_that(link_error_log(), is_(same_instance(old)))
+
+    def test_decorator(self):
+        links = self._links(3)
+        sequence = list(links)
+        mapping = {'Links': list(links)}
+        decorator = LinkExternalObjectDecorator()
+        with lazy_link_rendering():
+            decorator.decorateExternalObject(None, sequence)
+            decorator.decorateExternalObject(None, mapping)
+            lazy = mapping['Links']
+            # Not wrapped twice
+            decorator.decorateExternalObject(None, mapping)
+        assert_that(mapping['Links'], is_(same_instance(lazy)))
+        assert_that(sequence, is_(links))
+        assert_that(lazy, is_(instance_of(LazyRenderedLinks)))
+        assert_that(repr(lazy), starts_with('<LazyRenderedLinks'))
+
+        eager = {'Links': list(links)}
+        decorator.decorateExternalObject(None, eager)
+        assert_that(list(lazy), is_(eager['Links']))
+        # Iterating again renders again
+        assert_that(list(lazy), is_(eager['Links']))
+
+
+class TestJSONRendering(LinksTestCase):
+
+    def _links(self):
+        return [Link('/dataserver2/help', rel='help', title=u'Help \xf1 "now"'),
+                Link('/dataserver2/edit', rel='edit', method='PUT',
+                     target_mime_type='application/json'),
+                LinkExternalHrefOnly('/dataserver2/help/</script>')]
+
+    def test_same_output(self):
+        expected = {'Links': render_links(self._links())}
+        for dumps in (to_json_representation_externalized,
+                      simplejson.dumps,
+                      lambda obj: simplejson.dumps(obj, sort_keys=True, separators=(',', ':'))):
+            with json_link_rendering(dumps):
+                fragments = render_links(self._links())
+            for fragment in fragments:
+                assert_that(fragment, is_(instance_of(RenderedLinkJSON)))
+            assert_that(dumps({'Links': fragments}), is_(dumps(expected)))
+        # Encoders that don't know them encode the rendering
+        with json_link_rendering():
+            fragments = render_links(self._links())
+        assert_that(to_json_representation_externalized({'Links': fragments}),
+                    is_(to_json_representation_externalized(expected)))
+        assert_that(to_external_object(fragments[0]), is_(expected['Links'][0]))
+        assert_that(fragments[0].toExternalObject(),
+                    is_not(same_instance(fragments[0].toExternalObject())))
+        assert_that(fragments[2].toExternalObject(), is_('/dataserver2/help/</script>'))
+        assert_that(repr(fragments[2]), is_('<RenderedLinkJSON "/dataserver2/help/</script>">'))
+
+    def test_indenting_encoders(self):
+        expected = {'Links': render_links(self._links())}
+        dumps = lambda obj: simplejson.dumps(obj, indent=2)
+        with json_link_rendering(dumps):
+            rendered = render_links(self._links())
+        assert_that(rendered[0], is_(dict))
+        assert_that(dumps({'Links': rendered}), is_(dumps(expected)))
+        # The fragments wouldn't have been indented
+        fragments = [RenderedLinkJSON(x, simplejson.dumps) for x in expected['Links']]
+        assert_that(simplejson.dumps({'Links': fragments}, indent=2),
+                    is_not(simplejson.dumps(expected, indent=2)))
+
+    def test_unknown_to_encoder(self):
+        with json_link_rendering(json.dumps):
+            rendered = render_links(self._links())
+        assert_that(rendered[0], is_(dict))
+        assert_that(json.dumps(rendered), is_(json.dumps(render_links(self._links()))))
+
+    def test_decorator(self):
+        mapping = {'Links': self._links()}
+        sequence = self._links()
+        with json_link_rendering(simplejson.dumps):
+            LinkExternalObjectDecorator().decorateExternalObject(None, mapping)
+            LinkExternalObjectDecorator().decorateExternalObject(None, sequence)
+        assert_that(mapping['Links'], has_length(3))
+        for fragment in mapping['Links'] + sequence:
+            assert_that(fragment, is_(instance_of(RenderedLinkJSON)))
+        # The default again
+        assert_that(render_link(Link('/dataserver2/help')), is_(dict))
+
+    def test_cached(self):
+        cache = enable_rendered_link_cache(10)
+        try:
+            with json_link_rendering(simplejson.dumps):
+                first = render_link(self._links()[0])
+                assert_that(render_link(self._links()[0]), is_(same_instance(first)))
+                # Not cacheable
+                render_link(Link('/dataserver2/help', params={'unhashable': []}))
+            # Shared with the usual rendering
+            assert_that(render_link(self._links()[0]), is_(first.toExternalObject()))
+            assert_that(cache.hits, is_(2))
+        finally:
+            disable_rendered_link_cache()
+
+
+class TestCompactRendering(LinksTestCase):
+
+    def _links(self):
+        return [Link('/dataserver2/users/ichigo/Objects/tag:nextthought.com,2011-10:x',
+                     rel='edit', method='PUT'),
+                Link('/dataserver2/users/ichigo/Objects/tag:nextthought.com,2011-10:y',
+                     rel='edit', title=u'Edit'),
+                LinkExternalHrefOnly('/dataserver2/help')]
+
+    def test_decorator(self):
+        expected = render_links(self._links())
+        mapping = {'Links': self._links()}
+        sequence = self._links()
+        cache = enable_rendered_link_cache(10)
+        try:
+            with json_link_rendering(), compact_link_rendering(u'/dataserver2/') as table:
+                LinkExternalObjectDecorator().decorateExternalObject(None, mapping)
+                LinkExternalObjectDecorator().decorateExternalObject(None, sequence)
+        finally:
+            disable_rendered_link_cache()
+        assert_that(mapping['Links'],
+                    is_([{'href': [0, 'tag:nextthought.com,2011-10:x'],
+                          'rel': 'edit', 'method': 'PUT'},
+                         {'href': [0, 'tag:nextthought.com,2011-10:y'],
+                          'rel': 'edit', 'title': u'Edit'},
+                         'help']))
+        assert_that(sequence, is_(mapping['Links']))
+        assert_that([table.expand(x) for x in sequence], is_(expected))
+        # The full renderings were cached
+        assert_that(cache.hits, is_(3))
+        assert_that(render_link(self._links()[0]), is_(expected[0]))
+        assert_that(table.external()['LinkPrefixes'],
+                    is_(['/dataserver2/users/ichigo/Objects/']))
+
+
+class TestRenderExternalLinks(LinksTestCase):
+
+    def test_nested(self):
+        help_link = Link('/dataserver2/help', rel='help')
+        rendered = render_link(help_link)
+        deferred = LazyRenderedLinks([help_link])
+        external = {'Class': 'Collection',
+                    'Total': 2,
+                    'Links': [help_link, 'already rendered'],
+                    'Creator': Link('/dataserver2/users/ichigo', href_only=True),
+                    'Items': [{'Links': LinkCollection([help_link])},
+                              {'Links': deferred, 'Items': [help_link, 42, None]},
+                              {'Links': [], 'Parent': {'Links': [help_link]}},
+                              {'Links': ['not a link'], 'Tags': ('a', 'b')}]}
+        assert_that(render_external_links(external), is_(5))
+        assert_that(external['Links'], is_([rendered, 'already rendered']))
+        assert_that(external['Creator'], is_('/dataserver2/users/ichigo'))
+        items = external['Items']
+        assert_that(items[0]['Links'], is_([rendered]))
+        assert_that(items[1]['Links'], is_(same_instance(deferred)))
+        assert_that(items[1]['Items'], is_([rendered, 42, None]))
+        assert_that(items[2]['Parent']['Links'], is_([rendered]))
+        # Nothing left
+        assert_that(render_external_links(external), is_(0))
+
+    def test_same_as_decorator(self):
+        def external():
+            return {'Links': [Link('/dataserver2/help', rel='help'),
+                              Link(object())],
+                    'Items': [Link('/dataserver2/a'), 'b']}
+        expected = external()
+        LinkExternalObjectDecorator().decorateExternalObject(None, expected)
+        LinkExternalObjectDecorator().decorateExternalObject(None, expected['Items'])
+        with fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                   fudge.Fake().is_callable().raises(LocationError())):
+            walked = external()
+            render_external_links(walked)
+        assert_that(walked, is_(expected))
+        assert_that(walked['Links'], has_length(1))
+
+        walked = external()
+        walked['Items'].append(Link(object()))
+        with fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                   fudge.Fake().is_callable().raises(LocationError())):
+            with self.assertRaises(LocationError):
+                render_external_links(walked)
+
+    def test_deep_and_cyclic(self):
+        link = Link('/dataserver2/help', rel='help')
+        external = leaf = {}
+        for _ in range(10000):
+            leaf['Items'] = [{}]
+            leaf = leaf['Items'][0]
+        leaf['Links'] = [link]
+        external['Items'].append(external['Items'])
+        assert_that(render_external_links(external), is_(1))
+        assert_that(leaf['Links'], is_([render_link(link)]))
+
+    def test_mark(self):
+        link = Link('/dataserver2/help', rel='help')
+        inner = LocatedExternalDict(Links=[link])
+        external = {'Items': [inner]}
+        assert_that(render_external_links(external, mark=True), is_(1))
+        assert_that(ILinksRendered.providedBy(inner), is_(True))
+        inner['Links'].append(link)
+        assert_that(render_external_links(external), is_(0))
+        assert_that(inner['Links'][1], is_(same_instance(link)))
+
+
+class TestRenderedLinkDict(LinksTestCase):
+
+    def test_registered(self):
+        link = Link('/dataserver2/help', rel='help')
+        expected = render_link(link)
+        assert_that(expected, is_(instance_of(LocatedExternalDict)))
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+        cache = enable_rendered_link_cache(10)
+        try:
+            for _ in range(2):
+                rendered = render_link(link)
+                assert_that(type(rendered), is_(same_instance(RenderedLinkDict)))
+                assert_that(rendered, is_(expected))
+            assert_that(cache.hits, is_(1))
+        finally:
+            disable_rendered_link_cache()
+            gsm.unregisterUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+        assert_that(ILocatedExternalMapping.providedBy(rendered), is_(True))
+        assert_that(rendered.__parent__, is_(none()))
+        assert_that(rendered.__name__, is_(none()))
+        assert_that(to_json_representation_externalized(rendered),
+                    is_(to_json_representation_externalized(expected)))
+        assert_that(render_link(link), is_(instance_of(LocatedExternalDict)))
+
+    def test_located(self):
+        link = Link('/dataserver2/help', rel='help')
+        expected = render_link(link)
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+        try:
+            rendered = render_link(link)
+        finally:
+            gsm.unregisterUtility(RenderedLinkDict, ILinkExternalMappingFactory)
+        assert_that(rendered.__acl__, is_(()))
+        assert_that(rendered.mimeType, is_(none()))
+        with self.assertRaises(AttributeError):
+            getattr(rendered, 'title')
+        with self.assertRaises(AttributeError):
+            rendered.title = u'Help'
+
+        parent = object()
+        for mapping in (rendered, expected):
+            mapping.__parent__ = parent
+            mapping.__name__ = u'help'
+            mapping.__acl__ = ('acl',)
+            mapping.mimeType = 'application/vnd.nextthought.link'
+        assert_that(rendered.__parent__, is_(same_instance(parent)))
+        assert_that(rendered.__name__, is_(u'help'))
+        assert_that(rendered.__acl__, is_(('acl',)))
+        assert_that(rendered.mimeType, is_('application/vnd.nextthought.link'))
+        assert_that(to_external_object(rendered), is_(to_external_object(expected)))
+        assert_that(to_external_object(rendered),
+                    has_entries('MimeType', 'application/vnd.nextthought.link'))
+
+
+class TestLinkTemplate(LinksTestCase):
+
+    def test_same_as_links(self):
+        targets = ['/dataserver2/users/ichigo', '/dataserver2/users/', 'https://bleach.org/']
+        shapes = ({},
+                  {'rel': 'edit', 'elements': ('@@edit',), 'method': 'PUT'},
+                  {'elements': ('a', 'b'), 'params': {'q': 'x y', 'n': 1}, 'title': 'T',
+                   'target_mime_type': 'text/plain'},
+                  {'target_mime_type': 'text/plain', 'ignore_properties_of_target': True},
+                  {'params': {'q': '1'}, 'href_only': True})
+        for kwargs in shapes:
+            template = LinkTemplate(**kwargs)
+            for _ in range(2):
+                expected = [render_link(Link(target, **kwargs)) for target in targets]
+                assert_that(template.render(targets), is_(expected))
+                for rendered, exp in zip(template.render(targets), expected):
+                    if hasattr(exp, 'keys'):
+                        assert_that(list(rendered), is_(list(exp)))
+
+    def test_dict_params(self):
+        link = Link('/dataserver2')
+        link.params = {'q': 'x y'}
+        assert_that(render_link(link), has_entries('href', '/dataserver2?q=x+y'))
+
+
+class _ITraversable(interface.Interface):
+    pass
+
+
+class TestRenderPlans(LinksTestCase):
+
+    def test_type_only_when_explicit(self):
+        class Bleach(object):
+            mimeType = 'application/vnd.nextthought.bleach'
+        target = Bleach()
+        with fudge.patched_context('nti.links.externalization', 'normal_resource_path',
+                                   lambda unused: '/dataserver2/bleach'):
+            for kwargs, expected in (({}, None),
+                                     ({'method': 'GET'}, None),
+                                     ({'target_mime_type': 'image/gif'}, 'image/gif'),
+                                     ({'target_mime_type': 'image/gif',
+                                       'ignore_properties_of_target': True}, None),
+                                     ({'target_mime_type': 'image/gif',
+                                       'ignore_properties_of_target': True,
+                                       'method': 'GET'}, 'image/gif')):
+                result = render_link(Link(target, **kwargs))
+                assert_that(result.get('type'), is_(expected))
+
+    def test_link_declarations_change(self):
+        class MyLink(Link):
+            pass
+        link = MyLink('/dataserver2/users/ichigo')
+        assert_that(render_link(link), has_entries('href', '/dataserver2/users/ichigo'))
+        interface.classImplements(MyLink, ILinkExternalHrefOnly)
+        assert_that(render_link(link), is_('/dataserver2/users/ichigo'))
+
+    @fudge.patch('nti.links.externalization._root_for_ntiid_link',
+                 'nti.links.externalization.normal_resource_path')
+    def test_target_declarations_change(self, mock_root, mock_rp):
+        mock_root.is_callable().returns('/dataserver2')
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo/bleach')
+
+        class Bleach(object):
+            ntiid = 'tag:nextthought.com,2011-10:BLEACH-NTIVideo-Ichigo.vs.Aizen'
+        link = Link(Bleach())
+        with fudge.patched_context('nti.links.externalization',
+                                   'IShouldHaveTraversablePath', _ITraversable):
+            assert_that(render_link(link), has_entries('href', starts_with('/dataserver2/NTIIDs/')))
+            interface.classImplements(Bleach, _ITraversable)
+            assert_that(render_link(link), has_entries('href', '/dataserver2/users/ichigo/bleach'))
+        invalidate_render_plans()
+
+    def test_bounded(self):
+        class Link1(Link):
+            pass
+
+        class Link2(Link):
+            pass
+        plans = {}
+        with fudge.patched_context('nti.links.externalization', 'RENDER_PLAN_CACHE_SIZE', 1), \
+             fudge.patched_context('nti.links.externalization', '_render_plans', plans):
+            render_link(Link1('/dataserver2'))
+            render_link(Link2('/dataserver2'))
+            assert_that(plans, has_length(1))
+            invalidate_render_plans()
+            assert_that(plans, has_length(0))
+
+
+class _Jar(object):
+
+    database_name = 'Users'
+
+    def __init__(self):
+        self.loads = 0
+
+    def db(self):
+        return self
+
+    def setstate(self, unused_obj):
+        self.loads += 1
+
+
+class _Persistent(Persistent):
+    ntiid = 'tag:nextthought.com,2011-10:ichigo-OID-0x12:5573657273'
+    mimeType = 'application/vnd.nextthought.bleach'
+
+
+class _IDataserver(interface.Interface):
+    pass
+
+
+@interface.implementer(_IDataserver)
+class _Dataserver(object):
+
+    def __init__(self, root):
+        self.root = root
+
+
+class TestGhostRendering(LinksTestCase):
+
+    def setUp(self):
+        self.jar = _Jar()
+        self.root = object()
+        self.dataserver = _Dataserver(self.root)
+        component.getGlobalSiteManager().registerUtility(self.dataserver, _IDataserver)
+
+    def tearDown(self):
+        component.getGlobalSiteManager().unregisterUtility(self.dataserver, _IDataserver)
+
+    def _ghost(self, cls=_Persistent):
+        obj = cls()
+        obj._p_oid = b'\x00' * 7 + b'\x12'
+        obj._p_jar = self.jar
+        obj._p_changed = False
+        obj._p_deactivate()
+        return obj
+
+    def _render(self, link):
+        with fudge.patched_context('nti.links.externalization', 'IDataserver', _IDataserver):
+            return render_link(link)
+
+    def test_ghost_ntiid_oid(self):
+        assert_that(ghost_ntiid_oid(self._ghost()),
+                    is_('tag:nextthought.com,2011-10:unknown-OID-0x12:5573657273'))
+
+        class Unsaved(object):
+            _p_oid = None
+        assert_that(ghost_ntiid_oid(Unsaved()), is_(none()))
+
+        class NoJar(object):
+            _p_oid = b'\x00' * 7 + b'\x12'
+            _p_jar = None
+        assert_that(ghost_ntiid_oid(NoJar()),
+                    is_('tag:nextthought.com,2011-10:unknown-OID-0x12'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_oid_href(self, mock_rp):
+        mock_rp.is_callable().with_args(self.root).returns('/dataserver2')
+        ghost = self._ghost()
+        link = Link(ghost, rel='edit', elements=('@@edit',), method='PUT')
+        with ghost_safe_link_rendering(), link_rendering_cache():
+            result = self._render(link)
+            self._render(Link(ghost))
+        assert_that(self.jar.loads, is_(0))
+        assert_that(ghost._p_changed, is_(none()))
+        assert_that(result,
+                    is_({'Class': 'Link',
+                         'rel': 'edit',
+                         'method': 'PUT',
+                         'href': '/dataserver2/Objects/'
+                                 'tag%3Anextthought.com%2C2011-10%3Aunknown-OID-0x12%3A5573657273'
+                                 '/@@edit'}))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_href_only(self, mock_rp):
+        mock_rp.is_callable().with_args(self.root).returns('/dataserver2')
+        with ghost_safe_link_rendering():
+            result = self._render(Link(self._ghost(), href_only=True))
+        assert_that(self.jar.loads, is_(0))
+        assert_that(result,
+                    is_('/dataserver2/Objects/'
+                        'tag%3Anextthought.com%2C2011-10%3Aunknown-OID-0x12%3A5573657273'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_cached_path(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo/Objects/bleach')
+        ghost = self._ghost()
+        with link_rendering_cache():
+            # Activates it
+            self._render(Link(ghost, rel='edit'))
+            assert_that(self.jar.loads, is_(1))
+            ghost._p_deactivate()
+            with ghost_safe_link_rendering():
+                result = self._render(Link(ghost, rel='edit'))
+        assert_that(self.jar.loads, is_(1))
+        assert_that(result, has_entries('href', '/dataserver2/users/ichigo/Objects/bleach'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_lineage_path(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo/Objects/bleach')
+        ghost = self._ghost()
+        enable_lineage_path_cache()
+        try:
+            # Activates it
+            loaded = self._render(Link(ghost, rel='edit'))
+            ghost._p_deactivate()
+            with ghost_safe_link_rendering():
+                result = self._render(Link(ghost, rel='edit'))
+        finally:
+            disable_lineage_path_cache()
+        assert_that(self.jar.loads, is_(1))
+        assert_that(result['href'], is_(loaded['href']))
+        assert_that(result, has_entries('href', '/dataserver2/users/ichigo/Objects/bleach'))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_activates_by_default(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo/Objects/bleach')
+        self._render(Link(self._ghost()))
+        assert_that(self.jar.loads, is_(1))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_no_dataserver(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo/Objects/bleach')
+
+        class Plain(Persistent):
+            pass
+        with ghost_safe_link_rendering():
+            result = render_link(Link(self._ghost(Plain)))
+        assert_that(result, has_entries('href', '/dataserver2/users/ichigo/Objects/bleach'))
+        assert_that(self.jar.loads, is_(1))
+
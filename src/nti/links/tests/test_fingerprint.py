@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+
+from zope import component
+from zope import interface
+
+from persistent import Persistent
+
+from nti.links.fingerprint import links_fingerprint
+
+from nti.links.interfaces import ILinkTargetVersion
+
+from nti.links.links import Link
+from nti.links.links import LinkCollection
+from nti.links.links import LinkExternalHrefOnly
+
+from nti.links.tests import LinksTestCase
+
+
+class _Jar(object):
+
+    def __init__(self):
+        self.loads = 0
+
+    def setstate(self, unused_obj):
+        self.loads += 1
+
+
+class _Persistent(Persistent):
+    pass
+
+
+class _Target(object):
+    pass
+
+
+@interface.implementer(ILinkTargetVersion)
+class _Versioned(object):
+
+    def __init__(self, version):
+        self.version = version
+
+
+class _Version(object):
+
+    def __init__(self, context):
+        self.version = context.name
+
+
+class TestFingerprint(LinksTestCase):
+
+    def _link(self, **kwargs):
+        kwargs.setdefault('rel', 'edit')
+        return Link(kwargs.pop('target', '/dataserver2/users/ichigo'), **kwargs)
+
+    def test_fields(self):
+        fingerprint = links_fingerprint([self._link()])
+        assert_that(fingerprint, has_length(40))
+        assert_that(links_fingerprint([self._link()]), is_(fingerprint))
+        assert_that(links_fingerprint(LinkCollection([self._link()])), is_(fingerprint))
+
+        fingerprints = set([fingerprint, links_fingerprint([])])
+        for kwargs in ({'rel': 'delete'},
+                       {'target': '/dataserver2/users/aizen'},
+                       {'elements': ('@@edit',)},
+                       {'params': {'v': '1'}},
+                       {'method': 'PUT'},
+                       {'title': u'Edit'},
+                       {'target_mime_type': 'application/json'},
+                       {'ignore_properties_of_target': True},
+                       {'href_only': True}):
+            fingerprints.add(links_fingerprint([self._link(**kwargs)]))
+        fingerprints.add(links_fingerprint([LinkExternalHrefOnly('/dataserver2/users/ichigo',
+                                                                 rel='edit')]))
+        assert_that(fingerprints, has_length(11))
+        # Only href_only and the marker interface are the same
+        assert_that(links_fingerprint([self._link(href_only=True)]),
+                    is_(links_fingerprint([LinkExternalHrefOnly('/dataserver2/users/ichigo',
+                                                                rel='edit')])))
+
+        link = self._link()
+        link.params = {'v': '1'}
+        assert_that(links_fingerprint([link]),
+                    is_(links_fingerprint([self._link(params={'v': '1'})])))
+
+    def test_order(self):
+        first, second = self._link(), self._link(rel='delete')
+        assert_that(links_fingerprint([first, second]),
+                    is_not(links_fingerprint([second, first])))
+
+    def test_rendered(self):
+        rendered = {'Class': 'Link', 'href': '/dataserver2', 'rel': 'edit'}
+        fingerprint = links_fingerprint([rendered, 'href'])
+        assert_that(fingerprint, is_(links_fingerprint([dict(rendered), 'href'])))
+        assert_that(fingerprint, is_not(links_fingerprint([rendered, 'other'])))
+        assert_that(links_fingerprint([object()]), is_(none()))
+
+    def test_persistent(self):
+        jar = _Jar()
+        target = _Persistent()
+        target._p_oid = b'\x00' * 7 + b'\x12'
+        target._p_jar = jar
+        target._p_serial = b'\x00' * 7 + b'\x01'
+        target._p_changed = False
+        fingerprint = links_fingerprint([self._link(target=target)])
+        assert_that(jar.loads, is_(0))
+
+        target._p_deactivate()
+        assert_that(links_fingerprint([self._link(target=target)]), is_(fingerprint))
+        assert_that(jar.loads, is_(1))
+
+        target._p_serial = b'\x00' * 7 + b'\x02'
+        assert_that(links_fingerprint([self._link(target=target)]), is_not(fingerprint))
+
+    def test_unidentified_targets(self):
+        assert_that(links_fingerprint([self._link(target=_Target())]), is_(none()))
+        link = self._link()
+        link.creator = _Target()
+        assert_that(links_fingerprint([link]), is_(none()))
+        link.creator = 'ichigo'
+        assert_that(links_fingerprint([link]), is_not(none()))
+        assert_that(links_fingerprint([link]), is_not(links_fingerprint([self._link()])))
+
+    def test_versions(self):
+        first = links_fingerprint([self._link(target=_Versioned(1))])
+        assert_that(first, is_not(none()))
+        assert_that(links_fingerprint([self._link(target=_Versioned(1))]), is_(first))
+        assert_that(links_fingerprint([self._link(target=_Versioned(2))]), is_not(first))
+
+        target = _Target()
+        target.name = u'ichigo'
+        gsm = component.getGlobalSiteManager()
+        gsm.registerAdapter(_Version, (_Target,), ILinkTargetVersion)
+        try:
+            fingerprint = links_fingerprint([self._link(target=target)])
+            assert_that(fingerprint, is_not(none()))
+            target.name = u'aizen'
+            assert_that(links_fingerprint([self._link(target=target)]), is_not(fingerprint))
+        finally:
+            gsm.unregisterAdapter(_Version, (_Target,), ILinkTargetVersion)
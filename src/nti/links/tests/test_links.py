@@ -11,9 +11,11 @@ from hamcrest import is_
 from hamcrest import none
 from hamcrest import is_not
 from hamcrest import equal_to
+from hamcrest import has_length
 from hamcrest import not_none
 from hamcrest import assert_that
 from hamcrest import starts_with
+from hamcrest import same_instance
 from hamcrest import greater_than
 does_not = is_not
 
@@ -25,9 +27,14 @@ from nti.testing.matchers import verifiably_provides
 import unittest
 
 from nti.links.interfaces import ILink
+from nti.links.interfaces import ILinked
 from nti.links.interfaces import ILinkExternalHrefOnly
 
 from nti.links.links import Link
+from nti.links.links import LinkParams
+from nti.links.links import CompactLink
+from nti.links.links import LinkCollection
+from nti.links.links import LinkTemplate
 from nti.links.links import LinkExternalHrefOnly
 
 
@@ -64,6 +71,94 @@ class TestLinks(unittest.TestCase):
         for func in (self.factory.__gt__, self.factory.__lt__):
             assert_that(func(link, obj), is_(NotImplemented))
         
+    def test_hash(self):
+        target = object()
+        links = [self.factory(object(), rel='edit') for _ in range(100)]
+        assert_that(set(hash(link) for link in links), has_length(100))
+        assert_that(hash(self.factory(target, rel='edit')),
+                    is_(hash(Link(target, rel='edit'))))
+        assert_that(hash(self.factory('/a', elements=('b',))),
+                    is_(hash(CompactLink('/a', elements=['b']))))
+        assert_that(hash(self.factory('/a', elements=[['b']])), is_(not_none()))
+
+        class Valued(object):
+            def __eq__(self, other):
+                return True
+            __hash__ = None
+        assert_that(hash(self.factory(Valued())), is_(hash(self.factory(Valued()))))
+        assert_that(self.factory(Valued()), is_(equal_to(self.factory(Valued()))))
+
+        class Named(object):
+            def __init__(self, name):
+                self.name = name
+
+            def __eq__(self, other):
+                return self.name == other.name
+
+            def __hash__(self):
+                return hash(self.name)
+        named = [self.factory(Named(i)) for i in range(100)]
+        assert_that(set(hash(link) for link in named), has_length(100))
+        assert_that(hash(self.factory(Named(1))), is_(hash(named[1])))
+        assert_that(self.factory(Named(1)), is_(equal_to(named[1])))
+
+    def test_eq_does_not_compare_targets_with_different_hashes(self):
+        class Target(object):
+            def __eq__(self, other):
+                raise AssertionError("Compared")  # pragma: no cover
+            __hash__ = object.__hash__
+        assert_that(self.factory('/a', rel='edit'), is_not(equal_to(self.factory(Target()))))
+        assert_that(self.factory('/a', rel='edit'), is_not(equal_to(self.factory('/b'))))
+
+    def test_identity_key(self):
+        target = object()
+        link = self.factory(target, rel='edit', elements=['@@edit'], method='PUT',
+                            params={'v': '1'})
+        href_only = ILinkExternalHrefOnly.implementedBy(self.factory)
+        assert_that(link.identity_key,
+                    is_(('edit', id(target), ('@@edit',), LinkParams(v='1'), 'PUT',
+                         None, None, False, href_only, None)))
+        assert_that(link == link, is_(True))
+        assert_that(self.factory('/a').identity_key,
+                    is_(('alternate', '/a', (), None, None, None, None, False, href_only, None)))
+        assert_that(self.factory('/a', href_only=True).identity_key[8], is_(True))
+        assert_that(self.factory('/a', title=u'A').identity_key,
+                    is_not(self.factory('/a').identity_key))
+
+        # Changing a link changes its key, hash and equality
+        link = self.factory('/a', rel='edit')
+        key = link.identity_key
+        assert_that({link}, has_length(1))
+        link.rel = 'self'
+        assert_that(link.identity_key, is_not(key))
+        assert_that(link, is_(equal_to(self.factory('/a', rel='self'))))
+        assert_that(hash(link), is_(hash(self.factory('/a', rel='self'))))
+
+        class Persistent(object):
+            _p_oid = b'\x00\x01'
+            _p_jar = None
+        assert_that(self.factory(Persistent()).identity_key[1],
+                    is_((b'\x00\x01', id(None))))
+
+        link = self.factory('/a')
+        link.params = {'q': '1'}
+        assert_that(link.identity_key[3], is_((('q', '1'),)))
+        link = self.factory('/b')
+        link.params = [('q', '1')]
+        assert_that(link.identity_key[3], is_((('q', '1'),)))
+
+    def test_params_immutable(self):
+        params = {'app': '42'}
+        link = self.factory('/a', params=params)
+        assert_that(link.params, is_(LinkParams))
+        assert_that(link.params, is_(equal_to(params)))
+        params['app'] = '43'
+        assert_that(link.params['app'], is_('42'))
+        with self.assertRaises(TypeError):
+            link.params['app'] = '43'  # pylint: disable=unsupported-assignment-operation
+        assert_that(self.factory('/b', params=link.params).params,
+                    is_(same_instance(link.params)))
+
     def test_pickle(self):
         href = "https://www.google.com"
         link = self.factory(href, rel='google', method='GET')
@@ -79,3 +174,161 @@ class TestLinkExternalHrefOnly(TestLinks):
     def test_href_only_iface(self):
         link = self.factory('https://www.google.com', rel='google', method='GET')
         assert_that(link, verifiably_provides(ILinkExternalHrefOnly))
+        assert_that(link.href_only, is_(True))
+
+
+class TestCompactLink(TestLinks):
+
+    factory = CompactLink
+
+    def test_no_dict(self):
+        link = self.factory('https://www.google.com', rel='google')
+        assert_that(hasattr(link, '__dict__'), is_(False))
+        with self.assertRaises(AttributeError):
+            link.creator = 'alphabet'
+
+    def test_defaults_match_link(self):
+        compact = self.factory('https://www.google.com')
+        link = Link('https://www.google.com')
+        for name in ('rel', 'target', 'elements', 'target_mime_type', 'method',
+                     'title', 'params', 'ignore_properties_of_target', 'mime_type',
+                     'href_only', 'template'):
+            assert_that(getattr(compact, name), is_(getattr(link, name)), name)
+        assert_that(compact, is_(equal_to(link)))
+        assert_that(hash(compact), is_(hash(link)))
+
+    def test_shared_strings_and_elements(self):
+        rel = ''.join(['ed', 'it'])
+        method = ''.join(['PU', 'T'])
+        link1 = self.factory('/a', rel=rel, method=method, elements=('@@edit',))
+        link2 = self.factory('/b', rel='edit', method='PUT', elements=tuple(['@@edit']))
+        assert_that(link1.rel, is_(same_instance(link2.rel)))
+        assert_that(link1.method, is_(same_instance(link2.method)))
+        assert_that(link1.elements, is_(same_instance(link2.elements)))
+        elements = ['@@edit']
+        assert_that(self.factory('/c', elements=elements).elements,
+                    is_(same_instance(elements)))
+
+
+class TestLinkParams(unittest.TestCase):
+
+    def test_mapping(self):
+        params = LinkParams([('b', '2'), ('a', '1')])
+        assert_that(list(params), is_(['b', 'a']))
+        assert_that(params, has_length(2))
+        assert_that(params, is_(equal_to({'a': '1', 'b': '2'})))
+        assert_that(hash(params), is_(hash(LinkParams(a='1', b='2'))))
+        assert_that(repr(params), is_("LinkParams([('b', '2'), ('a', '1')])"))
+        assert_that(LinkParams(a='1'), is_(equal_to({'a': '1'})))
+        assert_that(LinkParams(), has_length(0))
+
+    def test_repeated_names(self):
+        params = LinkParams([('a', 1), ('a', 2)])
+        assert_that(params.query_string, is_('a=1&a=2'))
+        assert_that(params.pairs, is_((('a', 1), ('a', 2))))
+        assert_that(params, has_length(1))
+        assert_that(params['a'], is_(2))
+        assert_that(params, is_(equal_to({'a': 2})))
+        assert_that(params, is_not(equal_to(LinkParams(a=2))))
+        assert_that(LinkParams(a=2), is_not(equal_to(params)))
+        assert_that(params != LinkParams(a=2), is_(True))
+        assert_that(params, is_(equal_to(LinkParams([('a', 1), ('a', 2)]))))
+        assert_that(repr(params), is_("LinkParams([('a', 1), ('a', 2)])"))
+
+    def test_query_string(self):
+        params = LinkParams([('q', 'ichigo kurosaki'), ('n', 10)])
+        assert_that(params.query_string, is_('q=ichigo+kurosaki&n=10'))
+        assert_that(params.query_string, is_(same_instance(params.query_string)))
+
+
+class TestLinkTemplate(unittest.TestCase):
+
+    def test_links(self):
+        template = LinkTemplate(rel='edit', elements=['@@edit'], method='PUT',
+                                params={'v': '1'}, title='Edit')
+        links = template.links(['/a', '/b'])
+        assert_that(links, is_([Link('/a', rel='edit', elements=('@@edit',)),
+                                Link('/b', rel='edit', elements=('@@edit',))]))
+        for link in links:
+            assert_that(link, is_(Link))
+            assert_that(link.template, is_(same_instance(template)))
+            assert_that(link.method, is_('PUT'))
+            assert_that(link.title, is_('Edit'))
+            assert_that(link.params, is_(same_instance(template.params)))
+            assert_that(link.elements, is_(same_instance(template.elements)))
+        assert_that(repr(template), is_("<LinkTemplate rel='edit' elements=('@@edit',)>"))
+
+    def test_factory(self):
+        link = LinkTemplate(factory=CompactLink, href_only=True).link('/a')
+        assert_that(link, is_(CompactLink))
+        assert_that(link.href_only, is_(True))
+
+    def test_href(self):
+        template = LinkTemplate(elements=('a', 'b'), params={'q': 'x y'})
+        assert_that(template.href('/root'), is_('/root/a/b?q=x+y'))
+        assert_that(template.href('/root/'), is_('/root/a/b?q=x+y'))
+        assert_that(LinkTemplate().href('/root/'), is_('/root/'))
+
+
+class TestLinkCollection(unittest.TestCase):
+
+    def test_lookup(self):
+        edit = Link('/a', rel='edit')
+        first, second = Link('/a', rel='alternate'), Link('/b', rel='alternate')
+        links = LinkCollection([first, edit, second])
+        assert_that(links, verifiably_provides(ILinked))
+        assert_that(list(links), is_([first, edit, second]))
+        assert_that(links.links, is_([first, edit, second]))
+        assert_that(links.get('edit'), is_(same_instance(edit)))
+        assert_that(links.get('alternate'), is_(same_instance(first)))
+        assert_that(links.get_all('alternate'), is_([first, second]))
+        assert_that(links.get('delete'), is_(none()))
+        assert_that(links.get_all('delete'), is_([]))
+        assert_that('edit' in links, is_(True))
+        assert_that(links, has_length(3))
+        assert_that(links.rels(), is_(['alternate', 'edit']))
+        assert_that(repr(links), is_("<LinkCollection ['alternate', 'edit']>"))
+
+    def test_replace_remove(self):
+        edit = Link('/a', rel='edit')
+        links = LinkCollection([Link('/a'), edit, Link('/b')])
+        replacement = Link('/c')
+        links.replace(replacement)
+        assert_that(list(links), is_([replacement, edit]))
+        links.remove('alternate')
+        assert_that(list(links), is_([edit]))
+        with self.assertRaises(KeyError):
+            links.remove('alternate')
+        delete = Link('/a', rel='delete')
+        links.replace(delete)
+        assert_that(list(links), is_([edit, delete]))
+        assert_that(bool(LinkCollection()), is_(False))
+
+    def test_factories(self):
+        calls = []
+
+        def factory(link):
+            def make():
+                calls.append(link)
+                return link
+            return make
+        edit = Link('/a', rel='edit')
+        links = LinkCollection()
+        links.append_factory('edit', factory(edit))
+        links.append_factory('delete', factory(Link('/a', rel='delete')))
+        links.append_factory('report', factory(None))
+        links.append_factory('flag', factory(Link('/a', rel='flag')))
+        links.replace_factory('flag', factory(None))
+        links.remove('delete')
+        assert_that(calls, is_([]))
+        assert_that(links, has_length(3))
+
+        assert_that(links.get('edit'), is_(same_instance(edit)))
+        assert_that(links.get('edit'), is_(same_instance(edit)))
+        assert_that(calls, is_([edit]))
+
+        assert_that(links.get('report'), is_(none()))
+        assert_that('report' in links, is_(False))
+        assert_that(list(links), is_([edit]))
+        assert_that(links.get_all('flag'), is_([]))
+        assert_that(calls, is_([edit, None, None]))
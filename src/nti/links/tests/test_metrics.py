@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_key
+from hamcrest import has_entry
+from hamcrest import assert_that
+from hamcrest import has_entries
+from hamcrest import same_instance
+
+import unittest
+
+import fudge
+
+from nti.testing.matchers import verifiably_provides
+
+from nti.links.externalization import render_link
+from nti.links.externalization import render_links
+from nti.links.externalization import enable_rendered_link_cache
+from nti.links.externalization import disable_rendered_link_cache
+
+from nti.links.externalization import LinkExternalObjectDecorator
+
+from nti.links.interfaces import ILinkMetricsSink
+
+from nti.links.links import Link
+
+from nti.links.metrics import Histogram
+from nti.links.metrics import RateLimitedLog
+from nti.links.metrics import MetricsRegistry
+from nti.links.metrics import StatsdMetricsSink
+from nti.links.metrics import enable_metrics
+from nti.links.metrics import disable_metrics
+from nti.links.metrics import get_metrics_sink
+
+from nti.links.tests import LinksTestCase
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_add(self):
+        histogram = Histogram((1, 10))
+        for value in (0, 1, 5, 100):
+            histogram.add(value)
+        assert_that(histogram.snapshot(),
+                    is_({'count': 4, 'sum': 106, 'min': 0, 'max': 100,
+                         'buckets': [(1, 2), (10, 1), ('inf', 1)]}))
+
+
+class TestSinks(unittest.TestCase):
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        assert_that(registry, verifiably_provides(ILinkMetricsSink))
+        registry.incr('a')
+        registry.incr('a', 2)
+        registry.timing('t', 0.001)
+        registry.observe('o', 3)
+        snapshot = registry.snapshot()
+        assert_that(snapshot['counters'], is_({'a': 3}))
+        assert_that(snapshot['histograms'], has_key('t'))
+        assert_that(snapshot['histograms']['o'], has_entries('count', 1, 'sum', 3))
+        registry.reset()
+        assert_that(registry.snapshot(), is_({'counters': {}, 'histograms': {}}))
+
+    @fudge.test
+    def test_statsd(self):
+        client = fudge.Fake('client')
+        client.expects('incr').with_args('nti.links.a', 1)
+        client.expects('timing').with_args('nti.links.t', 1.0)
+        client.next_call().with_args('nti.links.o', 3)
+        sink = StatsdMetricsSink(client)
+        assert_that(sink, verifiably_provides(ILinkMetricsSink))
+        sink.incr('a')
+        sink.timing('t', 0.001)
+        sink.observe('o', 3)
+
+    def test_enable(self):
+        assert_that(get_metrics_sink(), is_(none()))
+        sink = enable_metrics()
+        try:
+            assert_that(get_metrics_sink(), is_(same_instance(sink)))
+        finally:
+            disable_metrics()
+        assert_that(get_metrics_sink(), is_(none()))
+
+
+class TestRenderMetrics(LinksTestCase):
+
+    def setUp(self):
+        self.sink = enable_metrics()
+
+    def tearDown(self):
+        disable_metrics()
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_branches(self, mock_rp):
+        mock_rp.is_callable().returns('/dataserver2/users/ichigo')
+        render_link(Link('/dataserver2/help'))
+        render_link(Link(object()))
+        render_link(Link(object()))
+
+        counters = self.sink.snapshot()['counters']
+        assert_that(counters, is_({'render.resource_path': 1,
+                                   'render.traversal': 2}))
+        histograms = self.sink.snapshot()['histograms']
+        assert_that(histograms['render.traversal'], has_entry('count', 2))
+
+    def test_cached(self):
+        enable_rendered_link_cache()
+        try:
+            render_link(Link('/dataserver2/help'))
+            render_link(Link('/dataserver2/help'))
+        finally:
+            disable_rendered_link_cache()
+        assert_that(self.sink.counters, is_({'render.resource_path': 1,
+                                             'render.cached': 1}))
+
+    @fudge.patch('nti.links.externalization.normal_resource_path')
+    def test_errors(self, mock_rp):
+        mock_rp.is_callable().raises(TypeError())
+        with self.assertRaises(TypeError):
+            render_link(Link(object()))
+        render_links([Link(object())])
+        links = {'Links': [Link(object()), Link('/dataserver2/help')]}
+        LinkExternalObjectDecorator().decorateExternalObject(None, links)
+        LinkExternalObjectDecorator().decorateExternalObject(None, [Link('/a'), 'b'])
+        LinkExternalObjectDecorator().decorateExternalObject(None, ['b'])
+
+        snapshot = self.sink.snapshot()
+        assert_that(snapshot['counters'],
+                    has_entries('render.errors.TypeError', 3,
+                                'decorator.swallowed_errors', 1))
+        assert_that(snapshot['histograms']['decorator.links_per_object'],
+                    has_entries('count', 2, 'sum', 2))
+
+
+class _Logger(object):
+
+    def __init__(self):
+        self.records = []
+
+    def log(self, level, msg, *args):
+        self.records.append((level, msg % args))
+
+
+class _Clock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimitedLog(unittest.TestCase):
+
+    def test_rate_limited(self):
+        log, clock = _Logger(), _Clock()
+        limited = RateLimitedLog(log, interval=60, maxkeys=2, clock=clock)
+        assert_that(limited(40, 'a', 'Failed %s', 1), is_(True))
+        for i in range(3):
+            assert_that(limited(40, 'a', 'Failed %s', i), is_(False))
+        assert_that(limited(30, 'b', 'Warning'), is_(True))
+        assert_that(limited.suppressed(), is_({'a': 3}))
+        assert_that(log.records, is_([(40, 'Failed 1'), (30, 'Warning')]))
+
+        clock.now = 60
+        assert_that(limited(40, 'a', 'Failed %s', 4), is_(True))
+        assert_that(log.records[-1],
+                    is_((40, "Failed 4 (and 3 more for 'a' in the last 60 seconds)")))
+        assert_that(limited.suppressed(), is_({}))
+
+        # Only two keys are kept; 'b' was logged least recently
+        limited(40, 'c', 'Other')
+        assert_that(limited(30, 'b', 'Warning'), is_(True))
+        assert_that(limited(40, 'a', 'Failed'), is_(True))
+
+    def test_flush(self):
+        log = _Logger()
+        limited = RateLimitedLog(log, clock=_Clock())
+        limited(40, 'a', 'Failed')
+        limited(40, 'a', 'Failed')
+        limited(40, 'b', 'Other')
+        limited.flush()
+        assert_that(log.records[-1], is_((40, "1 more link rendering messages for 'a'")))
+        assert_that(len(log.records), is_(3))
+        assert_that(limited(40, 'a', 'Failed'), is_(True))
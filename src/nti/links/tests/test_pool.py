@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import has_item
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+import threading
+import unittest
+
+import fudge
+
+from zope import component
+
+from zope.component.hooks import site
+from zope.component.hooks import getSite
+
+from zope.location.interfaces import LocationError
+
+from nti.links.caching import link_rendering_cache
+from nti.links.caching import current_link_rendering_cache
+
+from nti.links.externalization import render_links
+from nti.links.externalization import iter_rendered_links
+from nti.links.externalization import ghost_safe_link_rendering
+from nti.links.externalization import concurrent_link_rendering
+from nti.links.externalization import set_link_error_log
+
+from nti.links.externalization import LinkRenderingFailure
+from nti.links.externalization import LinkExternalObjectDecorator
+
+from nti.links.links import Link
+
+from nti.links.pool import THREAD
+from nti.links.pool import GEVENT
+from nti.links.pool import LinkRenderingPool
+
+from nti.links.tests import LinksTestCase
+
+
+class Site(object):
+
+    def getSiteManager(self):
+        return component.getGlobalSiteManager()
+
+
+class Target(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TestLinkRenderingPool(unittest.TestCase):
+
+    def test_kinds(self):
+        assert_that(LinkRenderingPool().kind, is_(THREAD))
+        with fudge.patched_context('nti.links.pool', '_gevent_threading_patched',
+                                   lambda: True):
+            assert_that(LinkRenderingPool().kind, is_(GEVENT))
+        with self.assertRaises(ValueError):
+            LinkRenderingPool(kind='fork')
+        assert_that(repr(LinkRenderingPool(size=2)),
+                    is_('<LinkRenderingPool kind=thread size=2 chunksize=64 threshold=128>'))
+
+    def test_map(self):
+        for kind in (THREAD, GEVENT):
+            with LinkRenderingPool(size=3, kind=kind) as pool:
+                assert_that(pool.map(lambda x: x * 2, range(10)),
+                            is_([x * 2 for x in range(10)]))
+            # Closing again, or before use, is harmless
+            pool.close()
+
+    def test_threads(self):
+        with LinkRenderingPool(size=2) as pool:
+            names = pool.map(lambda unused: threading.current_thread().name, range(4))
+        assert_that(names, is_not(has_item(threading.current_thread().name)))
+
+
+class TestPooledRendering(LinksTestCase):
+
+    def setUp(self):
+        self.pool = LinkRenderingPool(size=3, chunksize=2, threshold=3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _resource_path(self, target):
+        if target.name == 'broken':
+            raise LocationError(target)
+        if target.name == 'bad':
+            raise ValueError(target)
+        self.seen.append((threading.current_thread().name,
+                          getSite(),
+                          current_link_rendering_cache()))
+        return '/dataserver2/' + target.name
+
+    def _patched(self):
+        self.seen = []
+        return fudge.patched_context('nti.links.externalization',
+                                     'normal_resource_path',
+                                     self._resource_path)
+
+    def test_render_links(self):
+        links = [Link(Target('t%d' % i)) for i in range(7)]
+        links[2] = Link(Target('bad'))
+        links.insert(4, 'not a link')
+        the_site = Site()
+        with self._patched(), site(the_site), link_rendering_cache() as cache:
+            rendered = render_links(links, pool=self.pool)
+            # The cache isn't cleared by the workers
+            assert_that(cache, has_length(6))
+        assert_that(rendered, has_length(8))
+        assert_that(rendered[2], instance_of(LinkRenderingFailure))
+        assert_that(rendered[2].error, instance_of(ValueError))
+        assert_that(rendered[4], is_('not a link'))
+        assert_that([x['href'] for i, x in enumerate(rendered) if i not in (2, 4)],
+                    is_(['/dataserver2/t%d' % i for i in (0, 1, 3, 4, 5, 6)]))
+        for thread_name, current, shared in self.seen:
+            assert_that(thread_name, is_not(threading.current_thread().name))
+            assert_that(current, is_(same_instance(the_site)))
+            assert_that(shared, is_(same_instance(cache)))
+
+    def test_below_threshold(self):
+        with self._patched():
+            rendered = render_links([Link(Target('t0')), Link(Target('t1'))], pool=self.pool)
+        assert_that(rendered, has_length(2))
+        assert_that(self.seen[0][0], is_(threading.current_thread().name))
+
+    def test_iter_rendered_links(self):
+        links = [Link(Target('t0')), Link(Target('broken')), Link(Target('t1'))]
+        with self._patched():
+            rendered = list(iter_rendered_links(links, pool=self.pool))
+        assert_that([x['href'] for x in rendered],
+                    is_(['/dataserver2/t0', '/dataserver2/t1']))
+
+    def test_persistent_targets(self):
+        class PersistentTarget(Target):
+            _p_jar = object()
+        links = [Link(Target('t0')), Link(PersistentTarget('t1')), Link(Target('t2'))]
+        warnings = []
+        old_log = set_link_error_log(lambda *args: warnings.append(args))
+        try:
+            with self._patched():
+                rendered = render_links(links, pool=self.pool)
+            assert_that([x['href'] for x in rendered],
+                        is_(['/dataserver2/t0', '/dataserver2/t1', '/dataserver2/t2']))
+            # In the calling thread
+            assert_that(set(x[0] for x in self.seen),
+                        is_({threading.current_thread().name}))
+            assert_that(warnings, has_length(1))
+
+            # Targets that aren't activated, and greenlets, are fine
+            with self._patched(), ghost_safe_link_rendering():
+                render_links(links, pool=self.pool)
+            assert_that([x[0] for x in self.seen],
+                        is_not(has_item(threading.current_thread().name)))
+            with self._patched(), \
+                 LinkRenderingPool(kind=GEVENT, chunksize=2, threshold=3) as pool:
+                render_links(links, pool=pool)
+            assert_that(self.seen, has_length(3))
+            assert_that(warnings, has_length(1))
+        finally:
+            set_link_error_log(old_log)
+
+    def test_ghost_safe_mode_propagates(self):
+        seen = []
+        with fudge.patched_context('nti.links.externalization', '_render_iter',
+                                   lambda links, state: seen.append(state.activate_targets) or ()):
+            with ghost_safe_link_rendering():
+                render_links([Link('/a')] * 4, pool=self.pool)
+        assert_that(seen, is_([False, False]))
+
+    def test_decorator(self):
+        decorator = LinkExternalObjectDecorator()
+        with self._patched(), concurrent_link_rendering(self.pool) as pool:
+            assert_that(pool, is_(same_instance(self.pool)))
+            mapping = {'Links': [Link(Target('t0')), Link(Target('broken')),
+                                 Link(Target('t1')), Link(Target('t2'))]}
+            decorator.decorateExternalObject(None, mapping)
+            assert_that([x['href'] for x in mapping['Links']],
+                        is_(['/dataserver2/t0', '/dataserver2/t1', '/dataserver2/t2']))
+
+            sequence = [Link(Target('t0')), Link(Target('t1')), Link(Target('broken'))]
+            with self.assertRaises(LocationError):
+                decorator.decorateExternalObject(None, sequence)
+        assert_that(self.seen[0][0], is_not(threading.current_thread().name))
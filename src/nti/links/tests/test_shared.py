@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_entries
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import fudge
+
+from nti.links.externalization import render_link
+from nti.links.externalization import rendered_link_cache
+from nti.links.externalization import enable_rendered_link_cache
+from nti.links.externalization import disable_rendered_link_cache
+from nti.links.externalization import shared_rendered_link_cache
+from nti.links.externalization import enable_shared_rendered_link_cache
+from nti.links.externalization import disable_shared_rendered_link_cache
+
+from nti.links.links import Link
+from nti.links.links import LinkExternalHrefOnly
+
+from nti.links.shared import _SLOT
+from nti.links.shared import _SEQUENCE
+from nti.links.shared import key_digest
+from nti.links.shared import encode_record
+from nti.links.shared import decode_record
+from nti.links.shared import SharedLinkCache
+
+from nti.links.tests import LinksTestCase
+
+RECORD = (('Class', 'Link'), ('href', '/dataserver2/help'), ('rel', 'help'))
+
+
+def _help_link(i):
+    return Link('/dataserver2/help/%d' % i, rel='help', title=u'Help \xf1')
+
+
+def _render_in_child(args):
+    # Run in another process, which may not be configured; rendering
+    # hrefs needs no components.
+    path, start, stop = args
+    enable_shared_rendered_link_cache(path, slots=64)
+    try:
+        for i in range(start, stop):
+            render_link(LinkExternalHrefOnly('/dataserver2/help/%d' % i))
+        return shared_rendered_link_cache().misses
+    finally:
+        disable_shared_rendered_link_cache()
+
+
+def _write_in_child(args):
+    path, writer, count = args
+    with SharedLinkCache(path, slots=4) as cache:
+        for i in range(count):
+            key = ('key', i % 8)
+            cache.set(key, '%d/%s' % (writer, 'x' * (i % 8)))
+    return count
+
+
+def _read_in_child(args):
+    path, count = args
+    hits = 0
+    with SharedLinkCache(path, slots=4) as cache:
+        for i in range(count):
+            record = cache.get(('key', i % 8))
+            if record is not None:
+                # Never a torn or mismatched record
+                assert record.split('/')[1] == 'x' * (i % 8), record
+                hits += 1
+    return hits
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_round_trip(self):
+        for record in (u'/dataserver2/help', u'', RECORD, (), (('title', u'\xf1'),),
+                       (('title', u''), ('rel', u'help'))):
+            assert_that(decode_record(encode_record(record)), is_(record))
+        assert_that(encode_record(RECORD),
+                    is_(b'mClass\x00Link\x00href\x00/dataserver2/help\x00rel\x00help'))
+        assert_that(encode_record(u'/a/\xf1'), is_(b'h/a/\xc3\xb1'))
+        for bad in (((u'count', 3),), ((u'title', u'a\x00b'),), ((u'title', None),)):
+            with self.assertRaises(TypeError):
+                encode_record(bad)
+
+    def test_key_digest(self):
+        key = ('help', '/dataserver2/help', ('index.html',), (('lang', 'en'),), None, 1.5, True)
+        assert_that(key_digest(key), is_(key_digest(key)))
+        assert_that(len(key_digest(key)), is_(16))
+        assert_that(key_digest(('a', ('b',))), is_not(key_digest(('a', 'b'))))
+        assert_that(key_digest(('a', ('b',))), is_not(key_digest(('a', ['b']))))
+        # Equal keys, whatever their identity
+        assert_that(key_digest(('ab', 'ab')), is_(key_digest((''.join('ab'), 'ab'))))
+        with self.assertRaises(TypeError):
+            key_digest(('a', object()))
+
+
+class TestSharedLinkCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'links.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        with SharedLinkCache(self.path, slots=16) as cache:
+            assert_that(cache.get(('a',)), is_(none()))
+            assert_that(cache.get(('a',), 42), is_(42))
+            cache.set(('a',), RECORD)
+            cache.set(('b',), u'/dataserver2/b')
+            assert_that(cache.get(('a',)), is_(RECORD))
+            assert_that(cache.get(('b',)), is_(u'/dataserver2/b'))
+            assert_that(repr(cache),
+                        is_('<SharedLinkCache %r slots=16 hits=2 misses=2>' % self.path))
+
+            # Not cached
+            cache.set(('big',), u'x' * 512)
+            cache.set((object(),), u'x')
+            cache.set(('unencodable',), ((u'target', object()),))
+            assert_that(cache.get(('big',)), is_(none()))
+            assert_that(cache.get((object(),)), is_(none()))
+            assert_that(cache.get(('unencodable',)), is_(none()))
+        # Closing again is harmless
+        cache.close()
+
+    def test_shared_by_instances(self):
+        with SharedLinkCache(self.path, slots=16) as first:
+            with SharedLinkCache(self.path, slots=16) as second:
+                first.set(('a',), RECORD)
+                assert_that(second.get(('a',)), is_(RECORD))
+                second.invalidate()
+                assert_that(first.generation, is_(1))
+                assert_that(first.get(('a',)), is_(none()))
+                first.set(('a',), u'/a')
+                assert_that(second.get(('a',)), is_(u'/a'))
+
+    def test_bounded(self):
+        with SharedLinkCache(self.path, slots=2, slot_size=64) as cache:
+            for i in range(10):
+                cache.set(('key', i), u'/%d' % i)
+            hits = [i for i in range(10) if cache.get(('key', i)) is not None]
+            assert_that(len(hits) <= 2, is_(True))
+        assert_that(os.path.getsize(self.path), is_(64 + 2 * 64))
+
+    def test_writing_slot_is_missing(self):
+        with SharedLinkCache(self.path, slots=1) as cache:
+            cache.set(('a',), u'/a')
+            offset = cache._offset(key_digest(('a',)))
+            sequence = _SEQUENCE.unpack_from(cache._map, offset)[0]
+            assert_that(sequence, is_(2))
+            # A writer is in the middle of it (or died there)
+            _SEQUENCE.pack_into(cache._map, offset, sequence + 1)
+            assert_that(cache.get(('a',)), is_(none()))
+            cache.set(('a',), u'/b')
+            assert_that(_SEQUENCE.unpack_from(cache._map, offset)[0], is_(6))
+            assert_that(cache.get(('a',)), is_(u'/b'))
+
+            # Changed while being read
+            class Changed(object):
+                size = _SLOT.size
+
+                @staticmethod
+                def unpack_from(data, offset):
+                    result = _SLOT.unpack_from(data, offset)
+                    _SEQUENCE.pack_into(data, offset, result[0] + 2)
+                    return result
+            with fudge.patched_context('nti.links.shared', '_SLOT', Changed):
+                assert_that(cache.get(('a',)), is_(none()))
+            assert_that(cache.get(('a',)), is_(u'/b'))
+
+    def test_invalid_files(self):
+        with self.assertRaises(ValueError):
+            SharedLinkCache(self.path, slot_size=8)
+        SharedLinkCache(self.path, slots=16).close()
+        with self.assertRaises(ValueError):
+            SharedLinkCache(self.path, slots=32)
+        for contents in (b'short', b'x' * 4096):
+            with open(self.path, 'wb') as f:
+                f.write(contents)
+            with self.assertRaises(ValueError):
+                SharedLinkCache(self.path)
+
+    def test_processes(self):
+        pool = multiprocessing.Pool(3)
+        try:
+            # The second and third overlap with the first
+            misses = pool.map(_render_in_child, [(self.path, 0, 10)])
+            assert_that(misses, is_([10]))
+            misses = pool.map(_render_in_child, [(self.path, 5, 15), (self.path, 5, 15)])
+            assert_that(sum(misses) >= 5, is_(True))
+            assert_that(sum(misses) <= 10, is_(True))
+
+            # Concurrent writers and a reader
+            path = os.path.join(self.tmpdir, 'contended.cache')
+            SharedLinkCache(path, slots=4).close()
+            writers = [pool.apply_async(_write_in_child, [(path, i, 2000)])
+                       for i in range(2)]
+            reader = pool.apply_async(_read_in_child, [(path, 2000)])
+            assert_that([writer.get(30) for writer in writers], is_([2000, 2000]))
+            reader.get(30)
+        finally:
+            pool.close()
+            pool.join()
+
+
+class TestSharedRendering(LinksTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'links.cache')
+        self.cache = enable_shared_rendered_link_cache(self.path, slots=64)
+
+    def tearDown(self):
+        disable_shared_rendered_link_cache()
+        disable_rendered_link_cache()
+        shutil.rmtree(self.tmpdir)
+
+    def test_rendered(self):
+        assert_that(shared_rendered_link_cache(), is_(same_instance(self.cache)))
+        link = _help_link(0)
+        first = render_link(link)
+        second = render_link(link)
+        assert_that(self.cache.misses, is_(1))
+        assert_that(self.cache.hits, is_(1))
+        assert_that(second, is_(first))
+        assert_that(list(second), is_(list(first)))
+        assert_that(type(second), is_(same_instance(type(first))))
+        assert_that(second, has_entries('title', u'Help \xf1'))
+
+        href_only = LinkExternalHrefOnly('/dataserver2/help/0', rel='help', title=u'Help \xf1')
+        assert_that(render_link(href_only), is_('/dataserver2/help/0'))
+        assert_that(render_link(href_only), is_('/dataserver2/help/0'))
+        assert_that(self.cache.hits, is_(2))
+
+        # Not shareable
+        for _ in range(2):
+            render_link(Link('/dataserver2/help', params={'lang': object()}))
+        assert_that(self.cache.misses, is_(2))
+        assert_that(self.cache.hits, is_(2))
+
+    def test_with_process_cache(self):
+        local = enable_rendered_link_cache(10)
+        assert_that(rendered_link_cache(), is_(same_instance(local)))
+        first = render_link(_help_link(0))
+        # Filled from the shared cache
+        local.clear()
+        assert_that(render_link(_help_link(0)), is_(first))
+        assert_that(self.cache.hits, is_(1))
+        assert_that(render_link(_help_link(0)), is_(first))
+        assert_that(local.hits, is_(1))
+        assert_that(self.cache.hits, is_(1))
+
+    def test_other_process(self):
+        pool = multiprocessing.Pool(1)
+        try:
+            assert_that(pool.map(_render_in_child, [(self.path, 0, 3)]), is_([3]))
+        finally:
+            pool.close()
+            pool.join()
+        with fudge.patched_context('nti.links.externalization', '_render_link_uncached',
+                                   None):
+            rendered = render_link(LinkExternalHrefOnly('/dataserver2/help/2'))
+        assert_that(rendered, is_('/dataserver2/help/2'))
+        assert_that(self.cache.hits, is_(1))
+
+    def test_child_functions(self):
+        # What the other processes of test_processes run
+        path = os.path.join(self.tmpdir, 'contended.cache')
+        assert_that(_write_in_child((path, 1, 8)), is_(8))
+        assert_that(_read_in_child((path, 8)), is_(4))
+        disable_shared_rendered_link_cache()
+        path = os.path.join(self.tmpdir, 'rendered.cache')
+        assert_that(_render_in_child((path, 0, 2)), is_(2))
+        assert_that(_render_in_child((path, 0, 2)), is_(0))
+
+    def test_reenable(self):
+        cache = enable_shared_rendered_link_cache(self.path, slots=64)
+        assert_that(cache, is_not(same_instance(self.cache)))
+        assert_that(self.cache._fd, is_(none()))
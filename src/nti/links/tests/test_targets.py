@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import unittest
+
+from nti.links import targets
+
+from nti.links.targets import NTIID
+from nti.links.targets import INVALID
+from nti.links.targets import OID_NTIID
+from nti.links.targets import RESOURCE_PATH
+from nti.links.targets import target_cache
+from nti.links.targets import classify_target
+
+OID = 'tag:nextthought.com,2011-10:system-OID-0x12:5573657273'
+VIDEO = 'tag:nextthought.com,2011-10:BLEACH-NTIVideo-Ichigo.vs.Aizen'
+
+
+class TestTargets(unittest.TestCase):
+
+    def setUp(self):
+        target_cache().clear()
+
+    def test_classify(self):
+        info = classify_target(OID)
+        assert_that(info.kind, is_(OID_NTIID))
+        assert_that(info.is_ntiid, is_(True))
+        assert_that(info.is_resource_path, is_(False))
+        assert_that(info.quoted,
+                    is_('tag%3Anextthought.com%2C2011-10%3Asystem-OID-0x12%3A5573657273'))
+
+        info = classify_target(VIDEO)
+        assert_that(info.kind, is_(NTIID))
+        assert_that(info.is_ntiid, is_(True))
+
+        for path in ('/dataserver2/users', 'https://www.google.com'):
+            info = classify_target(path)
+            assert_that(info.kind, is_(RESOURCE_PATH))
+            assert_that(info.is_resource_path, is_(True))
+            assert_that(info.is_ntiid, is_(False))
+            assert_that(info.quoted, is_(none()))
+
+        for invalid in ('bleach', '', object()):
+            assert_that(classify_target(invalid).kind, is_(INVALID))
+
+    def test_cache(self):
+        cache = target_cache()
+        first = classify_target(OID)
+        assert_that(classify_target(OID), is_(same_instance(first)))
+        assert_that(cache.hits, is_(1))
+        assert_that(OID in cache, is_(True))
+
+        # Non-strings are never cached
+        classify_target(object())
+        assert_that(len(cache), is_(1))
+
+    def test_bounded(self):
+        old = targets._cache
+        targets._cache = type(old)(2)
+        try:
+            for target in ('/a', '/b', '/c'):
+                classify_target(target)
+            assert_that('/a' in target_cache(), is_(False))
+            assert_that(len(target_cache()), is_(2))
+        finally:
+            targets._cache = old